@@ -0,0 +1,258 @@
+import time
+import asyncio
+import logging
+from concurrent.futures import Future
+
+# Local imports
+from downloader import Downloader, DownloadResult
+from handler import TorHandler
+from url_queue import URLQueue
+from rate_limiter import RateLimiter
+from concurrency import ConcurrencyController
+from retry import RetryScheduler
+from deadlines import PAGE
+from hedging import Hedger, hedge_identity
+from mirror_pool import MirrorPool
+from exceptions import DeadlineExceededError
+
+logger = logging.getLogger("CRATOR")
+
+# Seconds between two checks for a concurrency slot
+SLOT_POLL_INTERVAL = 0.05
+
+
+class AsyncDownloader(Downloader):
+    """
+    Downloader running all the requests on a single asyncio event loop, with aiohttp through the Tor SOCKS proxy.
+    It keeps the contract of the Downloader (enqueue, get_result, is_empty, stop), so the crawler can use both
+    engines in the same way, but a request in flight costs a coroutine instead of a thread.
+    aiohttp and aiohttp_socks are imported only when this engine is used.
+    """
+    def __init__(self, max_concurrency:int, torhandler:TorHandler, restart_tor:int, waiting_time=1.5,
+                 url_queue:URLQueue =None, rate_limiter:RateLimiter =None, concurrency:ConcurrencyController =None,
+                 retry_scheduler:RetryScheduler =None, hedger:Hedger =None, mirrors:MirrorPool =None):
+        """
+        :param max_concurrency: maximum number of requests in flight
+        :param torhandler: an istance of TorHandler
+        :param restart_tor: number of HTTP requests after which Tor is restarted
+        :param waiting_time: the average amount of time in seconds that elapses between two HTTP requests, used only
+        if rate_limiter is None
+        :param url_queue: the queue deciding the download order of the URLs. A FIFOQueue if None.
+        :param rate_limiter: the rate limiter of the HTTP requests, it can be shared among several downloaders
+        :param concurrency: the controller adapting the number of requests in flight to each host and through each
+        circuit. If None, max_concurrency requests are always in flight.
+        :param retry_scheduler: the scheduler of the delayed retries. A RetryScheduler with the default policies if
+        None.
+        :param hedger: the policy of the hedged requests. If None, the slow requests are never duplicated.
+        :param mirrors: the mirrors of the marketplace. None to always request the host of the URL.
+        """
+        try:
+            import aiohttp
+            import aiohttp_socks
+        except ImportError as e:
+            raise ImportError("The asyncio engine requires the aiohttp and aiohttp_socks packages.") from e
+
+        super().__init__(max_concurrency, torhandler, restart_tor, waiting_time, url_queue, rate_limiter, concurrency,
+                         retry_scheduler, hedger, mirrors)
+
+        # Event loop of the download thread and event signaling new URLs, both created by the loop itself
+        self.loop = None
+        self.wakeup = None
+
+    def enqueue(self, url, cookie, depth:int =0, headers:dict =None):
+        super().enqueue(url, cookie, depth, headers)
+        self.__wake_up()
+
+    def retry(self, url:str, cookie:str, reason:str, depth:int =0, headers:dict =None, delay:float =None) -> float:
+        delay = super().retry(url, cookie, reason, depth, headers, delay)
+        # The dispatcher waits until the next retry is due
+        self.__wake_up()
+        return delay
+
+    def __wake_up(self) -> None:
+        """
+        Wake up the dispatcher waiting for new URLs. It can be called from any thread.
+        """
+        loop = self.loop
+        if loop is None:
+            return
+
+        try:
+            loop.call_soon_threadsafe(self.wakeup.set)
+        except RuntimeError:
+            # The event loop has already been closed
+            pass
+
+    def download(self):
+        asyncio.run(self.__dispatch())
+
+    async def __next_url(self) -> tuple:
+        """
+        Wait for the next URL to download.
+        :return: the tuple (url, cookie, headers), None if the downloader has been stopped
+        """
+        while self.running:
+            with self.lock:
+                self.promote_retries()
+                if self.queue:
+                    self.in_flight += 1
+                    url, cookie = self.queue.pop()
+                    return url, cookie, self.request_headers.pop(url, None)
+
+            self.wakeup.clear()
+            with self.lock:
+                # A URL may have been enqueued before clearing the event
+                empty = not self.queue
+                next_retry = self.retries.next_delay()
+
+            if empty and self.running:
+                try:
+                    # Wake up when the next retry is due
+                    await asyncio.wait_for(self.wakeup.wait(), next_retry)
+                except asyncio.TimeoutError:
+                    pass
+
+        return None
+
+    async def __dispatch(self) -> None:
+        self.loop = asyncio.get_running_loop()
+        self.wakeup = asyncio.Event()
+        slots = asyncio.Semaphore(self.n_threads)
+        tasks = set()
+
+        while self.running:
+            await slots.acquire()
+
+            item = await self.__next_url()
+            if item is None:
+                slots.release()
+                break
+
+            url, cookie, headers = item
+
+            # Wait until the host and the circuit of the request are below their concurrency limit
+            if self.concurrency:
+                while self.running and not self.concurrency.try_acquire(url, cookie):
+                    await asyncio.sleep(SLOT_POLL_INTERVAL)
+
+                if not self.running:
+                    with self.lock:
+                        self.in_flight -= 1
+                    slots.release()
+                    break
+
+            # Wait for the request slot of the host without blocking the requests in flight
+            if self.rate_limiter:
+                delay = self.rate_limiter.get_bucket(url).reserve()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+            download = DownloadResult(url, cookie, Future())
+            task = asyncio.create_task(self.__fetch(download, headers, slots))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+            if self.renewal_due():
+                print("DOWNLOADER - Restart Tor (crawling)!")
+                # The requests in flight wait for the new circuit in send_request_async
+                await asyncio.to_thread(self.torhandler.renew_connection)
+
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        # The sessions of the Tor handler are bound to this event loop
+        await self.torhandler.close_async_session()
+        self.loop = None
+
+    async def __fetch(self, download:DownloadResult, headers:dict, slots:asyncio.Semaphore) -> None:
+        """
+        Run a single request and move its result in the completion queue.
+        """
+        future = download.future
+        download.deadline = self.torhandler.timeouts[PAGE].deadline
+        try:
+            # The request is cancelled at its deadline, including the time spent waiting for a new circuit
+            result = await asyncio.wait_for(self.__race(download, headers), download.deadline)
+            future.set_result(result)
+        except asyncio.TimeoutError:
+            download.expired = True
+            with self.lock:
+                self.n_expired += 1
+            logger.warning(f"DOWNLOADER - Deadline of {download.deadline}s exceeded: {download.url}")
+            future.set_exception(DeadlineExceededError(download.url, download.deadline))
+        except (Exception, asyncio.CancelledError) as e:
+            future.set_exception(e)
+        finally:
+            slots.release()
+            self.complete(download, future)
+
+    async def fetch_async(self, url:str, cookie:str, headers:dict =None, identity:str =None):
+        """
+        Asynchronous version of Downloader.fetch.
+        """
+        if not self.mirrors:
+            return await self.torhandler.send_request_async(url, cookie, headers, identity)
+
+        request_url, mirror = self.mirrors.resolve(url)
+        start = time.monotonic()
+        failed = True
+        try:
+            web_page, used_cookie = await self.torhandler.send_request_async(request_url, cookie, headers, identity)
+            failed = web_page is not None and web_page.status_code >= 500
+        finally:
+            self.mirrors.release(mirror, time.monotonic() - start, failed)
+
+        if web_page is not None:
+            self.mirrors.canonical_response(web_page)
+        return web_page, used_cookie
+
+    async def __race(self, download:DownloadResult, headers:dict):
+        """
+        Send the request and, if it gets slower than the usual latency of its host, a duplicate through another
+        circuit. The first successful response wins and the other request is cancelled.
+        :return: the tuple (web_page, used_cookie) of the first successful response
+        """
+        primary = asyncio.create_task(self.fetch_async(download.url, download.cookie, headers))
+        attempts = {primary}
+        try:
+            threshold = None
+            if self.hedger:
+                self.hedger.count_request()
+                threshold = self.hedger.threshold(download.url)
+
+            if threshold is not None:
+                done, _ = await asyncio.wait(attempts, timeout=threshold)
+                if not done and self.hedger.try_hedge():
+                    hedge_headers = self.torhandler.identities.headers(download.cookie)
+                    if headers:
+                        hedge_headers.update(headers)
+                    logger.debug(f"DOWNLOADER - Duplicate request after {threshold:.1f}s: {download.url}")
+                    attempts.add(asyncio.create_task(self.fetch_async(download.url, download.cookie, hedge_headers,
+                                                                      hedge_identity(download.cookie))))
+
+            pending = set(attempts)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                # The successful attempts first
+                for task in sorted(done, key=lambda t: t.exception() is not None):
+                    # A failed attempt waits for the other attempt, if any
+                    if task.exception() is not None and pending:
+                        continue
+
+                    if self.hedger and task.exception() is None:
+                        # When the duplicate wins, the elapsed time is a lower bound of the latency of the original
+                        # request: without it, the slow tail would be missing from the latencies of the host
+                        self.hedger.observe(download.url, download.elapsed())
+                        if task is not primary:
+                            self.hedger.record_win()
+
+                    return task.result()
+        finally:
+            for task in attempts:
+                task.cancel()
+
+    def stop(self):
+        self.running = False
+        self.__wake_up()
+        super().stop()
@@ -0,0 +1,190 @@
+import time
+import hashlib
+import logging
+import threading
+from collections import deque
+from urllib.parse import urlparse
+
+logger = logging.getLogger("CRATOR")
+
+# Outcomes of a request reported to the controller
+SUCCESS = "SUCCESS"
+ERROR = "ERROR"
+WAITING_PAGE = "WAITING PAGE"
+CAPTCHA = "CAPTCHA"
+
+# Multiplicative decrease of the limit for each congestion signal
+DECREASE_FACTORS = {ERROR: 0.75, WAITING_PAGE: 0.5, CAPTCHA: 0.5}
+LATENCY_DECREASE_FACTOR = 0.9
+# Number of latencies used to compute the percentiles
+LATENCY_WINDOW = 20
+# The latency is too high if the 90th percentile exceeds the baseline median by this factor
+LATENCY_TOLERANCE = 2.0
+# Growth of the baseline latency at each sample, so that it follows a slower network
+BASELINE_DRIFT = 1.01
+# HTTP status codes meaning that the server is overloaded
+OVERLOAD_STATUS_CODES = {429, 502, 503, 504}
+
+
+def percentile(values, q:float) -> float:
+    """
+    :param values: a non-empty collection of numbers
+    :param q: the percentile, between 0 and 1
+    :return: the q-th percentile of the values (nearest rank)
+    """
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class AIMDLimit:
+    """
+    Concurrency limit following the additive increase/multiplicative decrease rule: the limit grows by one request
+    per round trip while the requests succeed with a stable latency, and it is cut at each congestion signal.
+    """
+    def __init__(self, initial:int, min_limit:int, max_limit:int):
+        """
+        :param initial: the initial number of requests in flight
+        :param min_limit: the minimum number of requests in flight
+        :param max_limit: the maximum number of requests in flight
+        """
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(min(max(initial, self.min_limit), self.max_limit))
+        self.in_flight = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        # Median latency of an uncongested network
+        self.baseline = None
+        self.last_decrease = 0.0
+
+    def available(self) -> bool:
+        return self.in_flight < int(self.limit)
+
+    def round_trip(self) -> float:
+        return percentile(self.latencies, 0.5) if self.latencies else 0.0
+
+    def p90(self) -> float:
+        return percentile(self.latencies, 0.9) if self.latencies else 0.0
+
+    def on_success(self, latency:float, now:float) -> None:
+        self.latencies.append(latency)
+
+        if len(self.latencies) >= LATENCY_WINDOW // 2:
+            median = self.round_trip()
+            self.baseline = median if self.baseline is None else min(median, self.baseline * BASELINE_DRIFT)
+
+            if self.p90() > LATENCY_TOLERANCE * self.baseline:
+                self.decrease(LATENCY_DECREASE_FACTOR, now)
+                return
+
+        self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+    def decrease(self, factor:float, now:float) -> None:
+        # The requests sent before a decrease report the same congestion: the limit is cut once per round trip
+        if now - self.last_decrease < self.round_trip():
+            return
+
+        self.limit = max(self.min_limit, self.limit * factor)
+        self.last_decrease = now
+
+
+class ConcurrencyController:
+    """
+    Adaptive limits of the requests in flight to each host and through each circuit. A request is sent only when both
+    its host and its circuit are below their limit. The limits grow while the requests succeed, and they are cut when
+    the latency rises, the requests fail, or the marketplace answers with waiting pages or captchas.
+    The dispatch rate follows the limits: with a fixed latency, fewer requests in flight mean fewer requests per
+    second. The rate limiter still caps the rate of each host.
+    """
+    def __init__(self, max_limit:int, min_limit:int =1, initial:int =None):
+        """
+        :param max_limit: the maximum number of requests in flight to a host or through a circuit
+        :param min_limit: the minimum number of requests in flight to a host or through a circuit
+        :param initial: the initial limit, half the maximum if None
+        """
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.initial = initial if initial is not None else max(1, max_limit // 2)
+
+        self.hosts = {}
+        self.circuits = {}
+        self.condition = threading.Condition()
+
+    def __get_limits(self, url:str, circuit:str) -> tuple:
+        """
+        :return: the limits of the host of the url and of the circuit. It must be called holding the condition.
+        """
+        host = urlparse(url).netloc.lower()
+        if host not in self.hosts:
+            self.hosts[host] = AIMDLimit(self.initial, self.min_limit, self.max_limit)
+        if circuit not in self.circuits:
+            self.circuits[circuit] = AIMDLimit(self.initial, self.min_limit, self.max_limit)
+
+        return self.hosts[host], self.circuits[circuit]
+
+    def try_acquire(self, url:str, circuit:str =None) -> bool:
+        """
+        Reserve a slot for a request, if both the host and the circuit are below their limit.
+        :param url: the URL to be requested
+        :param circuit: the identity of the circuit (e.g., the cookie), None for the shared circuits
+        :return: True if the slot has been reserved
+        """
+        with self.condition:
+            host_limit, circuit_limit = self.__get_limits(url, circuit)
+            if not host_limit.available() or not circuit_limit.available():
+                return False
+
+            host_limit.in_flight += 1
+            circuit_limit.in_flight += 1
+            return True
+
+    def acquire(self, url:str, circuit:str =None, timeout:float =None) -> bool:
+        """
+        Wait for a slot for a request.
+        :param timeout: the maximum number of seconds to wait. None waits until a slot is available.
+        :return: True if the slot has been reserved, False if the timeout expired
+        """
+        with self.condition:
+            return self.condition.wait_for(lambda: self.try_acquire(url, circuit), timeout)
+
+    def release(self, url:str, circuit:str =None, latency:float =None, outcome:str =SUCCESS) -> None:
+        """
+        Release the slot of a completed request.
+        :param latency: the seconds spent by the request
+        :param outcome: SUCCESS or ERROR
+        """
+        now = time.monotonic()
+        with self.condition:
+            limits = self.__get_limits(url, circuit)
+            for limit in limits:
+                limit.in_flight -= 1
+                if outcome == SUCCESS and latency is not None:
+                    limit.on_success(latency, now)
+                elif outcome != SUCCESS:
+                    limit.decrease(DECREASE_FACTORS.get(outcome, DECREASE_FACTORS[ERROR]), now)
+
+            self.condition.notify_all()
+
+    def report(self, url:str, circuit:str =None, outcome:str =WAITING_PAGE) -> None:
+        """
+        Report a congestion signal found in the content of a downloaded page (e.g., a waiting page or a captcha).
+        """
+        now = time.monotonic()
+        with self.condition:
+            for limit in self.__get_limits(url, circuit):
+                limit.decrease(DECREASE_FACTORS.get(outcome, DECREASE_FACTORS[ERROR]), now)
+
+        logger.debug(f"CONCURRENCY - {outcome} from {urlparse(url).netloc}")
+
+    def snapshot(self) -> list:
+        """
+        :return: the rows (kind, key, limit, in flight, 90th percentile latency) of the hosts and the circuits. The
+        circuits are identified by a digest of their identity, never by the cookie itself.
+        """
+        with self.condition:
+            rows = [("host", host, int(limit.limit), limit.in_flight, round(limit.p90(), 3))
+                    for host, limit in self.hosts.items()]
+            for circuit, limit in self.circuits.items():
+                key = hashlib.blake2b(circuit.encode("utf-8"), digest_size=4).hexdigest() if circuit else "shared"
+                rows.append(("circuit", key, int(limit.limit), limit.in_flight, round(limit.p90(), 3)))
+
+        return rows
@@ -1,5 +1,6 @@
 import argparse
 from utils.config import Configuration
+from cookie_store import CookieStore
 
 
 if __name__ == '__main__':
@@ -7,31 +8,52 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser(description="Manage seeds and cookies")
 
     # Add arguments
-    parser.add_argument("-a", action="store_true", help="Add a cookie to the file")
+    parser.add_argument("-a", action="store_true", help="Add a cookie to the cookie store")
     parser.add_argument("-r", action="store_true", help="Remove a seed or cookie")
-    parser.add_argument("seed", help="Seed value")
+    parser.add_argument("-l", action="store_true", help="List the cookies of a seed")
+    parser.add_argument("--import-yaml", action="store_true", help="Import the cookies of the YAML file")
+    parser.add_argument("--export-yaml", action="store_true", help="Export the cookies to the YAML file")
+    parser.add_argument("seed", nargs="?", help="Seed value")
     parser.add_argument("cookie", nargs="?", help="Cookie value (optional). Insert the cookie inside \"...\"")
 
     # Parse the command-line arguments
     args = parser.parse_args()
 
     config = Configuration()
+    cookie_store = CookieStore(config.cookie_store_path())
 
     # Process the arguments
-    if args.a:
+    if args.import_yaml:
+        n_cookies = cookie_store.import_config(config, force=True)
+        print(f"{n_cookies} cookies imported.")
+
+    elif args.export_yaml:
+        cookie_store.export_config(config)
+        print(f"Cookies exported to {config.crator_path}.")
+
+    elif args.seed is None:
+        print("Please provide a seed value.")
+
+    elif args.a:
         if args.cookie is None:
             print("Please provide a cookie value with -a option.")
         else:
-            config.add_cookie(args.seed, args.cookie)
+            cookie_store.add(args.seed, args.cookie)
             print("Cookie updated successfully!")
 
     elif args.r:
         if args.cookie is None:
-            config.remove_seed(args.seed)
+            cookie_store.remove_seed(args.seed)
             print(f"Seed {args.seed} removed.")
         else:
-            config.remove_cookie(args.seed, args.cookie)
+            cookie_store.remove(args.seed, args.cookie)
             print("Cookie removed.")
 
+    elif args.l:
+        for cookie in cookie_store.cookies(args.seed):
+            print(cookie)
+
     else:
-        print("Please provide a valid option (-a or -r).")
\ No newline at end of file
+        print("Please provide a valid option (-a, -r, -l, --import-yaml or --export-yaml).")
+
+    cookie_store.close()
@@ -0,0 +1,209 @@
+import time
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Local imports
+from cookie_store import CookieStore, INVALID
+
+logger = logging.getLogger("CRATOR")
+
+VALIDATION_CONCURRENCY = 4  # cookies validated at the same time
+RECHECK_INTERVAL = 600      # seconds after which a valid cookie is validated again
+SCAN_INTERVAL = 10          # seconds between two scans of the store for new or stale cookies
+
+# Results of the validation of a cookie, with INVALID (captcha or login redirection)
+VALID = "VALID"
+UNKNOWN = "UNKNOWN"         # the validation request failed (e.g., Tor timeout, 5xx answer): nothing is known
+
+
+class CookieHealthPool:
+    """
+    Background validation of the cookies of a seed. The cookies of the store are validated concurrently, with a
+    bounded number of requests in flight, and the valid ones enter the hot set with the time of their last check.
+    The hot cookies are validated again every RECHECK_INTERVAL seconds, and the invalid cookies are removed from the
+    store, recording their lifetime. A cookie whose validation request failed is kept, and validated again at the
+    next scan: a Tor outage must not empty the store. The crawl path gets its cookies from the hot set, with no
+    validation request.
+    """
+    def __init__(self, seed:str, cookie_store:CookieStore, check, concurrency:int =VALIDATION_CONCURRENCY,
+                 recheck_interval:float =RECHECK_INTERVAL, on_retire=None):
+        """
+        :param seed: the seed URL of the cookies
+        :param cookie_store: the store of the cookies
+        :param check: the function checking a cookie, returning VALID, INVALID or UNKNOWN
+        :param concurrency: the maximum number of cookies validated at the same time
+        :param recheck_interval: the seconds after which a valid cookie is validated again
+        :param on_retire: the function called with each invalid cookie removed from the store, if any
+        """
+        self.seed = seed
+        self.cookie_store = cookie_store
+        self.check = check
+        self.recheck_interval = recheck_interval
+        self.on_retire = on_retire
+        self.executor = ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="cookie-validator")
+
+        # cookie -> time of its last successful validation
+        self.hot = {}
+        # Round-robin order of the hot cookies. The cookies leaving the hot set are dropped lazily.
+        self.order = deque()
+        # Cookies being validated
+        self.checking = set()
+        self.n_valid = 0
+        self.n_invalid = 0
+        self.n_unknown = 0
+        self.scanned = False
+
+        self.condition = threading.Condition()
+        self.thread = None
+        self.running = False
+
+    def start(self) -> None:
+        """
+        Start the thread scanning the store every SCAN_INTERVAL seconds.
+        """
+        with self.condition:
+            if self.thread is not None:
+                return
+
+            self.running = True
+            self.thread = threading.Thread(target=self.__run, daemon=True)
+            self.thread.start()
+
+    def __run(self) -> None:
+        while True:
+            try:
+                self.scan()
+            except Exception as e:
+                logger.error(f"{self.seed} COOKIE HEALTH - Error scanning the cookie store: {e}")
+
+            with self.condition:
+                self.condition.wait_for(lambda: not self.running, SCAN_INTERVAL)
+                if not self.running:
+                    return
+
+    def scan(self) -> int:
+        """
+        Submit the validation of the new cookies of the store and of the hot cookies not validated recently. The hot
+        cookies removed from the store (e.g., by another crawler) leave the hot set. The cookies whose last validation
+        failed are validated again.
+        :return: the number of cookies submitted
+        """
+        cookies = self.cookie_store.cookies(self.seed)
+        stored = set(cookies)
+        now = time.time()
+        to_check = []
+
+        with self.condition:
+            for cookie in list(self.hot):
+                if cookie not in stored:
+                    del self.hot[cookie]
+
+            for cookie in cookies:
+                last_check = self.hot.get(cookie)
+                if cookie in self.checking or (last_check is not None and now - last_check < self.recheck_interval):
+                    continue
+
+                self.checking.add(cookie)
+                to_check.append(cookie)
+
+            self.scanned = True
+            self.condition.notify_all()
+
+        for cookie in to_check:
+            self.executor.submit(self.__check, cookie)
+
+        if to_check:
+            logger.info(f"{self.seed} COOKIE HEALTH - Validating {len(to_check)} cookies")
+        return len(to_check)
+
+    def __check(self, cookie:str) -> None:
+        try:
+            result = self.check(cookie)
+        except Exception as e:
+            logger.error(f"{self.seed} COOKIE HEALTH - Error validating a cookie: {e}")
+            result = UNKNOWN
+
+        with self.condition:
+            self.checking.discard(cookie)
+            if result == VALID:
+                # A cookie back in the hot set may still be in the order, if it has not been dropped yet
+                if cookie not in self.hot and cookie not in self.order:
+                    self.order.append(cookie)
+                self.hot[cookie] = time.time()
+                self.n_valid += 1
+            elif result == INVALID:
+                self.hot.pop(cookie, None)
+                self.n_invalid += 1
+            else:
+                # A hot cookie stays hot, with the time of its last successful validation
+                self.n_unknown += 1
+
+            self.condition.notify_all()
+
+        if result == INVALID:
+            logger.info(f"{self.seed} COOKIE HEALTH - INVALID COOKIE removed")
+            self.cookie_store.retire(self.seed, cookie, INVALID)
+            if self.on_retire is not None:
+                self.on_retire(cookie)
+        elif result != VALID:
+            logger.info(f"{self.seed} COOKIE HEALTH - Cookie validity unknown, validated again at the next scan")
+
+    def get(self) -> str:
+        """
+        :return: the next hot cookie in round-robin order, None if the hot set is empty
+        """
+        with self.condition:
+            while self.order:
+                cookie = self.order.popleft()
+                if cookie in self.hot:
+                    self.order.append(cookie)
+                    return cookie
+
+        return None
+
+    def discard(self, cookie:str) -> None:
+        """
+        Remove a cookie from the hot set, e.g. after a captcha.
+        """
+        with self.condition:
+            self.hot.pop(cookie, None)
+
+    def wait_ready(self, timeout:float =None) -> bool:
+        """
+        Wait for the first valid cookie, or for the end of the validation of all the stored cookies.
+        :param timeout: the maximum number of seconds to wait, None to wait until the validation ends
+        :return: True if the hot set has at least one cookie
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: self.hot or (self.scanned and not self.checking), timeout)
+            return bool(self.hot)
+
+    def validate_all(self) -> int:
+        """
+        Validate all the stored cookies now, concurrently, and wait for the results.
+        :return: the number of hot cookies
+        """
+        self.scan()
+        with self.condition:
+            self.condition.wait_for(lambda: not self.checking)
+            return len(self.hot)
+
+    def stats(self) -> tuple:
+        """
+        :return: the number of hot cookies, of cookies being validated, of successful, of failed validations and of
+        validations with an unknown result
+        """
+        with self.condition:
+            return len(self.hot), len(self.checking), self.n_valid, self.n_invalid, self.n_unknown
+
+    def stop(self) -> None:
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def __len__(self) -> int:
+        return len(self.hot)
@@ -0,0 +1,196 @@
+import time
+import zlib
+import logging
+import threading
+
+# Local imports
+from cookie_store import CookieStore, EXPIRED, INVALID, PROACTIVE
+
+logger = logging.getLogger("CRATOR")
+
+LIFETIME_WINDOW = 50        # last expired cookies used to estimate the lifetime of a cookie
+MIN_LIFETIMES = 5           # expired cookies needed before the cookies are retired proactively
+LIFETIME_PERCENTILE = 0.2   # a cookie is retired at the age or usage at which this share of the cookies expired
+RETIRE_MARGIN = 0.9         # share of the estimated lifetime after which a cookie is retired
+REFRESH_INTERVAL = 60       # seconds between two estimates of the lifetime
+CONTROL_SHARE = 0.1         # share of the cookies never retired proactively, used until they expire
+MIN_FAILURES = 3            # failed requests after which a cookie may be failing
+FAILURE_RATIO = 0.5         # share of failed requests of a failing cookie
+# HTTP status codes answered to a request because of its cookie
+COOKIE_FAILURE_STATUS_CODES = {401, 403}
+HARVEST_HORIZON = 600       # seconds ahead for which the harvester prepares the replacements
+MIN_POOL_SIZE = 2           # cookies that the harvester keeps ready in any case
+
+
+def lifetime_quantile(samples, q:float) -> float:
+    """
+    Kaplan-Meier estimate of a quantile of the lifetimes, with right-censored samples: a cookie retired proactively
+    only tells that its lifetime exceeds its age or usage at retirement.
+    :param samples: the (lifetime, expired) pairs, expired being False for the censored samples
+    :param q: the share of the cookies expired at the quantile, between 0 and 1
+    :return: the smallest lifetime at which the estimated share of expired cookies reaches q, None if the censored
+    samples leave it unknown
+    """
+    # At equal lifetime, the expiries come before the censored samples
+    ordered = sorted(samples, key=lambda sample: (sample[0], not sample[1]))
+    at_risk = len(ordered)
+    survival = 1.0
+    i = 0
+    while i < len(ordered):
+        lifetime = ordered[i][0]
+        expired = censored = 0
+        while i < len(ordered) and ordered[i][0] == lifetime:
+            if ordered[i][1]:
+                expired += 1
+            else:
+                censored += 1
+            i += 1
+
+        if expired:
+            survival *= 1 - expired / at_risk
+            if 1 - survival >= q:
+                return lifetime
+        at_risk -= expired + censored
+
+    return None
+
+
+class CookieRotation:
+    """
+    Lifetime model of the cookies of a marketplace. The age and the number of requests of the cookies that expired
+    (captcha, login redirection or failed validity check) estimate how long and how much a cookie can be used: a
+    cookie reaching RETIRE_MARGIN of a low percentile of these lifetimes is retired before a request is wasted on it.
+    The same estimate tells the harvester how many cookies will expire soon.
+    A cookie whose requests keep failing because of the cookie (waiting pages, 401 or 403 answers) is failing: it is
+    retired as expired, whatever its age.
+    The lifetime of the cookies retired proactively is only a lower bound: they enter the estimate as censored
+    samples (Kaplan-Meier), otherwise only the cookies expiring before the retirement threshold would be observed, and
+    the threshold would shrink at each estimate. A CONTROL_SHARE of the cookies is never retired proactively, so that
+    the lifetimes beyond the threshold are still observed and the estimate can follow longer lifetimes. While the
+    censored samples leave the percentile unknown, the previous estimate is kept.
+    """
+    def __init__(self, seed:str, cookie_store:CookieStore, q:float =LIFETIME_PERCENTILE, margin:float =RETIRE_MARGIN,
+                 window:int =LIFETIME_WINDOW, min_samples:int =MIN_LIFETIMES, control_share:float =CONTROL_SHARE):
+        """
+        :param seed: the seed URL of the cookies
+        :param cookie_store: the store of the cookies
+        :param q: the percentile of the lifetimes at which a cookie is retired
+        :param margin: the share of the estimated lifetime after which a cookie is retired
+        :param window: the number of last expired cookies used in the estimate
+        :param min_samples: the number of expired or invalid cookies needed to estimate the lifetime
+        :param control_share: the share of the cookies never retired proactively
+        """
+        self.seed = seed
+        self.cookie_store = cookie_store
+        self.q = q
+        self.margin = margin
+        self.window = window
+        self.min_samples = min_samples
+        self.control_share = control_share
+
+        self.max_age = None
+        self.max_requests = None
+        self.last_refresh = None
+        # Last statistics and their time, computed at most every REFRESH_INTERVAL seconds
+        self.last_stats = None
+        self.last_stats_time = None
+        self.lock = threading.Lock()
+
+    def refresh(self, force:bool =False) -> tuple:
+        """
+        Estimate again the lifetime of a cookie, at most every REFRESH_INTERVAL seconds.
+        :param force: True to estimate it now
+        :return: the (maximum age in seconds, maximum number of requests) of a cookie, None if unknown
+        """
+        now = time.monotonic()
+        with self.lock:
+            if not force and self.last_refresh is not None and now - self.last_refresh < REFRESH_INTERVAL:
+                return self.max_age, self.max_requests
+            self.last_refresh = now
+
+        lifetimes = self.cookie_store.lifetimes(self.seed, (EXPIRED, INVALID, PROACTIVE), self.window)
+        ages = [(age, reason != PROACTIVE) for age, _, reason in lifetimes]
+        requests = [(requests, reason != PROACTIVE) for _, requests, reason in lifetimes]
+        max_age = max_requests = None
+        if sum(expired for _, expired in ages) >= self.min_samples:
+            max_age = lifetime_quantile(ages, self.q)
+            max_requests = lifetime_quantile(requests, self.q)
+            max_age = self.margin * max_age if max_age is not None else self.max_age
+            max_requests = self.margin * max_requests if max_requests is not None else self.max_requests
+
+        with self.lock:
+            if (max_age, max_requests) != (self.max_age, self.max_requests):
+                logger.info(f"{self.seed} COOKIE ROTATION - Cookies retired after "
+                            f"{round(max_age) if max_age is not None else '?'}s or "
+                            f"{round(max_requests) if max_requests is not None else '?'} requests")
+            self.max_age, self.max_requests = max_age, max_requests
+            return max_age, max_requests
+
+    def is_control(self, cookie:str) -> bool:
+        """
+        :return: True if the cookie is in the control share, the same in all the processes
+        """
+        return zlib.crc32(cookie.encode()) % 1000 < self.control_share * 1000
+
+    def is_failing(self, requests:int, failures:int) -> bool:
+        """
+        :param requests: the number of requests sent with the cookie
+        :param failures: the number of these requests failed because of the cookie
+        :return: True if at least MIN_FAILURES requests and FAILURE_RATIO of the requests failed
+        """
+        return failures >= MIN_FAILURES and failures >= FAILURE_RATIO * requests
+
+    def should_retire(self, age:float, requests:int, cookie:str =None) -> bool:
+        """
+        :param age: the seconds since the cookie was stored
+        :param requests: the number of requests sent with the cookie
+        :param cookie: the cookie, never retired if in the control share
+        :return: True if the cookie is likely to expire soon
+        """
+        if cookie is not None and self.is_control(cookie):
+            return False
+
+        max_age, max_requests = self.refresh()
+        return (max_age is not None and age >= max_age) or \
+            (max_requests is not None and requests >= max(1, max_requests))
+
+    def replacements_needed(self, horizon:float =HARVEST_HORIZON, min_pool_size:int =MIN_POOL_SIZE) -> int:
+        """
+        :param horizon: the seconds ahead to be covered
+        :param min_pool_size: the number of cookies to be kept ready in any case
+        :return: the number of new cookies needed to keep the pool size over the next horizon seconds: the failing
+        cookies, the cookies expected to be retired, at their current request rate, and the cookies missing to reach
+        min_pool_size.
+        """
+        max_age, max_requests = self.refresh()
+        usage = self.cookie_store.usage(self.seed)
+
+        expiring = 0
+        for _, age, requests, failures in usage:
+            rate = requests / max(age, 1.0)
+            if self.is_failing(requests, failures) or (max_age is not None and age + horizon >= max_age) or \
+                    (max_requests is not None and requests + rate * horizon >= max(1, max_requests)):
+                expiring += 1
+
+        survivors = len(usage) - expiring
+        return max(0, max(min_pool_size, len(usage)) - survivors)
+
+    def stats(self) -> tuple:
+        """
+        :return: the number of stored cookies, the maximum age and the maximum number of requests of a cookie (None if
+        unknown), the number of replacements needed, and the number of expired, invalid and proactively retired cookies.
+        They are computed at most every REFRESH_INTERVAL seconds.
+        """
+        now = time.monotonic()
+        if self.last_stats is not None and now - self.last_stats_time < REFRESH_INTERVAL:
+            return self.last_stats
+
+        max_age, max_requests = self.refresh()
+        retirements = self.cookie_store.retirements(self.seed)
+        self.last_stats = (self.cookie_store.count(self.seed),
+                           round(max_age) if max_age is not None else None,
+                           round(max_requests) if max_requests is not None else None,
+                           self.replacements_needed(),
+                           retirements.get(EXPIRED, 0), retirements.get(INVALID, 0), retirements.get(PROACTIVE, 0))
+        self.last_stats_time = now
+        return self.last_stats
@@ -0,0 +1,330 @@
+import os
+import time
+import sqlite3
+import logging
+import threading
+
+logger = logging.getLogger("CRATOR")
+
+COOKIE_STORE_FILE_NAME = "cookies.db"
+# Seconds between two checks for the cookies added by other processes (e.g., extract_cookie.py) while waiting
+POLL_INTERVAL = 0.5
+# Seconds a connection waits for the write lock held by another process
+BUSY_TIMEOUT = 30
+
+# Reasons of the retirement of a cookie
+EXPIRED = "EXPIRED"         # a request with the cookie was answered with a captcha or a login page
+INVALID = "INVALID"         # the cookie failed a validity check
+PROACTIVE = "PROACTIVE"     # the cookie was retired before its expected expiry
+
+
+class CookieStore:
+    """
+    Store of the session cookies of the seeds (SQLite in WAL mode), shared by the crawlers, the cookie harvester
+    (extract_cookie.py) and cookie_cli.py. Each change is a single transaction on a row: no process rewrites the
+    whole store, and the readers are never blocked by a writer.
+    The cookies are leased in round-robin order, the least recently leased first. A crawler waiting for a cookie is
+    woken up as soon as a cookie is added by the same process, and within POLL_INTERVAL seconds when it is added by
+    another process.
+    The YAML file is only an import/export format: its cookies are imported when it changes.
+    """
+    def __init__(self, path:str):
+        """
+        :param path: the path of the SQLite file
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        # Notified when a cookie is added by this process
+        self.condition = threading.Condition(self.lock)
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # Autocommit: each statement is a transaction
+        self.connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None,
+                                          timeout=BUSY_TIMEOUT)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        # Seeds requiring cookies, even if all their cookies have been removed
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS seeds (
+                                       seed TEXT PRIMARY KEY)""")
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS cookies (
+                                       seed TEXT NOT NULL,
+                                       cookie TEXT NOT NULL,
+                                       added_at REAL NOT NULL,
+                                       leased_at REAL NOT NULL DEFAULT 0,
+                                       requests INTEGER NOT NULL DEFAULT 0,
+                                       failures INTEGER NOT NULL DEFAULT 0,
+                                       PRIMARY KEY (seed, cookie))""")
+        # Columns missing in the stores created before the usage statistics
+        columns = {row[1] for row in self.connection.execute("PRAGMA table_info(cookies)")}
+        for column in ("requests", "failures"):
+            if column not in columns:
+                self.connection.execute(f"ALTER TABLE cookies ADD COLUMN {column} INTEGER NOT NULL DEFAULT 0")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS cookies_lease ON cookies (seed, leased_at)")
+        # Lifetimes of the retired cookies
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS retired (
+                                       seed TEXT NOT NULL,
+                                       age REAL NOT NULL,
+                                       requests INTEGER NOT NULL,
+                                       failures INTEGER NOT NULL,
+                                       reason TEXT NOT NULL,
+                                       retired_at REAL NOT NULL)""")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS retired_seed ON retired (seed, retired_at)")
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS meta (
+                                       key TEXT PRIMARY KEY,
+                                       value TEXT)""")
+
+    def __execute(self, query:str, parameters:tuple =()) -> sqlite3.Cursor:
+        """
+        Execute a statement. It must be called holding the lock.
+        """
+        return self.connection.execute(query, parameters)
+
+    def __data_version(self) -> int:
+        """
+        :return: a number changing when another connection commits a change. It must be called holding the lock.
+        """
+        return self.__execute("PRAGMA data_version").fetchone()[0]
+
+    def add_seed(self, seed:str) -> None:
+        """
+        Record that the seed requires cookies.
+        """
+        with self.lock:
+            self.__execute("INSERT OR IGNORE INTO seeds (seed) VALUES (?)", (seed,))
+
+    def requires_cookies(self, seed:str) -> bool:
+        """
+        :return: True if the requests to the seed need a cookie
+        """
+        if not seed:
+            return False
+
+        with self.lock:
+            return self.__execute("SELECT 1 FROM seeds WHERE seed = ?", (seed,)).fetchone() is not None
+
+    def add(self, seed:str, cookie:str) -> bool:
+        """
+        Add a new cookie of the seed and wake up the threads waiting for it.
+        :return: True if the cookie was not already stored
+        """
+        return self.add_many(seed, [cookie]) == 1
+
+    def add_many(self, seed:str, cookies:list) -> int:
+        """
+        Add the cookies of the seed in a single transaction.
+        :return: the number of cookies not already stored
+        """
+        now = time.time()
+        with self.condition:
+            self.__execute("BEGIN IMMEDIATE")
+            try:
+                self.__execute("INSERT OR IGNORE INTO seeds (seed) VALUES (?)", (seed,))
+                added = 0
+                for cookie in cookies:
+                    added += self.__execute("INSERT OR IGNORE INTO cookies (seed, cookie, added_at) VALUES (?, ?, ?)",
+                                            (seed, cookie, now)).rowcount
+                self.__execute("COMMIT")
+            except Exception:
+                self.__execute("ROLLBACK")
+                raise
+
+            if added:
+                self.condition.notify_all()
+
+        return added
+
+    def remove(self, seed:str, cookie:str) -> bool:
+        """
+        :return: True if the cookie was stored
+        """
+        with self.lock:
+            return self.__execute("DELETE FROM cookies WHERE seed = ? AND cookie = ?", (seed, cookie)).rowcount > 0
+
+    def retire(self, seed:str, cookie:str, reason:str) -> bool:
+        """
+        Remove the cookie and record its lifetime.
+        :param reason: EXPIRED, INVALID or PROACTIVE
+        :return: True if the cookie was stored
+        """
+        now = time.time()
+        with self.lock:
+            self.__execute("BEGIN IMMEDIATE")
+            try:
+                rows = self.__execute("""DELETE FROM cookies WHERE seed = ? AND cookie = ?
+                                         RETURNING added_at, requests, failures""", (seed, cookie)).fetchall()
+                for added_at, requests, failures in rows:
+                    self.__execute("""INSERT INTO retired (seed, age, requests, failures, reason, retired_at)
+                                      VALUES (?, ?, ?, ?, ?, ?)""", (seed, now - added_at, requests, failures, reason, now))
+                self.__execute("COMMIT")
+            except Exception:
+                self.__execute("ROLLBACK")
+                raise
+
+        return bool(rows)
+
+    def record_use(self, seed:str, cookie:str) -> tuple:
+        """
+        Count a request sent with the cookie.
+        :return: the (age in seconds, number of requests, number of failures) of the cookie, None if the cookie is not
+        stored
+        """
+        with self.lock:
+            rows = self.__execute("""UPDATE cookies SET requests = requests + 1 WHERE seed = ? AND cookie = ?
+                                     RETURNING added_at, requests, failures""", (seed, cookie)).fetchall()
+        if not rows:
+            return None
+
+        added_at, requests, failures = rows[0]
+        return time.time() - added_at, requests, failures
+
+    def record_failure(self, seed:str, cookie:str) -> None:
+        """
+        Count a request sent with the cookie and failed because of the cookie (a waiting page, a 401 or 403 answer).
+        """
+        with self.lock:
+            self.__execute("UPDATE cookies SET failures = failures + 1 WHERE seed = ? AND cookie = ?", (seed, cookie))
+
+    def usage(self, seed:str) -> list:
+        """
+        :return: the (cookie, age in seconds, number of requests, number of failures) of the cookies of the seed
+        """
+        now = time.time()
+        with self.lock:
+            rows = self.__execute("SELECT cookie, added_at, requests, failures FROM cookies WHERE seed = ?", (seed,))
+            return [(cookie, now - added_at, requests, failures) for cookie, added_at, requests, failures in rows]
+
+    def lifetimes(self, seed:str, reasons:tuple, limit:int) -> list:
+        """
+        :param reasons: the reasons of the retirements
+        :param limit: the maximum number of lifetimes, the most recent first
+        :return: the (age in seconds, number of requests, reason) of the retired cookies of the seed
+        """
+        placeholders = ", ".join("?" * len(reasons))
+        with self.lock:
+            return self.__execute(f"""SELECT age, requests, reason FROM retired WHERE seed = ? AND reason IN ({placeholders})
+                                      ORDER BY retired_at DESC LIMIT ?""", (seed, *reasons, limit)).fetchall()
+
+    def count_retired(self, seed:str, since:float) -> int:
+        """
+        :param since: a timestamp
+        :return: the number of cookies of the seed retired after the timestamp
+        """
+        with self.lock:
+            return self.__execute("SELECT COUNT(*) FROM retired WHERE seed = ? AND retired_at >= ?",
+                                  (seed, since)).fetchone()[0]
+
+    def retirements(self, seed:str) -> dict:
+        """
+        :return: reason -> number of retired cookies of the seed
+        """
+        with self.lock:
+            return dict(self.__execute("SELECT reason, COUNT(*) FROM retired WHERE seed = ? GROUP BY reason", (seed,)))
+
+    def remove_seed(self, seed:str) -> None:
+        """
+        Remove the seed and all its cookies.
+        """
+        with self.lock:
+            self.__execute("BEGIN IMMEDIATE")
+            self.__execute("DELETE FROM cookies WHERE seed = ?", (seed,))
+            self.__execute("DELETE FROM seeds WHERE seed = ?", (seed,))
+            self.__execute("COMMIT")
+
+    def cookies(self, seed:str) -> list:
+        """
+        :return: the cookies of the seed, the oldest first
+        """
+        with self.lock:
+            rows = self.__execute("SELECT cookie FROM cookies WHERE seed = ? ORDER BY added_at, rowid", (seed,))
+            return [cookie for cookie, in rows]
+
+    def count(self, seed:str) -> int:
+        with self.lock:
+            return self.__execute("SELECT COUNT(*) FROM cookies WHERE seed = ?", (seed,)).fetchone()[0]
+
+    def lease(self, seed:str) -> str:
+        """
+        :return: the least recently leased cookie of the seed, None if the seed has no cookies
+        """
+        with self.lock:
+            return self.__lease(seed)
+
+    def __lease(self, seed:str) -> str:
+        """
+        Lease a cookie in a single statement, atomic also among processes. It must be called holding the lock.
+        """
+        rows = self.__execute("""UPDATE cookies SET leased_at = ?
+                                WHERE rowid = (SELECT rowid FROM cookies WHERE seed = ? ORDER BY leased_at LIMIT 1)
+                                RETURNING cookie""", (time.time(), seed)).fetchall()
+        return rows[0][0] if rows else None
+
+    def wait_lease(self, seed:str, timeout:float =None) -> str:
+        """
+        Lease a cookie of the seed, waiting for a new cookie if the seed has none.
+        :param timeout: the maximum number of seconds to wait, None to wait forever
+        :return: the leased cookie, None if the timeout expired
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self.condition:
+            while True:
+                version = self.__data_version()
+                cookie = self.__lease(seed)
+                if cookie is not None:
+                    return cookie
+
+                # Wait for a cookie added by this process, or for a change committed by another process
+                while self.__data_version() == version:
+                    remaining = deadline - time.monotonic() if deadline is not None else POLL_INTERVAL
+                    if remaining <= 0:
+                        return None
+
+                    if self.condition.wait(min(POLL_INTERVAL, remaining)):
+                        break
+
+    def import_config(self, config, force:bool =False) -> int:
+        """
+        Import the cookies of the YAML file, if it changed since the last import. The cookies removed from the store
+        are not imported again from an unchanged file.
+        :param config: a Configuration instance
+        :param force: True to import the cookies even if the file did not change
+        :return: the number of new cookies
+        """
+        snapshot = config.snapshot
+        with self.lock:
+            row = self.__execute("SELECT value FROM meta WHERE key = 'yaml_mtime'").fetchone()
+        if not force and row is not None and float(row[0]) == snapshot.mtime:
+            return 0
+
+        added = 0
+        for seed in snapshot.seeds:
+            self.add_seed(seed)
+        for seed, cookies in snapshot.cookies_by_seed.items():
+            added += self.add_many(seed, list(cookies or []))
+
+        with self.lock:
+            self.__execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('yaml_mtime', ?)", (str(snapshot.mtime),))
+
+        if added:
+            logger.info(f"COOKIE STORE - {added} cookies imported from {config.crator_path}")
+        return added
+
+    def export_config(self, config) -> None:
+        """
+        Replace the cookies of the YAML file with the cookies of the store.
+        :param config: a Configuration instance
+        """
+        with self.lock:
+            seeds = [seed for seed, in self.__execute("SELECT seed FROM seeds ORDER BY seed")]
+        config.set_cookies({seed: self.cookies(seed) for seed in seeds})
+
+        # The exported file must not be imported again
+        with self.lock:
+            self.__execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('yaml_mtime', ?)",
+                           (str(config.snapshot.mtime),))
+
+    def close(self) -> None:
+        with self.lock:
+            self.connection.close()
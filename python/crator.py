@@ -2,12 +2,15 @@ import logging
 from datetime import datetime
 import time
 import os
+import argparse
 import concurrent.futures
 
 # Local import
 import crawler
 from utils.seeds import get_seeds
-from handler import TorHandler
+from creator import Creator
+from extraction import ExtractionPool
+from rate_limiter import RateLimiter, DEFAULT_JITTER
 from utils.config import Configuration
 
 
@@ -44,7 +47,20 @@ def print_info(pcrawler: crawler.Crawler):
     print(f"HTTP 5xx status code: {n_500_pages}")
     print(f"Link skipped: {n_skip_page}")
     print(f"Request sent: {n_requests}")
+    print(f"Request timed out: {pcrawler.monitor.get_timeouts()}")
+    if pcrawler.monitor.get_hedging():
+        n_hedge_requests, n_hedges, n_wins, saved = pcrawler.monitor.get_hedging()
+        hedge_rate = round(n_hedges / n_hedge_requests * 100, 2) if n_hedge_requests else 0
+        print(f"Hedged requests: {n_hedges} ({hedge_rate}%), completed first: {n_wins}, latency saved: {saved}s")
+    if pcrawler.monitor.get_cookies():
+        n_cookies, max_age, max_requests, needed, n_expired, n_invalid, n_retired = pcrawler.monitor.get_cookies()
+        print(f"Cookies: {n_cookies}, expired: {n_expired}, invalid: {n_invalid}, retired before expiry: {n_retired}, "
+              f"replacements needed: {needed}")
+        if max_age is not None:
+            print(f"Estimated cookie lifetime: {max_age}s or {max_requests} requests")
     print(f"Links found: {links_found}")
+    for kind, key, limit, in_flight, p90_latency in pcrawler.monitor.get_concurrency():
+        print(f"Concurrency {kind} {key}: limit {limit}, in flight {in_flight}, p90 latency {p90_latency}s")
 
     n_pages = n_200_pages + n_300_pages + n_400_pages + n_500_pages
     if links_found > 0 and n_pages > 0:
@@ -55,6 +71,12 @@ def print_info(pcrawler: crawler.Crawler):
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Crawl the seeds defined in the resources folder")
+    parser.add_argument("--resume", metavar="project_path", help="Resume the crawl stored in the given project folder")
+    parser.add_argument("--incremental", metavar="previous_project_path",
+                        help="Reuse the data of a previous crawl: only new or changed product pages and their images are downloaded")
+    args = parser.parse_args()
+
     init_logger()
     logger = logging.getLogger("CRATOR")
     logger.info("CRATOR - START")
@@ -65,15 +87,27 @@ if __name__ == '__main__':
 
     with concurrent.futures.ThreadPoolExecutor(max_workers=len(seeds)) as executor:
         print("********************")
-        torhandler = TorHandler(config.tor_password(), config.tor_port(), config.http_proxy(), config.venv_path())
+        torhandler = Creator.create_tor_handler(config.tor_password(), config.tor_port(), config.http_proxy(),
+                                                config.venv_path(), config.tor_instances(), config.request_timeouts())
         print("********************\n")
+
+        # Process pool shared by all the crawlers to analyze the web pages
+        extraction_pool = None
+        if config.extraction_processes() > 0:
+            extraction_pool = ExtractionPool(config.extraction_processes())
+
+        # Rate limiter shared by all the crawlers, so that the seeds of the same marketplace share the request rate
+        rate_limiter = RateLimiter(config.requests_per_second(), jitter=DEFAULT_JITTER if config.random_wait() else 0)
+
         crators = []
         futures = []
 
         for seed in seeds:
             print(f"Thread for the seed -> {seed}")
             print("********************")
-            crator = crawler.Crawler(seed, torhandler)
+            crator = crawler.Crawler(seed, torhandler, project_path=args.resume, extraction_pool=extraction_pool,
+                                     resume=args.resume is not None, rate_limiter=rate_limiter,
+                                     previous_project_path=args.incremental)
             print("********************\n")
             crators.append(crator)
 
@@ -97,6 +131,9 @@ if __name__ == '__main__':
         # Wait for all tasks to complete
         concurrent.futures.wait(futures)
 
+        if extraction_pool:
+            extraction_pool.stop()
+
         print("Seeds downloaded. Final info\n")
 
         for crator in crators:
@@ -4,29 +4,42 @@ import sys
 import time
 from datetime import datetime
 import hashlib
-from waiting import wait
 from waiting.exceptions import TimeoutExpired
 import os
 from collections import deque
-from bs4 import BeautifulSoup
 from urllib.parse import urljoin, urlparse
 import csv
 import re
 
 # Local imports
 from handler import TorHandler, CookieHandler
+from cookie_store import CookieStore, EXPIRED
+from cookie_rotation import COOKIE_FAILURE_STATUS_CODES
 from monitor import CrawlerMonitor
-from detector import captcha_detector, login_redirection
+from detector import captcha_detector, login_redirection, anomalous_redirection
 from downloader import Downloader
+from async_downloader import AsyncDownloader
 from saver import FileSaver
 from image_saver import ImageSaver
 from creator import Creator
+from parsed_page import ParsedPage
+from extraction import PageAnalyzer, PageAnalysis, ExtractionPool
+from frontier import FrontierStore, PENDING, CRAWLED, DROPPED
+from fingerprints import BloomFilter
+from rate_limiter import RateLimiter, DEFAULT_JITTER
+from concurrency import ConcurrencyController
+from retry import (RetryScheduler, ERROR, HTTP_STATUS, TIMEOUT, WAITING_PAGE, CAPTCHA, is_retryable_exception,
+                   is_retryable_status, is_timeout, retry_after)
+from hedging import Hedger
+from mirror_pool import MirrorPool
+from near_duplicates import SimHashIndex
+from incremental import PreviousCrawl, NOT_MODIFIED, content_hash
 from utils.config import Configuration
 import utils.fileutils as file_utils
-from exceptions import InvalidURLException, HTTPStatusCodeError
+from exceptions import InvalidURLException, HTTPStatusCodeError, AnalysisError
 
-MAX_RETRIES = 3
 MAX_COOKING_WAITING_TIME = 36000     # 10 hours
+RESULT_TIMEOUT = 1     # seconds to wait for a downloaded page before checking the crawling conditions
 
 logger = logging.getLogger("CRATOR")
 
@@ -35,7 +48,9 @@ class Crawler:
     """
     Crawler for tor onion links
     """
-    def __init__(self, seed:str, tor_handler:TorHandler =None, crator_config_path:str =None, project_path:str =None):
+    def __init__(self, seed:str, tor_handler:TorHandler =None, crator_config_path:str =None, project_path:str =None,
+                 extraction_pool:ExtractionPool =None, resume:bool =False, rate_limiter:RateLimiter =None,
+                 previous_project_path:str =None):
         """
         Initialize the class crawler
         :param seed: the url to crawl
@@ -44,6 +59,14 @@ class Crawler:
         a captcha, the handler requests a new ip, blocking all the connections until the new ip.
         :param crator_config_path: the path to the YAML file.
         :param project_path: the path where the data will be stored.
+        :param extraction_pool: an instance of ExtractionPool to analyze the web pages in worker processes. It can be
+        shared among several crawlers. If None, the web pages are analyzed in the crawler thread.
+        :param resume: True to resume the crawl stored in project_path, with the same node indices and depths.
+        :param rate_limiter: an instance of RateLimiter shared among the crawlers of the same marketplace. If None, the
+        crawler creates its own limiter with the rate defined in the configuration file.
+        :param previous_project_path: the project folder of a previous crawl of the same seed, for an incremental
+        crawl: the pages are requested with conditional headers and the images of the unchanged product pages are
+        not downloaded again.
         """
         print("Crawler init")
         self.config = Configuration(crator_config_path)
@@ -62,12 +85,12 @@ class Crawler:
 
         self.tor_handler = tor_handler
         if not self.tor_handler:
-            self.tor_handler = TorHandler(self.config.tor_password(), self.config.tor_port(), self.config.http_proxy(), self.config.venv_path())
+            self.tor_handler = Creator.create_tor_handler(self.config.tor_password(), self.config.tor_port(),
+                                                          self.config.http_proxy(), self.config.venv_path(),
+                                                          self.config.tor_instances(),
+                                                          self.config.request_timeouts())
         self.actual_ip = self.tor_handler.get_ip()
 
-        self.downloader = Downloader(5, torhandler=self.tor_handler, restart_tor=self.config.restart_tor(), waiting_time=self.wait_request)
-        self.downloader.start()
-
         # Get the right scraper through the Creator class
         website = self.config.marketplace()
         product_category = self.config.macro_category()
@@ -89,13 +112,81 @@ class Crawler:
         if not self.captcha_detector:
             raise ValueError("Expected a non-None value from create_waiting_page_detector(), but got None")
 
-        self.cookie_handler = None
-        if self.config.has_cookies(seed):
-            self.cookie_handler = CookieHandler(self.seed, self.tor_handler, self.captcha_detector)
+        # The URL queue decides the download order (breadth-first or by expected image yield)
+        url_queue = Creator.create_url_queue(self.config.url_queue(), self.scraper)
+        if not url_queue:
+            raise ValueError(f"Invalid crawler.frontier value: {self.config.url_queue()}")
+
+        # Requests per second sent to the marketplace, by the downloader and the image saver
+        self.rate_limiter = rate_limiter
+        if not self.rate_limiter:
+            jitter = DEFAULT_JITTER if self.config.random_wait() else 0
+            self.rate_limiter = RateLimiter(self.config.requests_per_second(), jitter=jitter)
+
+        if self.config.engine() == "asyncio":
+            max_concurrency = self.config.async_concurrency()
+        else:
+            max_concurrency = self.config.max_concurrency()
+
+        # Number of requests in flight adapted to the latency, the errors, the waiting pages and the captchas
+        self.concurrency = None
+        if self.config.adaptive_concurrency():
+            self.concurrency = ConcurrencyController(max_concurrency)
+
+        # Delayed retries of the failed requests, with a backoff for each reason of failure
+        retries = RetryScheduler(budget_ratio=self.config.retry_budget())
+
+        # Other onion addresses of the marketplace, the URLs of the crawler stay on the host of the seed
+        self.mirrors = None
+        mirrors = self.config.mirrors(self.seed)
+        if mirrors:
+            self.mirrors = MirrorPool(self.seed, mirrors)
+            logger.info(f"{self.seed} - Mirrors: {', '.join(self.mirrors.hosts())}")
+
+        # Duplicates of the slowest requests through other circuits
+        self.hedger = None
+        if self.config.hedging():
+            self.hedger = Hedger(budget=self.config.hedge_budget())
+
+        if self.config.engine() == "asyncio":
+            self.downloader = AsyncDownloader(max_concurrency, torhandler=self.tor_handler,
+                                              restart_tor=self.config.restart_tor(), waiting_time=self.wait_request,
+                                              url_queue=url_queue, rate_limiter=self.rate_limiter,
+                                              concurrency=self.concurrency, retry_scheduler=retries,
+                                              hedger=self.hedger, mirrors=self.mirrors)
+        else:
+            self.downloader = Downloader(max_concurrency, torhandler=self.tor_handler,
+                                         restart_tor=self.config.restart_tor(), waiting_time=self.wait_request,
+                                         url_queue=url_queue, rate_limiter=self.rate_limiter,
+                                         concurrency=self.concurrency, retry_scheduler=retries,
+                                         hedger=self.hedger, mirrors=self.mirrors)
+        self.downloader.start()
+
+        # SimHash index of the crawled pages, to skip the near-duplicate pages
+        self.duplicate_index = None
+        if self.config.duplicate_distance() >= 0:
+            self.duplicate_index = SimHashIndex(self.config.duplicate_distance())
+
+        # Per-page checks and extractions
+        mirror_hosts = self.mirrors.hosts() if self.mirrors else ()
+        self.analyzer = PageAnalyzer(self.seed, self.scraper, self.captcha_detector, self.waiting_page_detector,
+                                     self.duplicate_index, mirror_hosts)
+        self.extraction_pool = extraction_pool
+        # Identifies the analyzer to be used by the worker processes
+        self.analyzer_spec = (website, product_category, micro, self.seed, mirror_hosts)
+
+        # Cookies shared with the other crawlers, extract_cookie.py and cookie_cli.py. The cookies of the YAML file
+        # are imported when it changes.
+        self.cookie_store = CookieStore(self.config.cookie_store_path())
+        self.cookie_store.import_config(self.config)
+        self.config.add_listener(self.cookie_store.import_config)
+        # The seeds requiring cookies do not change during the crawl
+        self.requires_cookies = self.cookie_store.requires_cookies(seed)
 
-            self.bucket_cookies = None
-            self.cookies = None
-            self.cookie_wait = False
+        self.cookie_handler = None
+        if self.requires_cookies:
+            self.cookie_handler = CookieHandler(self.seed, self.tor_handler, self.captcha_detector, self.cookie_store,
+                                                self.config.proactive_cookie_rotation())
 
         # Config info
         data_dir = self.config.data_dir()
@@ -106,19 +197,24 @@ class Crawler:
             project_name = f"{self.config.project_name()}-{today_tms}"
             project_path = os.path.join(data_dir, project_name)
 
-        if os.path.exists(project_path):
+        if resume and not os.path.isdir(project_path):
+            error_msg = f"Error: The project folder '{project_path}' to resume does not exist."
+            raise FileNotFoundError(error_msg)
+
+        if os.path.exists(project_path) and not resume:
             error_msg = f"Error: The project folder '{project_path}' already exists."
             raise FileExistsError(error_msg)
 
         os.makedirs(project_path, exist_ok=True)
+        self.resume = resume
 
         # Pages folder
         self.page_path = os.path.join(project_path, "pages")
-        os.makedirs(self.page_path)
+        os.makedirs(self.page_path, exist_ok=True)
 
         # Images folder
         self.image_path = os.path.join(project_path, "images")
-        os.makedirs(self.image_path)
+        os.makedirs(self.image_path, exist_ok=True)
 
         # Mapping images - data crawled
         self.image_mapping_path = os.path.join(self.image_path, "image_mapping.csv")
@@ -128,23 +224,56 @@ class Crawler:
                 csv_writer.writerow(["website", "image", "web_page", "url", "depth_node", "index_node", "title", "description", "vendor", "origin", "destination", "currency", "price", "cryptocurrency", "crypto_price", "macro_category", "micro_category"])
 
 
-        self.monitor = CrawlerMonitor(project_path)
+        self.monitor = CrawlerMonitor(project_path, resume=resume)
         self.monitor.start_scheduling()
 
+        # Crawl state stored on disk to resume the crawl after a crash
+        self.frontier = FrontierStore(project_path, self.seed)
+
+        # Previous crawl of the seed, for an incremental crawl
+        self.previous_crawl = None
+        if previous_project_path:
+            self.previous_crawl = PreviousCrawl(previous_project_path, self.seed, self.scraper.page_encoding)
+
         self.filesaver = FileSaver(self.page_path)
         self.filesaver.start()
 
         # Create the ImageSaver
         flag = bool(int(input("Are the images url of the seed encoded in base64? (0=no, 1= yes)\n")))
-        self.imagesaver = ImageSaver(website, self.image_path, self.image_mapping_path, product_category, micro, self.scraper, self.tor_handler, flag)
+        self.imagesaver = ImageSaver(website, self.image_path, self.image_mapping_path, product_category, micro, self.scraper, self.tor_handler, flag,
+                                     rate_limiter=self.rate_limiter, mirrors=self.mirrors)
         self.imagesaver.start()
     
     def require_cookies(self):
-        return self.config.requires_cookies(self.seed)
+        return self.requires_cookies
+
+    def wait_cookie(self) -> str:
+        """
+        Get a cookie from the store, waiting for a new cookie if there are none.
+        :return: the cookie
+        :raise TimeoutExpired: if no cookie arrives within MAX_COOKING_WAITING_TIME
+        """
+        cookie = self.cookie_handler.get_random_cookie(self.seed, validity_check=False)
+        if not cookie:
+            print("Waiting for new cookies...")
+            cookie = self.cookie_handler.wait_cookie(MAX_COOKING_WAITING_TIME)
+
+        if not cookie:
+            raise TimeoutExpired(MAX_COOKING_WAITING_TIME, "new cookies.")
+
+        return cookie
 
     def get_info(self):
         return self.monitor.get_info()
 
+    def parse_page(self, web_page) -> ParsedPage:
+        """
+        Parse the web page only once, with the encoding of the marketplace being crawled.
+        :param web_page: the web page retrieved from a request, or an already parsed page.
+        :return: a ParsedPage shared among all the checks on the web page
+        """
+        return self.scraper.parse(web_page)
+
     def get_webpage_url(self, webpage) -> str:
         if not webpage:
             return None
@@ -157,204 +286,130 @@ class Crawler:
     def extract_internal_buttons(self, web_page) -> list:
         """
         Extract the internal buttons of a web page
-        :param web_page: the web page
+        :param web_page: the web page, as a response or as a ParsedPage
         :return: list of links provided by the buttons in the web page
         """
-        print("Internal buttons extraction...")
-        logger.info(f"{self.seed} - Internal buttons extraction")
-        
-        website = self.config.marketplace()
-
-        # Make soup
-        soup = BeautifulSoup(web_page.content, "html.parser", from_encoding="iso-8859-1")
-        urls = set()
-
-        # Get all internal buttons
-        buttons = soup.findAll("button")
-        logger.info(f"Number of internal buttons: {len(buttons)}")
-
-        for button in buttons:
-            # Get the value attribute of the button
-            value = button.get("value")
-            # Get the button text
-            text_content = button.text.strip()
-
-            # Check if the button value and text are a digit and they are not None
-            if value and text_content and value.isnumeric() and text_content.isnumeric():
-                value = int(value)
-                if value != 0:
-                    url = urljoin(self.seed, f"?page={value}")
-                    urls.add(url)
-        
-        urls_list = list(urls)
-        print(f"Number of extracted button links: {len(urls_list)}")
-        logger.info(f"Number of extracted button links: {len(urls_list)}")
-        
-        return urls_list
+        return self.analyzer.extract_internal_buttons(self.parse_page(web_page))
     
     def extract_internal_links(self, web_page) -> list:
         """
         This function, using Beautifulsoup4, search for all the internal links (links of the same website)
         in a web page.
-        :param web_page: the web_page content retrieved from a request (return value of request.get function).
+        :param web_page: the web_page content retrieved from a request (return value of request.get function), or
+        its ParsedPage.
         :return: a list of url found in the web_page
         """
-        print("Internal link extraction...")
-        logger.info(f"{self.seed} - Internal link extraction")
-
-        request_url = web_page.request.url
-        logger.debug(f"{self.seed} - Internal links - Request URL -> {request_url}")
-        domain = urlparse(request_url).netloc
-
-        # Make soup
-        soup = BeautifulSoup(web_page.content, "html.parser", from_encoding="iso-8859-1")
-
-        urls = set()
-        
-        # Get product category expressed in the URL to filter the extracted URLs
-        url_category = self.scraper.get_url_category(self.seed)
-        
-        print(f"Category in url format: {url_category}")
-          
-        # Get all internal links
-        tags = soup.findAll("a")
-        print(f"Number of internal links {len(tags)}")
-        logger.info(f"Number of internal links {len(tags)}")
-        for a_tag in tags:
-            href = a_tag.attrs.get("href")
-            href = urljoin(request_url, href).strip("/")
-            # logger.debug(f"{self.market.upper()} - Internal links - Extracting link {href}")
-
-            if href == "" or href is None:
-                # href empty tag
-                continue
-
-            if urlparse(href).netloc != domain:
-                # external link
-                continue
-                
-            if "vendor" in href or "seller" in href:
-                # The internal link is not a products link
-                continue
-
-            if "#" in href:
-                # The internal link points to a section within the current web page
-                continue
-
-            if "login" in href:
-                # The internal link points to a login page
-                continue
-
-            if url_category not in href:
-                # The internal link points to a info page
-                continue
-            
-            urls.add(href)
-
-        urls_list = list(urls)
-        
-        print(f"Number of internal links extracted: {len(urls_list)}")
-        logger.info(f"Number of internal links extracted: {len(urls_list)}")
-
-        # Get the internal links provided by the buttons
-        buttons_url = self.extract_internal_buttons(web_page)
-
-        # Concatenate the two lists
-        urls_list = urls_list + buttons_url
-        
-        return urls_list
+        return self.analyzer.extract_internal_links(self.parse_page(web_page))
 
     def extract_internal_images(self, web_page) -> list:
         """
         Extract all the images on the web page
-        :param web_page: the web_page content retrieved from a request (return value of request.get function).
+        :param web_page: the web_page content retrieved from a request (return value of request.get function), or
+        its ParsedPage.
         :return: a list of images in the web page given as input
         """
-        print("Extracting internal images...")
-        logger.info(f"{self.seed} - Internal images extraction")
-        images = list()
-
-        # Make soup
-        soup = BeautifulSoup(web_page.content, "html.parser", from_encoding="iso-8859-1")
-
-        # Get all images
-        tags = soup.findAll("img")
-        print(f"Number of img tags found in the web page is: {len(tags)}")
-        logger.info(f"Number of img tags found in the web page is: {len(tags)}")
-        
-        for img_tag in tags:
-
-            # Check if the image is valid
-            if self.scraper.check_image(img_tag): 
-                src_tag = None
-                try:
-                    src_tag = img_tag["src"]
-                except KeyError:
-                    print(f"Found <img> tag without 'src' attribute")
-                    logger.warning(f"{self.seed} - Found <img> tag without 'src' attribute")
-                    continue 
-
-                # Check the image extension
-                if "jpg" in src_tag or "jpeg" in src_tag or "png" in src_tag:
-                    images.append(src_tag)
-                else:
-                    logger.info(f"{self.seed} - The image {src_tag} hasn't the right extension")
-
-        print(f"Number of images to download for this web page: {len(images)}")
-        logger.info(f"Number of images to download for this web page: {len(images)}")
-        return images
+        return self.analyzer.extract_internal_images(self.parse_page(web_page))
 
     def check_webpage_lang(self, web_page) -> bool:
         """
         Check if the web page language is in english
-        :param web_page: tweb page content
+        :param web_page: tweb page content, as a response or as a ParsedPage
         :return: True if the web page content is in english, false otherwise
         """
-        print("Checking the web page language...")
-        # Make soup
-        soup = BeautifulSoup(web_page.content, "html.parser", from_encoding="iso-8859-1")
-        html_tag = soup.find("html")
+        return self.analyzer.check_webpage_lang(self.parse_page(web_page))
 
-        if html_tag and html_tag.get("lang") == "en":
-            print("The web page is written in english")
-            return True
-        else:
-            return False
+    def analyze_page(self, web_page, extract_images:bool) -> PageAnalysis:
+        """
+        Run all the checks and extractions on the web page. The page is sent to a worker process when the crawler
+        has an extraction pool, otherwise it is parsed once in the current thread.
+        :param web_page: the web page retrieved from a request
+        :param extract_images: False to skip the images extraction
+        :return: a PageAnalysis
+        """
+        if self.extraction_pool:
+            analysis = self.extraction_pool.analyze(self.analyzer_spec, web_page, extract_images)
+            self.scraper.merge_state(analysis.scraper_state)
+            return analysis
 
+        page = self.parse_page(web_page)
+        try:
+            return self.analyzer.analyze(page, web_page.status_code, extract_images)
+        finally:
+            # Release the parsed tree of the analyzed web page
+            page.release()
 
-    def enqueue_url(self, url:str) -> None:
+    def get_request_args(self, url:str, conditional:bool =True) -> tuple:
         """
-        Add the next URL to be crawled and a cookie in the downloader queue.
+        Get the cookie and the additional headers of a request.
 
         :param url: the URL to be crawled.
-        :return: None
+        :param conditional: in an incremental crawl, False to request the URL without the conditional headers.
+        :return: the tuple (cookie, headers)
         """
         # TOR request
         cookie = None
 
         if self.require_cookies():
-            # Try to acquire a new cookie
-            cookie = self.cookie_handler.get_random_cookie(url, validity_check=False)
+            # Acquire a cookie, waiting for new cookies if the store is empty
+            cookie = self.wait_cookie()
 
-            # No cookies in yml file. Wait new cookies
-            if not cookie:
-                cookie = wait(lambda: self.cookie_handler.get_random_cookie(url, validity_check=False),
-                              sleep_seconds=1, timeout_seconds=MAX_COOKING_WAITING_TIME, waiting_for="waiting for new cookies.")
+        headers = None
+        if self.previous_crawl and conditional:
+            headers = self.previous_crawl.conditional_headers(url)
 
-        self.downloader.enqueue(url, cookie)
+        return cookie, headers
 
-    def validate(self, web_page) -> bool:
+    def enqueue_url(self, url:str, depth:int =0, conditional:bool =True) -> None:
+        """
+        Add the next URL to be crawled and a cookie in the downloader queue.
+
+        :param url: the URL to be crawled.
+        :param depth: the depth of the URL in the crawling graph.
+        :param conditional: in an incremental crawl, False to request the URL without the conditional headers.
+        :return: None
+        """
+        cookie, headers = self.get_request_args(url, conditional)
+
+        self.frontier.set_state(url, PENDING)
+        self.downloader.enqueue(url, cookie, depth, headers)
+
+    def retry_url(self, url:str, depth:int, reason:str, delay:float =None) -> bool:
+        """
+        Schedule a new request of a URL, after the backoff delay of the reason.
+
+        :param url: the URL to be crawled again.
+        :param depth: the depth of the URL in the crawling graph.
+        :param reason: the reason of the retry (e.g., retry.ERROR, retry.CAPTCHA).
+        :param delay: the seconds to wait advertised by the server or by the page, if any.
+        :return: True if the retry has been scheduled, False if the URL has no retries left.
+        """
+        cookie, headers = self.get_request_args(url)
+
+        delay = self.downloader.retry(url, cookie, reason, depth, headers, delay)
+        if delay is None:
+            return False
+
+        self.frontier.set_state(url, PENDING)
+        self.frontier.set_retries(url, self.downloader.retry_attempts(url, ERROR),
+                                  self.downloader.retry_attempts(url, CAPTCHA))
+        return True
+
+    def validate(self, web_page, captcha_images:bool =None) -> bool:
         """
         Check if the url content is valid, without captchas or without any anomalous redirection.
         If something is found, then the cookie used for that page is removed.
         :param web_page: the web page to validate
+        :param captcha_images: whether the page contains captcha images, if it has already been analyzed.
         :return: True, if the page contains no captchas or anomalous redirect, False otherwise.
         """
 
-        if not self.config.has_cookies(self.seed):
+        if not self.require_cookies():
             return True
 
-        captcha = captcha_detector(web_page.url, web_page)
+        if captcha_images is None:
+            captcha = captcha_detector(web_page.url, web_page)
+        else:
+            captcha = captcha_images and anomalous_redirection(web_page.url, web_page)
         login_redirect = True
         if self.login_page:
             login_redirection(web_page, self.login_page)
@@ -374,16 +429,13 @@ class Crawler:
         Method to execute the crawler.
         :return: no return value. All the web_pages will be saved in a dump folder.
         """
-        # Track visited URLs to avoid duplicates
-        visited = {}
-        unvisited_links = set()
         try:
             if not self.seed:
                 logger.error(f"No valid seed -> {self.seed}")
                 raise InvalidURLException(f"No valid seed -> {self.seed}")
 
             print("Saving the login page...")
-            if self.config.has_cookies(self.seed):
+            if self.require_cookies():
                 # Assumption: all the markets with no valid cookies redirect to the same page with the same url
                 logger.info(f"{self.seed} - Send a request without cookie to store the login redirect url")
 
@@ -391,12 +443,19 @@ class Crawler:
                 self.cookie_handler.nocookiepage = self.login_page
                 # logger.info(f"{self.market.upper()} - URL no cookie default redirect -> {self.loginpage.url}")
 
-                # Get a valid cookie among the cookies stored in the market configuration file
-                self.cookie_handler.cookies_validity_check(self.seed)
+                # Validate the stored cookies in the background, waiting only for the first valid one
+                self.cookie_handler.start_health_pool(self.seed, self.config.cookie_validation_concurrency(),
+                                                      self.config.cookie_recheck_interval())
 
-            # Create a queue for BFS
-            self.enqueue_url(self.seed)
-            node_index = 0
+            # Reload the crawl state stored on disk. It is empty for a new crawl.
+            unvisited_links = None
+            if self.config.bloom_filter():
+                unvisited_links = BloomFilter(self.max_link, self.config.bloom_filter_error_rate())
+            state = self.frontier.load(unvisited_links)
+
+            # Track visited URLs to avoid duplicates. The table assigns the node indices and stores the node depths.
+            visited = state.visited
+            unvisited_links = state.unvisited_links
 
             # Crawling iter condition
             # 1. all the urls are crawled
@@ -404,11 +463,24 @@ class Crawler:
             # 3. the maximum allowed number of links, defined in the config.ini file, has been reached
             # 4. expiration time defined in the config.ini file
             cookie_timeout = False
-            start_time = time.time()
-            n_links_crawled = 0
-            url_depth = {self.seed: 0}
-            url_attempts = {}
-            retry_counts = {}
+            start_time = time.time() - state.elapsed_time
+            n_links_crawled = state.n_links_crawled
+
+            # The retries counted by a previous execution
+            self.downloader.retries.restore(state.retry_counts, ERROR)
+            self.downloader.retries.restore(state.url_attempts, CAPTCHA)
+
+            # Create a queue for BFS
+            if self.frontier.is_empty():
+                seed_index = visited.add(self.seed, 0)
+                self.monitor.add_node(self.seed, seed_index, 0, str(seed_index)+".html")
+                self.frontier.add_node(self.seed, seed_index, 0)
+                self.enqueue_url(self.seed, 0)
+            else:
+                print(f"Resuming the crawl: {len(state.pending)} links to be crawled")
+                logger.info(f"{self.seed} - Resuming the crawl: {len(state.pending)} links to be crawled")
+                for link in state.pending:
+                    self.enqueue_url(link, visited.depth(link) or 0)
 
             n_images = 0
             n_wrong_category = 0
@@ -420,209 +492,250 @@ class Crawler:
                 #count += 1
 
                 try:
-                    #ottiene tutti i task completati, quindi le pagine del dark web
-                    url_futures = self.downloader.get_results()
-                    logger.debug(f"{self.seed} - CRAWLER: futures len -> {len(url_futures)}")
+                    # Wait for the next downloaded page, in completion order
+                    download = self.downloader.get_result(timeout=RESULT_TIMEOUT)
 
-                    # If no pages are available, wait for the thread to complete.
-                    if not url_futures:
-                        time.sleep(0.1)
+                    # No page completed within the timeout. Check again the crawling conditions.
+                    if not download:
                         continue
 
                     self.monitor.update_tor_requests(self.tor_handler.n_requests_sent)
-
-                    for url, future in url_futures:
-                        logger.info(f"*********** Analyzing the url {url} ***********")
-                        if url in visited:
-                            print(f"*********** Analyzing the node {visited[url]} ***********")
+                    if self.concurrency:
+                        self.monitor.update_concurrency(self.concurrency.snapshot())
+                    if self.hedger:
+                        self.monitor.update_hedging(self.hedger.stats())
+                    if self.cookie_handler and self.cookie_handler.rotation:
+                        self.monitor.update_cookies(self.cookie_handler.rotation.stats())
+
+                    url = download.url
+                    # The url leaves the frontier, unless it is enqueued again
+                    self.frontier.set_state(url, DROPPED)
+                    logger.info(f"*********** Analyzing the url {url} ***********")
+                    print(f"*********** Analyzing the node {visited.get(url)} ***********")
+                    
+                    used_cookie = None
+                    try:
+                        # Get the web page and the used cookie
+                        web_page, used_cookie = download.result()
+                        print(f"The url of the web page requested is: {web_page.url}")
+                    except Exception as e:
+                        print(f"ERROR with this url: {url}")
+                        reason = ERROR
+                        if is_timeout(e):
+                            reason = TIMEOUT
+                            self.monitor.add_timeout(int(time.time()), url, self.actual_ip, round(download.elapsed(), 1))
+
+                        # Retry to crawl the web page later, only if the error is temporary and the url has retries left
+                        if is_retryable_exception(e) and self.retry_url(url, visited.depth(url) or 0, reason):
+                            print("Retry with this url later")
+                            logger.debug(f"Error while downloading the url -> {url}. RETRY. Attempts: {self.downloader.retry_attempts(url, reason)}")
                         else:
-                            print(f"*********** Analyzing the node {node_index} ***********")
-                        
-                        used_cookie = None
-                        try:
-                            # Get the web page and the used cookie
-                            web_page, used_cookie = future.result()
-                            print(f"The url of the web page requested is: {web_page.url}")
-                        except Exception as e:
-                            print(f"ERROR with this url: {url}")
-                            
-                            # Retry to crawl the web page only if the number of attempts is less than the maximum
-                            if url not in retry_counts:
-                                print("Retry with this url later")
-                                logger.debug(f"Error while downloading the url -> {url}. RETRY.")
-                                retry_counts[url] = 1
-                                self.enqueue_url(url)
-                            elif retry_counts[url] < MAX_RETRIES:
-                                retry_counts[url] += 1
-                                print("Retry with this url later")
-                                logger.debug(f"Error while downloading the url -> {url}. RETRY. Attempts: {retry_counts[url]}")
-                                self.enqueue_url(url)
-                            else:
-                                print("Error while processing a webpage. SKIP.")
-                                logger.error(f"{url} - Error while processing a webpage. SKIP.")
-                                logger.error(f"{url} - Error msg: {str(e)}")
-                                self.monitor.add_info_unvisited_page(int(time.time()), url, self.actual_ip, "ERROR")
-                            continue
+                            print("Error while processing a webpage. SKIP.")
+                            logger.error(f"{url} - Error while processing a webpage. SKIP.")
+                            logger.error(f"{url} - Error msg: {str(e)}")
+                            self.monitor.add_info_unvisited_page(int(time.time()), url, self.actual_ip, reason)
+                        continue
 
-                        if not web_page:
-                            continue
+                    if not web_page:
+                        continue
 
-                        # Check whether the web page is a waiting page
-                        if self.waiting_page_detector.is_waiting_page(web_page.content):
-                            print(f"Detect a waiting page for URL: {url}")
-                            logger.debug(f"Detect a waiting page for URL: {url}. RETRY.")
+                    # Incremental crawl: check whether the page changed since the previous crawl
+                    unchanged = False
+                    page_hash = None
+                    if self.previous_crawl:
+                        unchanged = self.previous_crawl.is_unchanged(url, web_page)
 
-                            # Retry to crawl the web page later
-                            self.enqueue_url(url)
-                            continue
+                        if web_page.status_code == NOT_MODIFIED:
+                            # Analyze the page stored by the previous crawl
+                            page_hash = self.previous_crawl.get_content_hash(url)
+                            web_page = self.previous_crawl.reload_page(url, web_page)
 
-                        # Check whether the web page is valid or not.
-                        if self.captcha_detector.has_captcha(web_page.content) or not self.validate(web_page):
-                            print("The web page contains a captcha")
-                            # self.filesaver.enqueue(web_page, visited[url])
-
-                            # Remove the used cookie
-                            self.cookie_handler.remove_cookie(used_cookie)
-                            # Re-add the URL to the Downloader list
-                            if url not in url_attempts:
-                                url_attempts[url] = 1
-                                self.enqueue_url(url)
-                                logger.debug(f"{self.seed} - Error while downloading the url -> {url}. RETRY.")
-                            elif url_attempts[url] < MAX_RETRIES:
-                                url_attempts[url] += 1
-                                self.enqueue_url(url)
-                                logger.debug(f"{self.seed} - Error while downloading the url -> {url}. RETRY.")
-                            else:
-                                logger.error(f"{self.seed} - Error while downloading the url -> {url}. SKIPPED.")
-                                self.monitor.add_info_unvisited_page(int(time.time()), url, self.actual_ip, "ERROR")
-                            
-                            continue
+                            if not web_page:
+                                logger.info(f"{self.seed} - Page not modified, but not stored by the previous crawl: {url}. RETRY.")
+                                self.enqueue_url(url, visited.depth(url) or 0, conditional=False)
+                                continue
 
-                        # STATUS CODE CHECK
-                        if web_page.status_code < 200 or web_page.status_code >= 300:
-                            self.monitor.add_info_page(int(time.time()), url, self.actual_ip, web_page.status_code)
-                            continue
-                        
-                        # Check if the page is written in English
-                        if not self.check_webpage_lang(web_page):
-                            print("The current web page is not written in English")
-                            logger.info(f"The current web page is not written in English. URL: {url}")
-                            # self.filesaver.enqueue(web_page, visited[url]) 
-                            continue
-                        
-                        # Check if the current web page is in the right category
-                        if not self.scraper.check_category(web_page):
-                            print(f"The web page category is wrong. URL: {url}")
-                            logger.info(f"The web page category is wrong. URL: {url}")
-                            n_wrong_category += 1
-
-                            # Save it to inspect afterwards
-                            # self.filesaver.enqueue(web_page, visited[url])
-                            continue
+                    # Analyze the web page, in a worker process if an extraction pool is available
+                    try:
+                        analysis = self.analyze_page(web_page, extract_images=visited.get(url) != 0) # To jump the image in the seed
+                    except AnalysisError as e:
+                        # Retry to crawl the web page later, only if the url has retries left
+                        if self.retry_url(url, visited.depth(url) or 0, ERROR):
+                            logger.debug(f"{self.seed} - {e}. RETRY.")
+                        else:
+                            print(f"{e}. SKIP.")
+                            logger.error(f"{self.seed} - {e}. SKIP.")
+                            self.monitor.add_info_unvisited_page(int(time.time()), url, self.actual_ip, "ANALYSIS ERROR")
+                        continue
 
-                        # Extract all the internal link in the web page
-                        try:
-                            internal_urls = self.extract_internal_links(web_page)
-                            logger.debug(f"{self.seed} - Internal links: {len(internal_urls)}.")
-                        except Exception as e:
-                            logger.error(f"{self.seed} - Internal link extraction failed..")
-                            logger.error(f"{self.seed} - Error msg: {str(e)}")
-                            print("Internal link extraction failed...")
-                            print(f"Error message: {str(e)}")
-                            continue
-                        
-                        # Extract all the images in the web page
-                        internal_images = None
-                        if node_index != 0: # To jump the image in the seed
-                            try:
-                                internal_images = self.extract_internal_images(web_page)
-                                n_images += len(internal_images)
-                            except Exception as e:
-                                logger.error(f"{self.seed} - Internal images extraction failed..")
-                                logger.error(f"{self.seed} - Error msg: {str(e)}")
-                                print("Internal images extraction failed...")
-                                print(f"Error message: {str(e)}")
-                                continue
+                    # Check whether the web page is a waiting page
+                    if analysis.waiting_page:
+                        print(f"Detect a waiting page for URL: {url}")
+                        logger.debug(f"Detect a waiting page for URL: {url}. RETRY.")
+                        self.downloader.report(url, used_cookie, WAITING_PAGE)
+                        if used_cookie:
+                            self.cookie_store.record_failure(self.seed, used_cookie)
+
+                        # Retry to crawl the web page later, at the time advertised by the page if any
+                        if not self.retry_url(url, visited.depth(url) or 0, WAITING_PAGE, analysis.wait_time):
+                            logger.error(f"{self.seed} - Waiting page for the url -> {url}. SKIPPED.")
+                            self.monitor.add_info_unvisited_page(int(time.time()), url, self.actual_ip, "WAITING PAGE")
+                        continue
 
-                        # Get product information only if the crawler captures at least one image to download.
-                        product_information = None
-                        if internal_images and len(internal_images)>0:
-                            product_information = self.scraper.extract_product_information(web_page)
-
-                        try:
-                            logger.debug(f"{self.seed} - URL: {url}.")
-                            depth = url_depth[url]
-                            logger.debug(f"{self.seed} - DEPTH: {depth}.")
-                            del url_depth[url]
-                        except Exception as e:
-                            logger.error(f"{self.seed} - URL DEPTH.")
-                            logger.error(f"{self.seed} - Error msg: {str(e)}")
-                            raise e
-
-                        # Add the url in the visited list
-                        if url not in visited:
-                            print("Add web page in the visited list")
-                            visited[url] = node_index
-                            self.monitor.add_node(url, node_index, depth, str(node_index)+".html")
-                            node_index += 1
+                    # Check whether the web page is valid or not.
+                    if analysis.has_captcha or not self.validate(web_page, analysis.captcha_images):
+                        print("The web page contains a captcha")
+                        self.downloader.report(url, used_cookie, CAPTCHA)
+                        # self.filesaver.enqueue(web_page, visited[url])
+
+                        # Remove the used cookie and drop the circuits isolated for it and for its duplicate requests
+                        if used_cookie:
+                            self.cookie_handler.retire_cookie(used_cookie, EXPIRED)
+                        # Retry to crawl the web page later, with another cookie
+                        if self.retry_url(url, visited.depth(url) or 0, CAPTCHA):
+                            logger.debug(f"{self.seed} - Error while downloading the url -> {url}. RETRY.")
+                        else:
+                            logger.error(f"{self.seed} - Error while downloading the url -> {url}. SKIPPED.")
+                            self.monitor.add_info_unvisited_page(int(time.time()), url, self.actual_ip, "ERROR")
+                        
+                        continue
 
+                    # STATUS CODE CHECK
+                    if web_page.status_code < 200 or web_page.status_code >= 300:
                         self.monitor.add_info_page(int(time.time()), url, self.actual_ip, web_page.status_code)
+                        # Only an authorization error says something about the cookie
+                        if used_cookie and web_page.status_code in COOKIE_FAILURE_STATUS_CODES:
+                            self.cookie_store.record_failure(self.seed, used_cookie)
+
+                        # Temporary errors are retried, at the time advertised by the Retry-After header if any
+                        if is_retryable_status(web_page.status_code) and \
+                                self.retry_url(url, visited.depth(url) or 0, HTTP_STATUS, retry_after(web_page)):
+                            logger.debug(f"{self.seed} - Status code {web_page.status_code} for the url -> {url}. RETRY.")
+                        continue
 
-                        # Save the node_index of the actual url
-                        actual_url_node_index = visited[url]
+                    # Report the image yield of the page, to prioritize the URLs of the most productive patterns
+                    self.downloader.observe(url, len(analysis.internal_images or []))
 
-                        # Enqueue new links and add edges
-                        if internal_urls and len(internal_urls)>0:
-                        
-                            print("Saving the internal links in the downloader queue...")
-                            for link in internal_urls:
-                                # Skip the link if the deep level is at least equal to the max deep level (configuration
-                                # setting)
-                                if depth + 1 > self.max_depth:
-                                    logger.info(f"{self.seed} - URL {link}: depth value greater than {self.max_depth}. IGNORED.")
-                                    unvisited_links.add(link)
-                                    self.monitor.add_info_unvisited_page(int(time.time()), link, self.actual_ip, "MAX DEPTH")
-                                else:
-                                    if link not in visited and link not in unvisited_links:
-                                        url_depth[link] = depth + 1
-
-                                        # Save scheduled page
-                                        self.monitor.add_scheduled_page(int(time.time()), link, self.actual_ip, depth + 1)
-
-                                        self.enqueue_url(link)
-                                        visited[link] = node_index #per non riprendere il link
-                                        self.monitor.add_node(link, node_index, depth + 1, str(node_index)+".html")
-                                        node_index += 1
-
-                                    self.monitor.add_edge(visited[url], visited[link])
-
-                        # Get a cookie to make a Tor request to download images
-                        cookie = None
-                        if self.require_cookies():
-                            # Try to acquire a new cookie
-                            cookie = self.cookie_handler.get_random_cookie(url, validity_check=False)
-
-                        # No cookies in yml file. Wait new cookies
-                        if not cookie:
-                            cookie = wait(lambda: self.cookie_handler.get_random_cookie(url, validity_check=False),
-                                        sleep_seconds=1, timeout_seconds=MAX_COOKING_WAITING_TIME, waiting_for="waiting for new cookies.")
+                    # Check if the page is written in English
+                    if not analysis.english:
+                        print("The current web page is not written in English")
+                        logger.info(f"The current web page is not written in English. URL: {url}")
+                        # self.filesaver.enqueue(web_page, visited[url]) 
+                        continue
+                    
+                    # Check if the current web page is in the right category
+                    if not analysis.right_category:
+                        print(f"The web page category is wrong. URL: {url}")
+                        logger.info(f"The web page category is wrong. URL: {url}")
+                        n_wrong_category += 1
+
+                        # Save it to inspect afterwards
+                        # self.filesaver.enqueue(web_page, visited[url])
+                        continue
+
+                    # Internal links and images extraction
+                    if analysis.error:
+                        logger.error(f"{self.seed} - {analysis.error}")
+                        print(analysis.error)
+                        continue
+
+                    # Skip the near-duplicate pages (pagination past the last page, sort-order variants...)
+                    if self.duplicate_index is not None:
+                        duplicate_of = self.duplicate_index.find(analysis.simhash)
+                        if duplicate_of is not None:
+                            print(f"The web page is a near-duplicate of the node {duplicate_of}. URL: {url}")
+                            logger.info(f"{self.seed} - The web page is a near-duplicate of the node {duplicate_of}. URL: {url}")
+                            self.monitor.add_info_unvisited_page(int(time.time()), url, self.actual_ip, "DUPLICATE")
+                            continue
+
+                        self.duplicate_index.add(analysis.simhash, visited[url])
+
+                    internal_urls = analysis.internal_links
+                    logger.debug(f"{self.seed} - Internal links: {len(internal_urls)}.")
+
+                    internal_images = analysis.internal_images
+                    if internal_images:
+                        n_images += len(internal_images)
+
+                    # Product information, available only if the crawler captures at least one image to download.
+                    product_information = analysis.product_information
+                    if product_information:
+                        product_information = self.scraper.complete_product_information(web_page.url, product_information)
+
+                    logger.debug(f"{self.seed} - URL: {url}.")
+                    depth = visited.depth(url)
+                    if depth is None:
+                        logger.error(f"{self.seed} - URL DEPTH.")
+                        raise KeyError(f"No depth stored for the url {url}")
+                    logger.debug(f"{self.seed} - DEPTH: {depth}.")
+
+                    self.monitor.add_info_page(int(time.time()), url, self.actual_ip, web_page.status_code)
+
+                    # Save the node_index of the actual url
+                    actual_url_node_index = visited[url]
+
+                    # Enqueue new links and add edges
+                    if internal_urls and len(internal_urls)>0:
+                    
+                        print("Saving the internal links in the downloader queue...")
+                        for link in internal_urls:
+                            # Skip the link if the deep level is at least equal to the max deep level (configuration
+                            # setting)
+                            if depth + 1 > self.max_depth:
+                                logger.info(f"{self.seed} - URL {link}: depth value greater than {self.max_depth}. IGNORED.")
+                                unvisited_links.add(link)
+                                self.frontier.add_unvisited(link)
+                                self.monitor.add_info_unvisited_page(int(time.time()), link, self.actual_ip, "MAX DEPTH")
+                            else:
+                                if link not in visited and link not in unvisited_links:
+                                    # Save scheduled page
+                                    self.monitor.add_scheduled_page(int(time.time()), link, self.actual_ip, depth + 1)
+
+                                    link_index = visited.add(link, depth + 1) #per non riprendere il link
+                                    self.frontier.add_node(link, link_index, depth + 1)
+                                    self.enqueue_url(link, depth + 1)
+                                    self.monitor.add_node(link, link_index, depth + 1, str(link_index)+".html")
+
+                                link_index = visited.get(link)
+                                if link_index is not None:
+                                    self.monitor.add_edge(actual_url_node_index, link_index)
+
+                    # Get a cookie to make a Tor request to download images
+                    cookie = None
+                    if self.require_cookies():
+                        # Acquire a cookie, waiting for new cookies if the store is empty
+                        cookie = self.wait_cookie()
+                    
+                    # Images of an unchanged product page already downloaded by the previous crawl
+                    previous_images = []
+                    if unchanged and actual_url_node_index != 0 and internal_images:
+                        previous_images = self.previous_crawl.get_image_rows(url)
+
+                    # Save the images
+                    if previous_images:
+                        print("Unchanged web page: carrying forward the images of the previous crawl...")
+                        logger.info(f"{self.seed} - Unchanged web page: {len(previous_images)} images carried forward. URL: {url}")
+                        self.imagesaver.add_references(previous_images, url, actual_url_node_index, depth,
+                                                       self.previous_crawl.image_path)
+                    elif actual_url_node_index != 0 and internal_images and len(internal_images)>0:
+                        print("Saving the internal images in the ImageSaver queue...")
+                        i = 0
+                        for img in internal_images:
+                            self.imagesaver.enqueue(img, url, actual_url_node_index, depth, cookie, i, product_information)
+                            i += 1
                         
-                        # Save the images
-                        if actual_url_node_index != 0 and internal_images and len(internal_images)>0:
-                            print("Saving the internal images in the ImageSaver queue...")
-                            i = 0
-                            for img in internal_images:
-                                self.imagesaver.enqueue(img, url, actual_url_node_index, depth, cookie, i, product_information)
-                                i += 1
-                            
-
-                        # Save the html page
-                        print("Saving the html script in the FileSaver queue...\n")
-                        self.filesaver.enqueue(web_page, visited[url])
-
-                        n_links_crawled += 1
-                        print("************************\n")
-                        logger.info("************************\n")
+
+                    # Save the html page
+                    print("Saving the html script in the FileSaver queue...\n")
+                    self.filesaver.enqueue(web_page, visited[url])
+
+                    self.frontier.set_state(url, CRAWLED)
+                    # Validators used by the next incremental crawl
+                    self.frontier.set_page_validators(url, web_page.headers.get("ETag"), web_page.headers.get("Last-Modified"),
+                                                      page_hash if page_hash else content_hash(web_page))
+                    n_links_crawled += 1
+                    print("************************\n")
+                    logger.info("************************\n")
                 except TimeoutExpired as te:
                     logger.error(f"{self.seed} - Cookie timeout expired.")
                     logger.error(f"{self.seed} - Error msg: {str(te)}")
@@ -649,6 +762,13 @@ class Crawler:
 
         self.downloader.stop()
         self.monitor.stop_program()
+        self.frontier.close()
+        if self.cookie_handler:
+            self.cookie_handler.stop()
+        self.config.remove_listener(self.cookie_store.import_config)
+        self.cookie_store.close()
+        if self.previous_crawl:
+            self.previous_crawl.close()
 
         # Waiting that the image saver queue is empty
         print("Waiting the IMAGE SAVER...")
@@ -4,6 +4,9 @@ from detectors import CaptchaDetector, WaitingPageDetector
 from detectors import DrughubCaptchaDetector, DrughubWaitingPageDetector, CocoricoCaptchaDetector, CocoricoWaitingPageDetector
 from extractors import BaseCookieExtractor, CocoricoCookieExtractor, DrughubCookieExtractor
 from handler import TorHandler
+from tor_pool import TorPool
+from deadlines import build_timeouts
+from url_queue import URLQueue, FIFOQueue, PriorityQueue
 
 class Creator:
     """
@@ -63,23 +66,64 @@ class Creator:
                 return None
             
     @staticmethod
-    def create_cookie_extractor(tor_handler:TorHandler, homepage_url:str, seed:str, waiting_time:int, attempts:int, ) -> BaseCookieExtractor:
+    def create_url_queue(kind: str, scraper: Scraper) -> URLQueue:
+        """
+        Return the queue deciding the download order of the URLs.
+        :param kind: 'fifo' for a breadth-first crawl, 'priority' to download first the URLs with the highest
+        expected image yield
+        :param scraper: the scraper of the marketplace being crawled
+        :return: a subclass of URLQueue
+        """
+
+        kind = kind.strip().lower()
+        match kind:
+            case "fifo":
+                return FIFOQueue()
+            case "priority":
+                return PriorityQueue(scraper)
+            case _:
+                return None
+
+    @staticmethod
+    def create_cookie_extractor(website:str, tor_handler:TorHandler, homepage_url:str, seed:str, waiting_time:int,
+                                attempts:int, identity:str =None) -> BaseCookieExtractor:
         """
         Create the right cookie extractor instance
         
+        :param website: website name from which to extract the cookies
         :param tor_handler:  an instance of TorHandler to handle HTTP requests
         :param homepage_url: the homepage url of the website to be crawled
         :param seed: the seed URL to be crawled
         :param waiting_time: the delay from two HTTP request
         :param attempts: number of attempts for the second HTTP request to obtain the session cookie
+        :param identity: the identity whose isolated circuits are used by the extractor, None for the shared circuits
         :return: a cookie extractor
         """
 
         website = website.strip().lower()
         match website:
             case "drughub":
-                return DrughubCookieExtractor(tor_handler, homepage_url, seed, waiting_time, attempts)
+                return DrughubCookieExtractor(tor_handler, homepage_url, seed, waiting_time, attempts, identity)
             case "cocorico":
-                return CocoricoCookieExtractor(tor_handler, homepage_url, seed, waiting_time, attempts)
+                return CocoricoCookieExtractor(tor_handler, homepage_url, seed, waiting_time, attempts, identity)
             case _:
-                return None
\ No newline at end of file
+                return None
+
+    @staticmethod
+    def create_tor_handler(tor_password: str, tor_port: int, proxy: str, venv_path: str, tor_instances: list = None,
+                           timeouts: dict = None) -> TorHandler:
+        """
+        Returns a TorPool if several Tor instances are configured, a TorHandler otherwise
+        :param tor_password: the password of the Tor control ports
+        :param tor_port: the control port of the single Tor instance
+        :param proxy: the SOCKS proxy of the single Tor instance
+        :param venv_path: the path to the python virtual environment
+        :param tor_instances: the list of (control port, SOCKS proxy) pairs of the Tor pool
+        :param timeouts: request type -> maximum number of seconds of a request, see deadlines.build_timeouts
+        :return: an instance of TorHandler
+        """
+        request_timeouts = build_timeouts(timeouts)
+        if tor_instances:
+            return TorPool(tor_password, tor_instances, venv_path, request_timeouts)
+
+        return TorHandler(tor_password, tor_port, proxy, venv_path, timeouts=request_timeouts)
@@ -0,0 +1,139 @@
+import time
+import heapq
+import logging
+import itertools
+import threading
+
+logger = logging.getLogger("CRATOR")
+
+# Types of the requests sent through Tor, each one with its own timeouts
+PAGE = "page"
+IMAGE = "image"
+COOKIE_VALIDATION = "cookie_validation"
+IP_CHECK = "ip_check"
+
+CONNECT_TIMEOUT = 30    # seconds to open the connection through the circuit
+
+
+class RequestTimeout:
+    """
+    Timeouts of a type of request.
+    The read timeout of requests bounds each read on the socket, not the whole download: a server sending a byte every
+    few seconds keeps the request alive forever. The deadline bounds the whole request, and it is enforced by the
+    Watchdog of the downloaders.
+    """
+    def __init__(self, deadline:float, connect:float =CONNECT_TIMEOUT):
+        """
+        :param deadline: the maximum number of seconds of the whole request
+        :param connect: the maximum number of seconds to open the connection
+        """
+        self.deadline = deadline
+        self.connect = min(connect, deadline)
+
+    def requests_timeout(self) -> tuple:
+        """
+        :return: the (connect, read) timeout accepted by requests
+        """
+        return self.connect, self.deadline
+
+
+DEFAULT_TIMEOUTS = {
+    PAGE: RequestTimeout(deadline=120),
+    IMAGE: RequestTimeout(deadline=90),
+    COOKIE_VALIDATION: RequestTimeout(deadline=60),
+    IP_CHECK: RequestTimeout(deadline=30),
+}
+
+
+def build_timeouts(deadlines:dict =None) -> dict:
+    """
+    :param deadlines: request type -> maximum number of seconds of the whole request, and "connect" -> maximum number
+    of seconds to open a connection. The missing values keep their default.
+    :return: request type -> RequestTimeout
+    """
+    deadlines = deadlines or {}
+    connect = deadlines.get("connect", CONNECT_TIMEOUT)
+    return {request_type: RequestTimeout(deadlines.get(request_type, default.deadline), connect)
+            for request_type, default in DEFAULT_TIMEOUTS.items()}
+
+
+class Watchdog:
+    """
+    Thread calling a callback when a watched task exceeds its deadline, e.g. a download stuck on a dead circuit.
+    A task is either unwatched by its owner or expired by the watchdog, never both: the caller of unwatch knows whether
+    the task has already been handled as expired.
+    The thread is started at the first watched task.
+    """
+    def __init__(self):
+        # (deadline, insertion order, key)
+        self.heap = []
+        self.counter = itertools.count()
+        # key -> callback of the tasks still watched
+        self.tasks = {}
+        self.condition = threading.Condition()
+        self.thread = None
+        self.running = True
+
+    def watch(self, key, timeout:float, on_expire) -> None:
+        """
+        :param key: the task, it must be hashable
+        :param timeout: the seconds after which the task expires
+        :param on_expire: the callback called with the key when the task expires, from the thread of the watchdog
+        """
+        with self.condition:
+            self.tasks[key] = on_expire
+            heapq.heappush(self.heap, (time.monotonic() + timeout, next(self.counter), key))
+
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.__run, daemon=True)
+                self.thread.start()
+
+            self.condition.notify()
+
+    def unwatch(self, key) -> bool:
+        """
+        :return: True if the task was still watched, False if it has already expired
+        """
+        with self.condition:
+            return self.tasks.pop(key, None) is not None
+
+    def __pop_expired(self) -> list:
+        """
+        :return: the (key, callback) of the expired tasks. It must be called holding the condition.
+        """
+        now = time.monotonic()
+        expired = []
+        while self.heap and self.heap[0][0] <= now:
+            _, _, key = heapq.heappop(self.heap)
+            on_expire = self.tasks.pop(key, None)
+            # The tasks unwatched in time are still in the heap
+            if on_expire is not None:
+                expired.append((key, on_expire))
+
+        return expired
+
+    def __run(self) -> None:
+        while True:
+            with self.condition:
+                expired = self.__pop_expired()
+                while self.running and not expired:
+                    timeout = self.heap[0][0] - time.monotonic() if self.heap else None
+                    self.condition.wait(timeout)
+                    expired = self.__pop_expired()
+
+                if not self.running:
+                    return
+
+            for key, on_expire in expired:
+                try:
+                    on_expire(key)
+                except Exception as e:
+                    logger.error(f"WATCHDOG - Error handling an expired task: {e}")
+
+    def stop(self) -> None:
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+
+    def __len__(self) -> int:
+        return len(self.tasks)
@@ -1,14 +1,22 @@
-from bs4 import BeautifulSoup
 import requests
 import logging
 
+# Local import
+from parsed_page import ParsedPage
+from near_duplicates import simhash, hamming_distance
+
 logger = logging.getLogger("CRATOR")
 
 
 def captcha_detector(url, response):
+    """
+    Check if the page contains a captcha image and it has been reached through an anomalous redirection.
+    :param url: the requested url.
+    :param response: the web page retrieved from the request, or a ParsedPage to reuse its parsed tree.
+    :return: True if a captcha has been detected, False otherwise.
+    """
     logger.debug(f"DETECTOR - Captcha detector")
-    soup = BeautifulSoup(response.text, "html.parser")
-    captchas = soup.find_all("img", src=lambda x: "captcha" in x.lower())
+    captchas = has_captcha_images(ParsedPage.of(response))
 
     # if captchas:
     #     logger.debug(f"DETECTOR - Captcha detector - Captcha word found in url -> {url}")
@@ -21,6 +29,15 @@ def captcha_detector(url, response):
     return False
 
 
+def has_captcha_images(page):
+    """
+    Check if the page contains <img> tags pointing to a captcha.
+    :param page: a ParsedPage.
+    :return: True if at least one captcha image has been found, False otherwise.
+    """
+    return any("captcha" in img.get("src", "").lower() for img in page.images)
+
+
 def anomalous_redirection(url_request, webpage):
     try:
         if any(response.status_code == 302 for response in webpage.history) and webpage.url != url_request:
@@ -53,27 +70,29 @@ def login_redirection(webpage, loginpage=None):
     return False
 
 
-def compare_page_contents(web_page_1, web_page_2):
+def compare_page_contents(web_page_1, web_page_2, max_distance:int =0):
     """
     Check if different request responses have the same html content.
-    :param web_page_1: :class requests.Response containing info crawled from an url.
-    :param web_page_2: :class requests.Response containing info crawled from an url.
+    :param web_page_1: :class requests.Response or :class ParsedPage containing info crawled from an url.
+    :param web_page_2: :class requests.Response or :class ParsedPage containing info crawled from an url.
+    :param max_distance: 0 to compare the exact text, otherwise the maximum number of different bits between the
+    SimHash of the two texts.
     :return: True if the page content is the same, False otherwise.
     """
 
     if not web_page_1 or not web_page_2:
         return False
 
-    if not all(isinstance(web_page, requests.Response) for web_page in [web_page_1, web_page_2]):
-        raise TypeError("The type of each value of the list must be :class requests.Response.")
+    if not all(isinstance(web_page, (requests.Response, ParsedPage)) for web_page in [web_page_1, web_page_2]):
+        raise TypeError("The type of each value of the list must be :class requests.Response or :class ParsedPage.")
 
-    soup1 = BeautifulSoup(web_page_1.content, "html.parser", from_encoding="iso-8859-1")
-    content1 = soup1.find('body').text
-
-    soup2 = BeautifulSoup(web_page_2.content, "html.parser", from_encoding="iso-8859-1")
-    content2 = soup2.find('body').text
+    content1 = ParsedPage.of(web_page_1).body_text
+    content2 = ParsedPage.of(web_page_2).body_text
 
     if content1 == content2:
         return True
 
+    if max_distance > 0:
+        return hamming_distance(simhash(content1), simhash(content2)) <= max_distance
+
     return False
\ No newline at end of file
@@ -1,12 +1,10 @@
-from bs4 import BeautifulSoup
-
 # Local import
 from detectors import CaptchaDetector, WaitingPageDetector
 
 class CocoricoCaptchaDetector(CaptchaDetector):
-    def has_captcha(self, web_page: str) -> bool:
+    def has_captcha(self, web_page) -> bool:
         return False
 
 class CocoricoWaitingPageDetector(WaitingPageDetector):
-    def is_waiting_page(self, web_page: str) -> bool:
-        return False
\ No newline at end of file
+    def is_waiting_page(self, web_page) -> bool:
+        return False
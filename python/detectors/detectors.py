@@ -1,21 +1,40 @@
+import re
 from abc import ABC, abstractmethod
 
+# Local import
+from parsed_page import ParsedPage
+
 class CaptchaDetector(ABC):
     @abstractmethod
-    def has_captcha(self, web_page: str) -> bool:
+    def has_captcha(self, web_page) -> bool:
         """
         Detect whether the given web page content contains a captcha.
-        :param web_page: HTML content of the web page.
+        :param web_page: HTML content of the web page, or a ParsedPage to reuse its parsed tree.
         :return: True if a captcha is detected, False otherwise.
         """
         pass
 
 class WaitingPageDetector(ABC):
     @abstractmethod
-    def is_waiting_page(self, web_page: str) -> bool:
+    def is_waiting_page(self, web_page) -> bool:
         """
         Detect whether the given web page is a waiting page.
-        :param web_page: HTML content of the web page.
+        :param web_page: HTML content of the web page, or a ParsedPage to reuse its parsed tree.
         :return: True if a waiting page is detected, False otherwise.
         """
-        pass
\ No newline at end of file
+        pass
+
+    def wait_time(self, web_page) -> float:
+        """
+        Read the waiting time advertised by a waiting page. By default, the delay of the
+        <meta http-equiv="refresh" content="N"> tag. Override it if the marketplace advertises the time elsewhere.
+        :param web_page: HTML content of the web page, or a ParsedPage to reuse its parsed tree.
+        :return: the seconds to wait before requesting the page again, None if the page advertises no time.
+        """
+        page = ParsedPage.of(web_page)
+        meta = page.soup.find("meta", attrs={"http-equiv": re.compile(r"^refresh$", re.I)})
+        if meta is None:
+            return None
+
+        match = re.match(r"\s*(\d+(?:\.\d+)?)", meta.get("content", ""))
+        return float(match.group(1)) if match else None
@@ -1,27 +1,23 @@
-from bs4 import BeautifulSoup
-
 # Local import
 from detectors import CaptchaDetector, WaitingPageDetector
+from parsed_page import ParsedPage
 
 class DrughubCaptchaDetector(CaptchaDetector):
 
-    def has_captcha(self, web_page: str) -> bool:
-        # Make soup
-        soup = BeautifulSoup(web_page, "html.parser", from_encoding="iso-8859-1")
+    def has_captcha(self, web_page) -> bool:
+        page = ParsedPage.of(web_page, from_encoding="iso-8859-1")
 
         # Get the web page title
-        title_content = soup.title.string
+        title_content = page.title or ""
         title_content = title_content.lower()
 
         return "captcha" in title_content
-    
+
 class DrughubWaitingPageDetector(WaitingPageDetector):
 
-    def is_waiting_page(self, web_page: str) -> bool:
-        # Make soup
-        soup = BeautifulSoup(web_page, "html.parser", from_encoding="iso-8859-1")
+    def is_waiting_page(self, web_page) -> bool:
+        page = ParsedPage.of(web_page, from_encoding="iso-8859-1")
 
-        title = soup.title.string.strip()
+        title = (page.title or "").strip()
 
         return "Please Wait" == title
-
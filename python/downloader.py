@@ -1,29 +1,110 @@
-import concurrent.futures
 import os
 import logging
 import time
 import threading
-import random
-from collections import deque
+import queue
 from concurrent.futures import ThreadPoolExecutor
 
 from handler import TorHandler
+from url_queue import URLQueue, FIFOQueue
+from rate_limiter import RateLimiter
+from concurrency import ConcurrencyController, SUCCESS, ERROR, OVERLOAD_STATUS_CODES
+from retry import RetryScheduler
+from deadlines import Watchdog, PAGE
+from hedging import Hedger, hedge_identity
+from mirror_pool import MirrorPool
+from exceptions import DeadlineExceededError
 
 
 logger = logging.getLogger("CRATOR")
 
+# Seconds between two checks of the running flag while waiting for a concurrency slot
+SLOT_TIMEOUT = 1
+# Threads of the pool for each worker: the spare threads replace the workers abandoned by the watchdog and run the
+# duplicate requests
+THREADS_PER_WORKER = 2
+# Key of the hedging timers in the watchdog
+HEDGE = "hedge"
+
+
+class DownloadResult:
+    """
+    Record of a single fetch submitted by the Downloader.
+    It is pushed in the completion queue as soon as its future is done, or as soon as the first of its attempts
+    succeeds if the request has been hedged.
+    """
+    def __init__(self, url:str, cookie:str, future, headers:dict =None):
+        """
+        :param url: the requested URL
+        :param cookie: the cookie used for the request
+        :param future: the future running tor_handler.send_request
+        :param headers: the additional headers of the request, if any
+        """
+        self.url = url
+        self.cookie = cookie
+        self.future = future
+        self.headers = headers
+        self.submitted_at = time.time()
+        self.completed_at = None
+        # Deadline of the request in seconds, and whether the watchdog abandoned it
+        self.deadline = None
+        self.expired = False
+        # Future of the duplicate request sent through another circuit, if any, and future of the first response
+        self.hedge = None
+        self.winner = None
+        # Set by the first attempt completing the download, or by the watchdog
+        self.finished = False
+        self.lock = threading.Lock()
+
+    def result(self):
+        """
+        :return: the tuple (web_page, used_cookie) returned by the request. It raises the request exception, if any,
+        and DeadlineExceededError if the request has been abandoned at its deadline.
+        """
+        if self.expired:
+            raise DeadlineExceededError(self.url, self.deadline)
+
+        return (self.winner or self.future).result()
+
+    def elapsed(self) -> float:
+        """
+        :return: the time in seconds spent to download the URL
+        """
+        end = self.completed_at if self.completed_at else time.time()
+        return end - self.submitted_at
+
 
 class Downloader:
-    def __init__(self, n_threads, torhandler, restart_tor:int, waiting_time=1.5):
+    def __init__(self, n_threads, torhandler, restart_tor:int, waiting_time=1.5, url_queue:URLQueue =None,
+                 rate_limiter:RateLimiter =None, concurrency:ConcurrencyController =None,
+                 retry_scheduler:RetryScheduler =None, hedger:Hedger =None, mirrors:MirrorPool =None):
         """
-        :param n_threads: number of threads to use
+        :param n_threads: number of workers, the maximum number of requests in flight
         :param torhandler: an istance of TorHandler
         :param restart_tor: number of HTTP requests after which Tor is restarted
-        :param waiting_time: the amount of time in seconds that elapses between two HTTP requests
+        :param waiting_time: the average amount of time in seconds that elapses between two HTTP requests, used only
+        if rate_limiter is None
+        :param url_queue: the queue deciding the download order of the URLs. A FIFOQueue if None.
+        :param rate_limiter: the rate limiter of the HTTP requests, it can be shared among several downloaders
+        :param concurrency: the controller adapting the number of requests in flight to each host and through each
+        circuit. If None, n_threads requests are always in flight.
+        :param retry_scheduler: the scheduler of the delayed retries. A RetryScheduler with the default policies if
+        None.
+        :param hedger: the policy of the hedged requests. If None, the slow requests are never duplicated.
+        :param mirrors: the mirrors of the marketplace. The requests are spread over the healthy mirrors, and the
+        responses are moved on the logical host of the seed. None to always request the host of the URL.
         """
-        self.queue = deque()
+        self.queue = url_queue if url_queue is not None else FIFOQueue()
+        self.retries = retry_scheduler if retry_scheduler is not None else RetryScheduler()
         self.n_threads = n_threads
         self.waiting_time = waiting_time
+
+        self.concurrency = concurrency
+        self.hedger = hedger
+        self.mirrors = mirrors
+        self.rate_limiter = rate_limiter
+        if self.rate_limiter is None and self.waiting_time > 0:
+            self.rate_limiter = RateLimiter(1 / self.waiting_time)
         # number of HTTP requests after which Tor is restarted
         self.restart_tor = restart_tor
 
@@ -32,95 +113,357 @@ class Downloader:
 
         self.torhandler = torhandler
         self.running = True
-        self.lock = threading.Lock()
-        self.results = []
-        self.futures = [] #list of asynchronous task to run a function (tor_handler.send_request)
+        self.lock = threading.RLock()
+        # Signaled whenever a new URL is enqueued or the downloader is stopped
+        self.not_empty = threading.Condition(self.lock)
 
-        self.future_url_map = {}
+        # Number of requests sent by the Tor handler at the last Tor restart
+        self.last_renewal = 0
 
-        # To generate a random waiting time
-        self.lower_bound = self.waiting_time-0.5 if self.waiting_time > 0 and self.waiting_time-0.5 > 0 else 0
-        self.upper_bound = self.waiting_time+0.5 if self.waiting_time > 0 else 1.5
+        # url -> additional headers of its next request (e.g., conditional request headers)
+        self.request_headers = {}
+
+        # Number of submitted requests not yet completed
+        self.in_flight = 0
+        # Free workers. A worker stuck past the deadline of its request is abandoned and its capacity replaced.
+        self.workers = threading.Semaphore(n_threads)
+        self.watchdog = Watchdog()
+        self.n_expired = 0
+        # Thread pool of the running download loop, used by the hedging timers
+        self.executor = None
+        # Thread-safe queue of completed DownloadResult
+        self.completed = queue.Queue()
 
     def is_empty(self):
-        # logger.debug(f"DOWNLOADER: Empty -> {not self.queue and not self.results}")
-        return not self.queue and not self.futures
+        """
+        :return: True if there are no URLs to download or to retry, no requests in flight and no results to consume
+        """
+        with self.lock:
+            return not self.queue and not self.retries and self.in_flight == 0 and self.completed.empty()
 
-    def enqueue(self, url, cookie):
+    def enqueue(self, url, cookie, depth:int =0, headers:dict =None):
         """
         Add a tuple (url,coockie) to the queue
+        :param depth: the depth of the url in the crawling graph, used by the priority queue
+        :param headers: additional headers of the request, if any
         """
-        self.queue.append((url, cookie))
+        with self.not_empty:
+            if headers:
+                self.request_headers[url] = headers
+            self.queue.push(url, cookie, depth)
+            self.retries.count_request()
+            self.not_empty.notify()
 
-    def has_results(self):
-        if self.get_results():
+    def retry(self, url:str, cookie:str, reason:str, depth:int =0, headers:dict =None, delay:float =None) -> float:
+        """
+        Schedule a new request of a URL after the backoff delay of the reason.
+        :param url: the URL to be requested again
+        :param cookie: the cookie to be used for the new request
+        :param reason: the reason of the retry (e.g., retry.ERROR, retry.WAITING_PAGE)
+        :param depth: the depth of the url in the crawling graph
+        :param headers: additional headers of the request, if any
+        :param delay: the seconds to wait advertised by the server or by the page, if any
+        :return: the seconds before the retry, None if the URL will not be retried
+        """
+        with self.not_empty:
+            delay = self.retries.schedule(url, reason, (cookie, depth, headers), delay)
+            # The dispatcher waits until the next retry is due
+            self.not_empty.notify()
+
+        return delay
+
+    def retry_attempts(self, url:str, reason:str) -> int:
+        """
+        :return: the number of retries of the URL for the reason
+        """
+        with self.lock:
+            return self.retries.get_attempts(url, reason)
+
+    def promote_retries(self) -> None:
+        """
+        Move the retries whose time has come in the URL queue. It must be called holding the lock.
+        """
+        for url, (cookie, depth, headers) in self.retries.pop_due():
+            if headers:
+                self.request_headers[url] = headers
+            self.queue.push(url, cookie, depth)
+
+    def observe(self, url:str, n_images:int) -> None:
+        """
+        Report the number of images found in a downloaded web page to the URL queue.
+        """
+        with self.lock:
+            self.queue.observe(url, n_images)
+
+    def get_result(self, timeout:float =None) -> DownloadResult:
+        """
+        Wait for the next completed download, in completion order.
+        :param timeout: maximum number of seconds to wait. None waits until a result is available.
+        :return: a DownloadResult, None if no download has been completed within the timeout
+        """
+        try:
+            return self.completed.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def get_results(self) -> list:
+        """
+        Return all the downloads completed so far without blocking.
+        :return: a list of DownloadResult
+        """
+        results = []
+        while True:
+            try:
+                results.append(self.completed.get_nowait())
+            except queue.Empty:
+                return results
+
+    def report(self, url:str, cookie:str, outcome:str) -> None:
+        """
+        Report a congestion signal found in a downloaded page (e.g., a waiting page or a captcha) to the concurrency
+        controller.
+        :param url: the URL of the web page
+        :param cookie: the cookie used for the request, which identifies its circuit
+        :param outcome: the signal, e.g. concurrency.WAITING_PAGE or concurrency.CAPTCHA
+        """
+        if self.concurrency:
+            self.concurrency.report(url, cookie, outcome)
+
+    def acquire_slot(self, url:str, cookie:str) -> bool:
+        """
+        Wait until the concurrency controller allows a new request to the host of the URL through the circuit of the
+        cookie.
+        :return: True if the slot has been reserved, False if the downloader has been stopped
+        """
+        if not self.concurrency:
             return True
 
+        while self.running:
+            if self.concurrency.acquire(url, cookie, timeout=SLOT_TIMEOUT):
+                return True
+
         return False
 
-    def get_future_url(self, future):
-        if id(future) not in self.future_url_map:
-            return None
+    def fetch(self, url:str, cookie:str, headers:dict =None, identity:str =None):
+        """
+        Send a request through the Tor handler, to the best mirror of the marketplace if it has several mirrors.
+        :param url: the URL to be requested, on the logical host of the seed
+        :param identity: the identity whose isolated circuit is used, the cookie if None
+        :return: the tuple (web_page, used_cookie). The web page is on the logical host, whatever the mirror.
+        """
+        if not self.mirrors:
+            return self.torhandler.send_request(url, cookie, headers, identity)
+
+        request_url, mirror = self.mirrors.resolve(url)
+        start = time.monotonic()
+        failed = True
+        try:
+            web_page, used_cookie = self.torhandler.send_request(request_url, cookie, headers, identity)
+            failed = web_page is not None and web_page.status_code >= 500
+        finally:
+            self.mirrors.release(mirror, time.monotonic() - start, failed)
+
+        if web_page is not None:
+            self.mirrors.canonical_response(web_page)
+        return web_page, used_cookie
+
+    def acquire_worker(self) -> bool:
+        """
+        Wait for a free worker.
+        :return: True if the worker has been reserved, False if the downloader has been stopped
+        """
+        while self.running:
+            if self.workers.acquire(timeout=SLOT_TIMEOUT):
+                return True
+
+        return False
+
+    def release_slot(self, download:DownloadResult, future) -> None:
+        if not self.concurrency:
+            return
+
+        outcome = SUCCESS
+        if download.expired or future.cancelled() or future.exception() is not None:
+            outcome = ERROR
+        else:
+            web_page, _ = future.result()
+            if web_page is not None and web_page.status_code in OVERLOAD_STATUS_CODES:
+                outcome = ERROR
+
+        self.concurrency.release(download.url, download.cookie, download.elapsed(), outcome)
+
+    def on_done(self, download:DownloadResult, future) -> None:
+        """
+        Callback executed when an attempt of a request ends. The first attempt succeeding, or the last one failing,
+        moves the download in the completion queue.
+        """
+        failed = future.cancelled() or future.exception() is not None
+        primary = future is download.future
+
+        with download.lock:
+            other = download.hedge if primary else download.future
+            # A failed attempt waits for the other attempt of a hedged request
+            if failed and other is not None and not other.done():
+                return
+
+            if download.finished:
+                # The original request completed after its duplicate: the seconds saved by hedging
+                if self.hedger and primary and not failed and download.winner is download.hedge and \
+                        download.completed_at:
+                    self.hedger.record_saved(time.time() - download.completed_at)
+                return
+
+            download.finished = True
+            download.winner = future
+
+        self.watchdog.unwatch(download)
+        self.watchdog.unwatch((HEDGE, download))
+        if other is not None:
+            # The loser is cancelled if not started yet, otherwise its response is ignored
+            other.cancel()
+
+        if self.hedger and not failed:
+            # When the duplicate wins, the elapsed time is a lower bound of the latency of the original request:
+            # without it, the slow tail would be missing from the latencies of the host
+            self.hedger.observe(download.url, download.elapsed())
+            if not primary:
+                self.hedger.record_win()
+                logger.debug(f"DOWNLOADER - Duplicate request completed first: {download.url}")
+
+        self.workers.release()
+        self.complete(download, future)
+
+    def hedge(self, key:tuple) -> None:
+        """
+        Callback of the watchdog for a request slower than the usual latency of its host: a duplicate request is sent
+        through another circuit, with the same cookie and headers, if the hedging budget allows it.
+        """
+        _, download = key
+        with download.lock:
+            if download.finished or not self.running or not self.hedger.try_hedge():
+                return
+
+            headers = self.torhandler.identities.headers(download.cookie)
+            if download.headers:
+                headers.update(download.headers)
 
-        return self.future_url_map[id(future)]
+            try:
+                download.hedge = self.executor.submit(self.fetch, download.url, download.cookie, headers,
+                                                      hedge_identity(download.cookie))
+            except RuntimeError:
+                # The download loop has been stopped
+                return
 
-    def get_results(self):
-        # logger.debug(f"DOWNLOADER: Results: queue before -> {len(self.queue)}")
+        logger.debug(f"DOWNLOADER - Duplicate request after {download.elapsed():.1f}s: {download.url}")
+        download.hedge.add_done_callback(lambda f, d=download: self.on_done(d, f))
+
+    def expire(self, download:DownloadResult) -> None:
         """
-        Update the futures list in order to contain only the futures not completed
-        :return: an iterator to wait and handle the completed tasks of a function
+        Callback of the watchdog for a request past its deadline. The request is completed with a
+        DeadlineExceededError and its worker is replaced by a spare thread. The stuck thread is freed by the read
+        timeout of the request, and the request is cancelled if it has not been started yet.
         """
-        #create an iterator to wait and handle the completed tasks
-        completed_futures = [future for future in concurrent.futures.as_completed(self.futures)]
+        with download.lock:
+            if download.finished:
+                return
+
+            download.finished = True
+            download.expired = True
+
+        for future in (download.future, download.hedge):
+            if future is not None:
+                future.cancel()
 
-        # Update self.futures to remove completed futures
-        self.futures = [future for future in self.futures if future not in completed_futures]
+        with self.lock:
+            self.n_expired += 1
 
-        completed_futures = [(self.future_url_map.pop(id(future)), future) for future in completed_futures]
+        print(f"DOWNLOADER - Deadline of {download.deadline}s exceeded: {download.url}")
+        logger.warning(f"DOWNLOADER - Deadline of {download.deadline}s exceeded: {download.url}")
+        self.workers.release()
+        self.complete(download, download.future)
 
-        return completed_futures
+    def complete(self, download:DownloadResult, future) -> None:
+        """
+        Move a download in the completion queue.
+        """
+        download.completed_at = time.time()
+        self.release_slot(download, future)
+        with self.lock:
+            # Push before decrementing, so that is_empty never sees the download in neither of them
+            self.completed.put(download)
+            self.in_flight -= 1
+
+    def renewal_due(self) -> bool:
+        """
+        :return: True if restart_tor requests have been sent since the last Tor restart
+        """
+        n_requests_sent = self.torhandler.n_requests_sent
+        if n_requests_sent - self.last_renewal >= self.restart_tor:
+            self.last_renewal = n_requests_sent
+            return True
 
-        # return [future.result() for future in completed_futures]
-        #
-        #
-        # future_completed = []
-        # for future in concurrent.futures.as_completed(self.futures):
-        #     future_completed.append(future)
-        #
-        # for future in future_completed:
-        #     self.futures.remove(future)
-        #
-        # return [future.result() for future in future_completed]
+        return False
 
     def start(self):
         threading.Thread(target=self.download, daemon=True).start()
 
     def download(self):
-        with ThreadPoolExecutor(max_workers=self.n_threads) as executor:
+        with ThreadPoolExecutor(max_workers=self.n_threads * THREADS_PER_WORKER) as executor:
+            self.executor = executor
             while self.running:
-                if not self.queue:
-                    time.sleep(0.1)
-                    continue
-
-                with self.lock:
-                    while self.queue:
-                        url, cookie = self.queue.popleft()
-
-                        future = executor.submit(self.torhandler.send_request, url, cookie)
-                        self.futures.append(future)
-                        self.future_url_map[id(future)] = url
-
-                        if self.torhandler.n_requests_sent % self.restart_tor == 0:
-                            print("DOWNLOADER - Restart Tor (crawling)!")
-                            self.torhandler.renew_connection()
-                        
-                        # Get random waiting time
-                        random_waiting_time = round(random.uniform(self.lower_bound, self.upper_bound), 2)
-                        time.sleep(random_waiting_time)
+                if not self.acquire_worker():
+                    break
+
+                with self.not_empty:
+                    self.promote_retries()
+                    while self.running and not self.queue:
+                        # Wake up when the next retry is due
+                        self.not_empty.wait(self.retries.next_delay())
+                        self.promote_retries()
+
+                    if not self.running:
+                        self.workers.release()
+                        break
+
+                    url, cookie = self.queue.pop()
+                    headers = self.request_headers.pop(url, None)
+                    self.in_flight += 1
+
+                # Wait for the request slot of the host and submit outside the lock, so that enqueue and completion
+                # callbacks are never blocked
+                if not self.acquire_slot(url, cookie):
+                    with self.lock:
+                        self.in_flight -= 1
+                    self.workers.release()
+                    break
+
+                if self.rate_limiter:
+                    self.rate_limiter.acquire(url)
+
+                download = DownloadResult(url, cookie, None, headers)
+                download.deadline = self.torhandler.timeouts[PAGE].deadline
+                self.watchdog.watch(download, download.deadline, self.expire)
+
+                download.future = executor.submit(self.fetch, url, cookie, headers)
+                download.future.add_done_callback(lambda f, d=download: self.on_done(d, f))
+
+                # Duplicate the request if it gets slower than the usual latency of its host
+                if self.hedger:
+                    self.hedger.count_request()
+                    threshold = self.hedger.threshold(url)
+                    if threshold is not None and threshold < download.deadline:
+                        self.watchdog.watch((HEDGE, download), threshold, self.hedge)
+
+                if self.renewal_due():
+                    print("DOWNLOADER - Restart Tor (crawling)!")
+                    self.torhandler.renew_connection()
 
     def stop(self):
-        self.running = False
+        with self.not_empty:
+            self.running = False
+            self.not_empty.notify_all()
+        self.watchdog.stop()
 
         # Stop Tor process
         print("Stop the Tor process...")
-        self.torhandler.stop_tor_process()
\ No newline at end of file
+        self.torhandler.stop_tor_process()
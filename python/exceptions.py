@@ -17,4 +17,18 @@ class RedirectPageException(Exception):
 class HTTPStatusCodeError(Exception):
     def __init__(self, status_code):
         self.status_code = status_code
-        super().__init__(f"HTTP status code error: {status_code}")
\ No newline at end of file
+        super().__init__(f"HTTP status code error: {status_code}")
+
+
+class DeadlineExceededError(Exception):
+    def __init__(self, url, deadline):
+        self.url = url
+        self.deadline = deadline
+        super().__init__(f"Request deadline of {deadline}s exceeded: {url}")
+
+
+class AnalysisError(Exception):
+    def __init__(self, url, reason):
+        self.url = url
+        self.reason = reason
+        super().__init__(f"Page analysis failed ({reason}): {url}")
@@ -5,8 +5,14 @@ import time
 # Local import
 from creator import Creator
 from utils.config import Configuration
+from cookie_store import CookieStore
+from harvester import CookieHarvester
 from utils.seeds import get_seeds
 from handler import TorHandler
+from deadlines import build_timeouts
+
+REPORT_INTERVAL = 60   # seconds between two reports of the harvester
+
 
 def is_port_open(host, port):
     """
@@ -21,32 +27,6 @@ def is_port_open(host, port):
         result = sock.connect_ex((host, port))
         return result == 0
     
-def delay_based_on_cookie_extracted(seed: str, config: Configuration) -> None:
-    """
-    Delay the cookie extraction based on number of cookies stored in the YAML file.
-
-    :param seed: the URL to be crawled
-    :param config: a Configuration object which handles the YAML file
-    """
-    num_cookie_stored = len(config.cookies(seed))
-
-    delay = 0
-
-    if num_cookie_stored >= 50:
-        delay = (2 * 60) + 30
-    elif num_cookie_stored >= 40:
-        delay =  2 * 60 
-    elif num_cookie_stored >= 30:
-        delay =  90  
-    elif num_cookie_stored >= 20:
-        delay = 60
-    elif num_cookie_stored >= 10:
-        delay = 30
-    else:
-        delay = 0
-
-    print(f"Reached {num_cookie_stored} cookies, delaying for {delay / 60} minute(s)...")
-    time.sleep(delay)
 
 if __name__ == '__main__':
     config = Configuration()
@@ -65,30 +45,36 @@ if __name__ == '__main__':
     homepage_url = scraper.get_base_url(seed)
     print(f"Homepage URL: {homepage_url}")
 
-    tor_handler = TorHandler(config.tor_password(), config.second_tor_port(), config.second_tor_proxy(), config.venv_path())
+    tor_handler = TorHandler(config.tor_password(), config.second_tor_port(), config.second_tor_proxy(), config.venv_path(),
+                             timeouts=build_timeouts(config.request_timeouts()))
+
+    # Cookies shared with the crawler
+    cookie_store = CookieStore(config.cookie_store_path())
+    cookie_store.import_config(config)
+
+    # Several cookie extractors in parallel, each one on its own circuits, keeping the pool at its target size
+    def create_extractor(identity):
+        return Creator.create_cookie_extractor(config.marketplace(), tor_handler, homepage_url, seed,
+                                               config.cookie_waiting_time(), config.cookie_attempts(), identity)
+
+    if create_extractor(None) is None:
+        raise Exception(f"No cookie extractor for the marketplace {config.marketplace()}")
+
+    harvester = CookieHarvester(seed, cookie_store, create_extractor, config.harvest_workers())
+    harvester.start()
 
-    # Get the correct instance of cookie extractor
-    cookie_extractor = Creator.create_cookie_extractor(tor_handler, homepage_url, seed, config.cookie_waiting_time(), config.cookie_attempts())
-    
     # Get the Tor port used by the crawler
     crawler_tor_port = config.tor_port()
-    n_cookies = 0
-    counter = 1
 
     # Store cookies until the crawler doesn't stop
     while is_port_open("127.0.0.1", crawler_tor_port):
-        print(f"Attempt {counter} to acquire a new cookie\n")
-        result = cookie_extractor.store_new_cookie()
-
-        counter += 1
-        
-        if result:
-            print("*************************\n")
-            n_cookies += 1
-            counter = 1
-
-        delay_based_on_cookie_extracted(seed, config)
-        
-    
-    print(f"Number of cookie extracted: {n_cookies}")
-    cookie_extractor.stop()
\ No newline at end of file
+        time.sleep(REPORT_INTERVAL)
+
+        n_attempts, n_harvested, success_ratio, harvest_rate, target_size, n_stored = harvester.stats()
+        print(f"Cookies harvested: {n_harvested}/{n_attempts} (success ratio {success_ratio}), "
+              f"{harvest_rate} cookies/min, pool {n_stored}/{target_size}")
+
+    harvester.stop()
+    print(f"Number of cookie extracted: {harvester.stats()[1]}")
+    tor_handler.stop_tor_process()
+    cookie_store.close()
@@ -0,0 +1,410 @@
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from urllib.parse import urljoin, urlparse
+
+# Local imports
+import detector
+from creator import Creator
+from parsed_page import ParsedPage
+from scrapers import Scraper
+from detectors import CaptchaDetector, WaitingPageDetector
+from utils.urls import canonicalize_url
+from near_duplicates import SimHashIndex, simhash
+from mirror_pool import replace_host
+from exceptions import AnalysisError
+
+logger = logging.getLogger("CRATOR")
+
+ANALYSIS_TIMEOUT = 120      # seconds after which the analysis of a page in a worker process is abandoned
+
+
+class PageAnalysis:
+    """
+    Compact and picklable result of the analysis of a web page.
+    The analysis stops at the first check that makes the page useless for the crawler, so the fields of the
+    following steps keep their default value.
+    """
+    def __init__(self):
+        self.waiting_page = False
+        # Seconds to wait advertised by a waiting page, if any
+        self.wait_time = None
+        # Captcha found by the marketplace captcha detector
+        self.has_captcha = False
+        # <img> tags pointing to a captcha, used by the generic captcha detector
+        self.captcha_images = False
+        self.english = False
+        self.right_category = False
+        # SimHash of the page text and node index of a near-duplicate page already crawled, if any
+        self.simhash = None
+        self.duplicate_of = None
+        self.internal_links = []
+        self.internal_images = None
+        self.product_information = None
+        # Scraper state produced by a worker process, to be merged in the crawler scraper
+        self.scraper_state = {}
+        # Error message of the extraction step that failed, if any
+        self.error = None
+
+
+class PageAnalyzer:
+    """
+    Runs all the per-page checks and extractions of the crawler on a single parsed page:
+    waiting page and captcha detection, language and category checks, internal links, images and product information.
+    """
+    def __init__(self, seed:str, scraper:Scraper, captcha_detector:CaptchaDetector, waiting_page_detector:WaitingPageDetector,
+                 duplicate_index:SimHashIndex =None, mirror_hosts:tuple =()):
+        """
+        :param seed: the url from which the crawler starts
+        :param scraper: the scraper of the marketplace being crawled
+        :param captcha_detector: the captcha detector of the marketplace being crawled
+        :param waiting_page_detector: the waiting page detector of the marketplace being crawled
+        :param duplicate_index: the index of the pages already crawled, to skip the extractions on near-duplicate
+        pages. None to run the extractions anyway (e.g., in the worker processes, which do not share the index).
+        :param mirror_hosts: the hosts of the mirrors of the marketplace. Their links are internal links, moved on the
+        host of the crawled page.
+        """
+        self.seed = seed
+        self.mirror_hosts = set(mirror_hosts)
+        self.scraper = scraper
+        self.captcha_detector = captcha_detector
+        self.waiting_page_detector = waiting_page_detector
+        self.duplicate_index = duplicate_index
+
+    def extract_internal_buttons(self, page:ParsedPage) -> list:
+        """
+        Extract the internal buttons of a web page
+        :param page: the parsed web page
+        :return: list of links provided by the buttons in the web page
+        """
+        print("Internal buttons extraction...")
+        logger.info(f"{self.seed} - Internal buttons extraction")
+
+        urls = set()
+
+        # Get all internal buttons
+        buttons = page.buttons
+        logger.info(f"Number of internal buttons: {len(buttons)}")
+
+        for button in buttons:
+            # Get the value attribute of the button
+            value = button.get("value")
+            # Get the button text
+            text_content = button.text.strip()
+
+            # Check if the button value and text are a digit and they are not None
+            if value and text_content and value.isnumeric() and text_content.isnumeric():
+                value = int(value)
+                if value != 0:
+                    url = canonicalize_url(urljoin(self.seed, f"?page={value}"))
+                    urls.add(url)
+
+        urls_list = list(urls)
+        print(f"Number of extracted button links: {len(urls_list)}")
+        logger.info(f"Number of extracted button links: {len(urls_list)}")
+
+        return urls_list
+
+    def extract_internal_links(self, page:ParsedPage) -> list:
+        """
+        Search for all the internal links (links of the same website) in a web page.
+        :param page: the parsed web page
+        :return: a list of canonical url found in the web page
+        """
+        print("Internal link extraction...")
+        logger.info(f"{self.seed} - Internal link extraction")
+
+        request_url = page.request_url
+        logger.debug(f"{self.seed} - Internal links - Request URL -> {request_url}")
+        domain = urlparse(request_url).netloc
+
+        urls = set()
+
+        # Get product category expressed in the URL to filter the extracted URLs
+        url_category = self.scraper.get_url_category(self.seed)
+
+        print(f"Category in url format: {url_category}")
+
+        # Get all internal links
+        tags = page.anchors
+        print(f"Number of internal links {len(tags)}")
+        logger.info(f"Number of internal links {len(tags)}")
+        for a_tag in tags:
+            href = a_tag.attrs.get("href")
+            href = urljoin(request_url, href).strip("/")
+
+            if href == "" or href is None:
+                # href empty tag
+                continue
+
+            if urlparse(href).netloc.lower() in self.mirror_hosts:
+                # The link points to the same page on a mirror of the marketplace
+                href = replace_host(href, domain)
+
+            if urlparse(href).netloc != domain:
+                # external link
+                continue
+
+            if "vendor" in href or "seller" in href:
+                # The internal link is not a products link
+                continue
+
+            if "#" in href:
+                # The internal link points to a section within the current web page
+                continue
+
+            if "login" in href:
+                # The internal link points to a login page
+                continue
+
+            if url_category not in href:
+                # The internal link points to a info page
+                continue
+
+            urls.add(canonicalize_url(href))
+
+        urls_list = list(urls)
+
+        print(f"Number of internal links extracted: {len(urls_list)}")
+        logger.info(f"Number of internal links extracted: {len(urls_list)}")
+
+        # Get the internal links provided by the buttons
+        buttons_url = self.extract_internal_buttons(page)
+
+        # Concatenate the two lists
+        urls_list = urls_list + buttons_url
+
+        return urls_list
+
+    def extract_internal_images(self, page:ParsedPage) -> list:
+        """
+        Extract all the images on the web page
+        :param page: the parsed web page
+        :return: a list of images in the web page given as input
+        """
+        print("Extracting internal images...")
+        logger.info(f"{self.seed} - Internal images extraction")
+        images = list()
+
+        # Get all images
+        tags = page.images
+        print(f"Number of img tags found in the web page is: {len(tags)}")
+        logger.info(f"Number of img tags found in the web page is: {len(tags)}")
+
+        for img_tag in tags:
+
+            # Check if the image is valid
+            if self.scraper.check_image(img_tag):
+                src_tag = None
+                try:
+                    src_tag = img_tag["src"]
+                except KeyError:
+                    print(f"Found <img> tag without 'src' attribute")
+                    logger.warning(f"{self.seed} - Found <img> tag without 'src' attribute")
+                    continue
+
+                # Check the image extension
+                if "jpg" in src_tag or "jpeg" in src_tag or "png" in src_tag:
+                    images.append(src_tag)
+                else:
+                    logger.info(f"{self.seed} - The image {src_tag} hasn't the right extension")
+
+        print(f"Number of images to download for this web page: {len(images)}")
+        logger.info(f"Number of images to download for this web page: {len(images)}")
+        return images
+
+    def check_webpage_lang(self, page:ParsedPage) -> bool:
+        """
+        Check if the web page language is in english
+        :param page: the parsed web page
+        :return: True if the web page content is in english, false otherwise
+        """
+        print("Checking the web page language...")
+
+        if page.lang == "en":
+            print("The web page is written in english")
+            return True
+        else:
+            return False
+
+    def analyze(self, page:ParsedPage, status_code:int, extract_images:bool) -> PageAnalysis:
+        """
+        Run all the checks and extractions on the given page, in the same order as the crawler.
+        :param page: the parsed web page
+        :param status_code: the HTTP status code of the web page
+        :param extract_images: False to skip the images extraction (e.g., for the seed)
+        :return: a PageAnalysis
+        """
+        analysis = PageAnalysis()
+
+        analysis.waiting_page = self.waiting_page_detector.is_waiting_page(page)
+        if analysis.waiting_page:
+            analysis.wait_time = self.waiting_page_detector.wait_time(page)
+            return analysis
+
+        analysis.has_captcha = self.captcha_detector.has_captcha(page)
+        analysis.captcha_images = detector.has_captcha_images(page)
+        if analysis.has_captcha:
+            return analysis
+
+        if status_code < 200 or status_code >= 300:
+            return analysis
+
+        analysis.english = self.check_webpage_lang(page)
+        if not analysis.english:
+            return analysis
+
+        analysis.right_category = self.scraper.check_category(page)
+        if not analysis.right_category:
+            return analysis
+
+        analysis.simhash = simhash(page.body_text)
+        if self.duplicate_index is not None:
+            analysis.duplicate_of = self.duplicate_index.find(analysis.simhash)
+            if analysis.duplicate_of is not None:
+                return analysis
+
+        try:
+            analysis.internal_links = self.extract_internal_links(page)
+        except Exception as e:
+            analysis.error = f"Internal link extraction failed: {str(e)}"
+            return analysis
+
+        if extract_images:
+            try:
+                analysis.internal_images = self.extract_internal_images(page)
+            except Exception as e:
+                analysis.error = f"Internal images extraction failed: {str(e)}"
+                return analysis
+
+        # Get product information only if the crawler captures at least one image to download.
+        if analysis.internal_images:
+            analysis.product_information = self.scraper.extract_product_information(page)
+
+        return analysis
+
+
+# Analyzers of the worker process, one for each crawled seed
+_worker_analyzers = {}
+
+
+def _get_worker_analyzer(spec:tuple) -> PageAnalyzer:
+    """
+    Get the analyzer of the worker process for the given seed, creating it at the first call.
+    :param spec: the tuple (website, macro_category, micro_category, seed, mirror hosts)
+    :return: a PageAnalyzer
+    """
+    if spec not in _worker_analyzers:
+        website, macro_category, micro_category, seed, mirror_hosts = spec
+        scraper = Creator.create_scraper(website, macro_category, micro_category)
+        captcha_detector = Creator.create_captcha_detector(website)
+        waiting_page_detector = Creator.create_waiting_page_detector(website)
+        _worker_analyzers[spec] = PageAnalyzer(seed, scraper, captcha_detector, waiting_page_detector,
+                                               mirror_hosts=mirror_hosts)
+
+    return _worker_analyzers[spec]
+
+
+def analyze_in_worker(spec:tuple, content:bytes, url:str, request_url:str, status_code:int, extract_images:bool) -> PageAnalysis:
+    """
+    Entry point of the worker processes. It parses the raw page and returns its analysis.
+    :param spec: the tuple (website, macro_category, micro_category, seed, mirror hosts) identifying the analyzer to use
+    :param content: the raw HTML content of the web page
+    :param url: the URL of the web page
+    :param request_url: the URL sent in the HTTP request
+    :param status_code: the HTTP status code of the web page
+    :param extract_images: False to skip the images extraction
+    :return: a PageAnalysis
+    """
+    analyzer = _get_worker_analyzer(spec)
+    page = ParsedPage(content, analyzer.scraper.page_encoding, url=url, request_url=request_url)
+    try:
+        analysis = analyzer.analyze(page, status_code, extract_images)
+        # The state of the worker scraper must be merged in the scraper of the crawler
+        analysis.scraper_state = analyzer.scraper.export_state()
+        return analysis
+    finally:
+        page.release()
+
+
+class ExtractionPool:
+    """
+    Pool of processes running the page analysis, so that parsing is not limited by the GIL.
+    It can be shared among several crawlers.
+    A worker stuck on a page past ANALYSIS_TIMEOUT seconds, or dead (e.g., killed by the OOM killer), breaks the pool:
+    its processes are terminated and a new pool replaces it, so that the crawlers never wait forever.
+    """
+    def __init__(self, n_processes:int, timeout:float =ANALYSIS_TIMEOUT):
+        """
+        :param n_processes: number of worker processes
+        :param timeout: the seconds after which the analysis of a page is abandoned
+        """
+        self.n_processes = n_processes
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.executor = self.__create_executor()
+
+    def __create_executor(self) -> ProcessPoolExecutor:
+        # Spawn the workers: the crawler process runs several threads, which must not be forked
+        return ProcessPoolExecutor(max_workers=self.n_processes, mp_context=multiprocessing.get_context("spawn"))
+
+    def __restart(self, executor:ProcessPoolExecutor) -> None:
+        """
+        Replace a broken or stuck pool with a new one.
+        :param executor: the pool that failed. Nothing is done if it has already been replaced.
+        """
+        with self.lock:
+            if executor is not self.executor:
+                return
+            self.executor = self.__create_executor()
+
+        # The pool has no public way to stop a busy worker
+        processes = list((getattr(executor, "_processes", None) or {}).values())
+        executor.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            process.terminate()
+
+    def analyze(self, spec:tuple, web_page, extract_images:bool, timeout:float =None) -> PageAnalysis:
+        """
+        Send the raw web page to a worker process and wait for its analysis.
+        :param spec: the tuple (website, macro_category, micro_category, seed, mirror hosts) identifying the analyzer to use
+        :param web_page: the web page retrieved from a request
+        :param extract_images: False to skip the images extraction
+        :param timeout: the seconds after which the analysis is abandoned, the timeout of the pool if None
+        :return: a PageAnalysis. It raises AnalysisError if the worker did not answer within the timeout or died.
+        """
+        request = getattr(web_page, "request", None)
+        request_url = request.url if request is not None else web_page.url
+
+        if timeout is None:
+            timeout = self.timeout
+
+        executor = self.executor
+        try:
+            future = executor.submit(analyze_in_worker, spec, web_page.content, web_page.url, request_url,
+                                     web_page.status_code, extract_images)
+            return future.result(timeout=timeout)
+        except TimeoutError:
+            future.cancel()
+            logger.error(f"EXTRACTION POOL - Analysis timeout after {timeout}s: {web_page.url}. Restart the pool.")
+            self.__restart(executor)
+            raise AnalysisError(web_page.url, f"timeout after {timeout}s")
+        except BrokenProcessPool as e:
+            # The pool has been replaced after the failure of another page (e.g., the timeout of another crawler):
+            # this page is not the cause, it is analyzed again by the new pool
+            if executor is not self.executor:
+                return self.analyze(spec, web_page, extract_images, timeout)
+
+            logger.error(f"EXTRACTION POOL - Worker process died: {e}. Restart the pool.")
+            self.__restart(executor)
+            raise AnalysisError(web_page.url, "worker process died")
+        except RuntimeError:
+            # The pool has been replaced by another crawler after a failure
+            if executor is not self.executor:
+                return self.analyze(spec, web_page, extract_images, timeout)
+            raise
+
+    def stop(self) -> None:
+        self.executor.shutdown(wait=True, cancel_futures=True)
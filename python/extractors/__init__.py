@@ -1,3 +1,3 @@
-from base_cookie_extractor import BaseCookieExtractor
-from drughub_cookie_extractor import DrughubCookieExtractor
-from cocorico_cookie_extractor import CocoricoCookieExtractor
\ No newline at end of file
+from .base_cookie_extractor import BaseCookieExtractor
+from .drughub_cookie_extractor import DrughubCookieExtractor
+from .cocorico_cookie_extractor import CocoricoCookieExtractor
@@ -1,7 +1,7 @@
 from abc import ABC, abstractmethod
 
 # Local imports
-from utils.config import Configuration
+from cookie_store import CookieStore
 from handler import TorHandler
 
 class BaseCookieExtractor(ABC):
@@ -12,7 +12,7 @@ class BaseCookieExtractor(ABC):
     It uses a TorHandler instance to send HTTP requests through Tor.
     """
 
-    def __init__(self, tor_handler: TorHandler, homepage_url: str, seed: str, waiting_time=5, attempts=3):
+    def __init__(self, tor_handler: TorHandler, homepage_url: str, seed: str, waiting_time=5, attempts=3, identity=None):
         """
         Initializes the BaseCookieExtractor
 
@@ -21,12 +21,15 @@ class BaseCookieExtractor(ABC):
         :param seed: the seed URL from which the crawler starts
         :param waiting_time: time delay (in seconds) between requests.
         :param attempts: maximum number of attempts to extract cookies.
+        :param identity: the identity whose isolated circuits are used, so that several extractors can run in
+        parallel with different IP addresses. None to use the shared circuits.
         """
         self.tor_handler = tor_handler
         self.homepage_url = homepage_url
         self.seed = seed
         self.waiting_time = waiting_time
         self.attempts = attempts
+        self.identity = identity
 
     @abstractmethod
     def get_new_cookie(self) -> str:
@@ -38,21 +41,30 @@ class BaseCookieExtractor(ABC):
         """
         pass
 
-    def store_new_cookie(self, config: Configuration):
+    def store_new_cookie(self, cookie_store: CookieStore):
         """
-        Store a new cookie in the YAML file
-        :param config: an instance of Configuration class to handle the YAML file
+        Store a new cookie in the cookie store, waking up the crawlers waiting for it
+        :param cookie_store: the cookie store shared with the crawlers
         :return: True whether get_new_cookie() returns a new cookie, False otherwise
         """
         cookies = self.get_new_cookie()
         if cookies:
-            config.add_cookie(self.seed, cookies) # Store the new cookie in the YAML file
+            cookie_store.add(self.seed, cookies) # Store the new cookie
             print("Added a new cookie!")
 
-            # Restart Tor to get another IP address and, therefore a new identity
-            self.tor_handler.renew_connection() 
+            # Get another IP address and, therefore a new identity
+            self.new_identity()
             return True
         return False
+
+    def new_identity(self) -> None:
+        """
+        Switch to new circuits: only the circuits of the extractor if it has an identity, all of them otherwise.
+        """
+        if self.identity is not None:
+            self.tor_handler.rotate_identity(self.identity)
+        else:
+            self.tor_handler.renew_connection()
     
     def stop(self) -> None:
         """
@@ -1,4 +1,4 @@
-from base_cookie_extractor import BaseCookieExtractor
+from extractors import BaseCookieExtractor
 import time
 import requests
 
@@ -16,11 +16,13 @@ class CocoricoCookieExtractor(BaseCookieExtractor):
         while cookie_value is None and attempt < self.attempts:
             try:
                 # Make an HTTP request
-                response = self.tor_handler.send_request(self.homepage_url)
+                response, _ = self.tor_handler.send_request(self.homepage_url, identity=self.identity)
 
                 print(f"CocoricoCookieExtractor - STATUS CODE first HTTP request:{response.status_code}")
                 
-                cookie_value = f"OCSESSID={response.cookies.get('OCSESSID')}; language=en-gb; currency=EUR"
+                session = response.cookies.get('OCSESSID')
+                if session:
+                    cookie_value = f"OCSESSID={session}; language=en-gb; currency=EUR"
 
                 time.sleep(self.waiting_time)
             except requests.RequestException as e:
@@ -1,4 +1,4 @@
-from base_cookie_extractor import BaseCookieExtractor
+from extractors import BaseCookieExtractor
 import time
 import requests
 
@@ -19,7 +19,9 @@ class DrughubCookieExtractor(BaseCookieExtractor):
         for attempt in range(self.attempts):
             try:
                 # Make the second HTTP request
-                response_reload = self.tor_handler.send_request(self.homepage_url, cookies)
+                cookie_header = "; ".join(f"{name}={value}" for name, value in cookies.items())
+                response_reload, _ = self.tor_handler.send_request(self.homepage_url, cookie_header,
+                                                                   identity=self.identity)
                 status_code = response_reload.status_code
 
                 print(f"DrughubCookieExtractor - STATUS CODE second HTTP request: {status_code}")
@@ -48,7 +50,7 @@ class DrughubCookieExtractor(BaseCookieExtractor):
         while not primary and not secondary and attempt < self.attempts:
             try:
                 # Make first HTTP request
-                first_response = self.tor_handler.send_request(self.homepage_url)
+                first_response, _ = self.tor_handler.send_request(self.homepage_url, identity=self.identity)
                 status_code = first_response.status_code
 
                 print(f"DrughubCookieExtractor - STATUS CODE first HTTP request:{status_code}")
@@ -0,0 +1,161 @@
+import math
+from array import array
+
+# Local imports
+from utils.urls import url_fingerprint
+
+INITIAL_CAPACITY = 1024
+MAX_LOAD_FACTOR = 0.7
+NO_DEPTH = -1
+
+
+class FingerprintTable:
+    """
+    Compact set of URLs keyed by their 64-bit fingerprint.
+    The fingerprints, the node indices and the depths are stored in flat arrays with open addressing (linear
+    probing), so that a URL takes 20 bytes per slot (8 each for the fingerprint and the node index, 4 for the depth)
+    instead of a string in a dictionary.
+    The node indices are assigned by the table, in insertion order.
+    """
+    def __init__(self, capacity:int =INITIAL_CAPACITY):
+        """
+        :param capacity: the initial number of slots, rounded up to a power of two
+        """
+        size = 1
+        while size < capacity:
+            size *= 2
+
+        self.__allocate(size)
+        self.length = 0
+        # Index assigned to the next URL added to the table
+        self.next_index = 0
+
+    def __allocate(self, size:int) -> None:
+        self.keys = array("Q", bytes(8 * size))
+        self.indices = array("q", bytes(8 * size))
+        self.depths = array("i", [NO_DEPTH]) * size
+        self.mask = size - 1
+
+    def __slot(self, fingerprint:int) -> int:
+        """
+        :return: the slot of the fingerprint, or the empty slot where it has to be inserted
+        """
+        slot = fingerprint & self.mask
+        while self.keys[slot] != 0 and self.keys[slot] != fingerprint:
+            slot = (slot + 1) & self.mask
+
+        return slot
+
+    def __grow(self) -> None:
+        old_keys, old_indices, old_depths = self.keys, self.indices, self.depths
+        self.__allocate(2 * len(old_keys))
+
+        for key, index, depth in zip(old_keys, old_indices, old_depths):
+            if key != 0:
+                slot = self.__slot(key)
+                self.keys[slot] = key
+                self.indices[slot] = index
+                self.depths[slot] = depth
+
+    def put(self, url:str, index:int, depth:int =NO_DEPTH) -> None:
+        """
+        Store a URL with a given node index (e.g., a node reloaded from a previous crawl).
+        :param url: the URL
+        :param index: the node index of the URL
+        :param depth: the depth of the URL in the crawling graph
+        """
+        if (self.length + 1) > MAX_LOAD_FACTOR * len(self.keys):
+            self.__grow()
+
+        fingerprint = url_fingerprint(url)
+        slot = self.__slot(fingerprint)
+        if self.keys[slot] == 0:
+            self.keys[slot] = fingerprint
+            self.length += 1
+
+        self.indices[slot] = index
+        self.depths[slot] = depth
+        self.next_index = max(self.next_index, index + 1)
+
+    def add(self, url:str, depth:int =NO_DEPTH) -> int:
+        """
+        Add a URL, assigning it the next node index. Nothing changes if the URL is already in the table.
+        :param url: the URL
+        :param depth: the depth of the URL in the crawling graph
+        :return: the node index of the URL
+        """
+        index = self.get(url)
+        if index is None:
+            index = self.next_index
+            self.put(url, index, depth)
+
+        return index
+
+    def get(self, url:str, default:int =None) -> int:
+        """
+        :return: the node index of the URL, default if the URL is not in the table
+        """
+        slot = self.__slot(url_fingerprint(url))
+        return self.indices[slot] if self.keys[slot] != 0 else default
+
+    def depth(self, url:str) -> int:
+        """
+        :return: the depth of the URL, None if the URL is not in the table or has no depth
+        """
+        slot = self.__slot(url_fingerprint(url))
+        if self.keys[slot] == 0 or self.depths[slot] == NO_DEPTH:
+            return None
+
+        return self.depths[slot]
+
+    def __getitem__(self, url:str) -> int:
+        index = self.get(url)
+        if index is None:
+            raise KeyError(url)
+
+        return index
+
+    def __contains__(self, url:str) -> bool:
+        return self.keys[self.__slot(url_fingerprint(url))] != 0
+
+    def __len__(self) -> int:
+        return self.length
+
+
+class BloomFilter:
+    """
+    Probabilistic set of URLs with a fixed memory footprint. A URL that was never added can be reported as present
+    with probability error_rate, an added URL is always reported as present.
+    """
+    def __init__(self, capacity:int, error_rate:float =1e-6):
+        """
+        :param capacity: the expected number of URLs
+        :param error_rate: the false positive probability when the filter holds capacity URLs
+        """
+        capacity = max(capacity, 1)
+        self.n_bits = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.n_hashes = max(1, round(self.n_bits / capacity * math.log(2)))
+        self.bits = bytearray((self.n_bits + 7) // 8)
+        self.length = 0
+
+    def __positions(self, url:str):
+        # Double hashing on the two halves of the 64-bit fingerprint
+        fingerprint = url_fingerprint(url)
+        h1 = fingerprint & 0xFFFFFFFF
+        h2 = (fingerprint >> 32) | 1
+        for i in range(self.n_hashes):
+            yield (h1 + i * h2) % self.n_bits
+
+    def add(self, url:str) -> None:
+        for position in self.__positions(url):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.length += 1
+
+    def __contains__(self, url:str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self.__positions(url))
+
+    def __len__(self) -> int:
+        """
+        :return: the number of additions, duplicates included
+        """
+        return self.length
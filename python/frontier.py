@@ -0,0 +1,240 @@
+import os
+import time
+import sqlite3
+import logging
+import threading
+from urllib.request import pathname2url
+
+# Local imports
+from fingerprints import FingerprintTable
+from utils.urls import url_fingerprint
+
+logger = logging.getLogger("CRATOR")
+
+FRONTIER_FILE_NAME = "frontier.db"
+CHECKPOINT_OPERATIONS = 100     # number of changes after which the frontier is written on disk
+CHECKPOINT_INTERVAL = 30        # maximum number of seconds between two checkpoints
+
+# Node states
+PENDING = "pending"     # scheduled in the downloader queue
+CRAWLED = "crawled"     # downloaded and stored
+DROPPED = "dropped"     # downloaded but discarded (wrong category, language, status code, retries exhausted...)
+
+
+class FrontierState:
+    """
+    Crawl state reloaded from a FrontierStore.
+    """
+    def __init__(self, unvisited_links=None):
+        self.visited = FingerprintTable()   # url -> node index and depth
+        self.pending = []                   # URLs to be enqueued again, in scheduling order
+        self.retry_counts = {}              # url fingerprint -> number of download retries
+        self.url_attempts = {}              # url fingerprint -> number of captcha attempts
+        self.unvisited_links = unvisited_links if unvisited_links is not None else FingerprintTable()
+        self.n_links_crawled = 0
+        self.elapsed_time = 0
+
+
+class FrontierStore:
+    """
+    On-disk store of the crawl frontier of a seed (SQLite in WAL mode).
+    The changes are committed incrementally, every CHECKPOINT_OPERATIONS changes or CHECKPOINT_INTERVAL seconds,
+    so that a crawl can be resumed with the same node indices and depths after a crash.
+    """
+    def __init__(self, project_path:str, seed:str, read_only:bool =False):
+        """
+        :param project_path: the path where the data of the project are stored
+        :param seed: the url from which the crawler starts
+        :param read_only: True to only read the frontier of a previous project, without changing it
+        """
+        self.path = os.path.join(project_path, FRONTIER_FILE_NAME)
+        self.seed = seed
+        self.read_only = read_only
+        self.lock = threading.Lock()
+
+        if read_only:
+            # The frontier of the previous project is neither created nor changed, not even its journal mode. Without a
+            # WAL file, all its changes are in the database file, which is read as immutable: no WAL or shared memory
+            # file is created next to it.
+            mode = "ro" if os.path.exists(self.path + "-wal") else "ro&immutable=1"
+            self.connection = sqlite3.connect(f"file:{pathname2url(self.path)}?mode={mode}", uri=True,
+                                              check_same_thread=False)
+            # Frontiers stored before the page validators
+            self.has_pages = self.connection.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND "
+                                                     "name = 'pages'").fetchone() is not None
+        else:
+            self.connection = sqlite3.connect(self.path, check_same_thread=False)
+            self.__create_schema()
+            self.has_pages = True
+
+        self.pending_operations = 0
+        self.last_checkpoint = time.time()
+        self.start_time = time.time()
+        self.previous_elapsed_time = 0
+
+    def __create_schema(self) -> None:
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS nodes (
+                                       seed TEXT NOT NULL,
+                                       url TEXT NOT NULL,
+                                       node_index INTEGER NOT NULL,
+                                       depth INTEGER NOT NULL,
+                                       state TEXT NOT NULL,
+                                       retries INTEGER NOT NULL DEFAULT 0,
+                                       attempts INTEGER NOT NULL DEFAULT 0,
+                                       PRIMARY KEY (seed, url))""")
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS unvisited (
+                                       seed TEXT NOT NULL,
+                                       url TEXT NOT NULL,
+                                       PRIMARY KEY (seed, url))""")
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS pages (
+                                       seed TEXT NOT NULL,
+                                       url TEXT NOT NULL,
+                                       etag TEXT,
+                                       last_modified TEXT,
+                                       content_hash TEXT,
+                                       PRIMARY KEY (seed, url))""")
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS meta (
+                                       seed TEXT NOT NULL,
+                                       key TEXT NOT NULL,
+                                       value TEXT,
+                                       PRIMARY KEY (seed, key))""")
+        self.connection.commit()
+
+    def __execute(self, query:str, parameters:tuple) -> None:
+        with self.lock:
+            self.connection.execute(query, parameters)
+            self.pending_operations += 1
+
+    def add_node(self, url:str, node_index:int, depth:int, state:str =PENDING) -> None:
+        """
+        Store a new node of the crawling graph.
+        :param url: the url of the node
+        :param node_index: the index of the node in the graph
+        :param depth: the depth of the node in the graph
+        :param state: the node state (PENDING, CRAWLED or DROPPED)
+        """
+        self.__execute("INSERT OR REPLACE INTO nodes (seed, url, node_index, depth, state) VALUES (?, ?, ?, ?, ?)",
+                       (self.seed, url, node_index, depth, state))
+        self.checkpoint()
+
+    def set_state(self, url:str, state:str) -> None:
+        """
+        Update the state of a stored node. Unknown URLs are ignored.
+        """
+        self.__execute("UPDATE nodes SET state = ? WHERE seed = ? AND url = ?", (state, self.seed, url))
+        self.checkpoint()
+
+    def set_retries(self, url:str, retries:int, attempts:int) -> None:
+        """
+        Update the number of download retries and of captcha attempts of a stored node.
+        """
+        self.__execute("UPDATE nodes SET retries = ?, attempts = ? WHERE seed = ? AND url = ?",
+                       (retries, attempts, self.seed, url))
+        self.checkpoint()
+
+    def add_unvisited(self, url:str) -> None:
+        """
+        Store a link that will not be crawled (e.g., its depth is greater than the maximum depth).
+        """
+        self.__execute("INSERT OR IGNORE INTO unvisited (seed, url) VALUES (?, ?)", (self.seed, url))
+        self.checkpoint()
+
+    def set_page_validators(self, url:str, etag:str, last_modified:str, content_hash:str) -> None:
+        """
+        Store the validators of a crawled page, used by the next incremental crawl to detect the unchanged pages.
+        :param url: the url of the page
+        :param etag: the ETag header of the response, if any
+        :param last_modified: the Last-Modified header of the response, if any
+        :param content_hash: the hash of the page content
+        """
+        self.__execute("INSERT OR REPLACE INTO pages (seed, url, etag, last_modified, content_hash) VALUES (?, ?, ?, ?, ?)",
+                       (self.seed, url, etag, last_modified, content_hash))
+        self.checkpoint()
+
+    def get_page(self, url:str) -> tuple:
+        """
+        :param url: the url of a crawled page
+        :return: the tuple (node_index, etag, last_modified, content_hash) of the page, None if the page has not been
+        crawled
+        """
+        if not self.has_pages:
+            return None
+
+        with self.lock:
+            return self.connection.execute("SELECT n.node_index, p.etag, p.last_modified, p.content_hash "
+                                           "FROM pages p JOIN nodes n ON n.seed = p.seed AND n.url = p.url "
+                                           "WHERE p.seed = ? AND p.url = ?", (self.seed, url)).fetchone()
+
+    def checkpoint(self, force:bool =False) -> None:
+        """
+        Commit the pending changes if there are enough of them or if the last checkpoint is too old.
+        :param force: True to commit the pending changes anyway
+        """
+        if self.read_only:
+            return
+
+        with self.lock:
+            now = time.time()
+            if not force and self.pending_operations < CHECKPOINT_OPERATIONS and now - self.last_checkpoint < CHECKPOINT_INTERVAL:
+                return
+
+            elapsed_time = self.previous_elapsed_time + now - self.start_time
+            self.connection.execute("INSERT OR REPLACE INTO meta (seed, key, value) VALUES (?, 'elapsed_time', ?)",
+                                    (self.seed, str(elapsed_time)))
+            self.connection.commit()
+            self.pending_operations = 0
+            self.last_checkpoint = now
+
+    def is_empty(self) -> bool:
+        """
+        :return: True if no node has been stored for the seed
+        """
+        with self.lock:
+            row = self.connection.execute("SELECT COUNT(*) FROM nodes WHERE seed = ?", (self.seed,)).fetchone()
+        return row[0] == 0
+
+    def load(self, unvisited_links=None) -> FrontierState:
+        """
+        Reload the crawl state stored for the seed.
+        :param unvisited_links: the set receiving the unvisited links (a FingerprintTable or a BloomFilter).
+        A FingerprintTable by default.
+        :return: a FrontierState
+        """
+        state = FrontierState(unvisited_links)
+
+        with self.lock:
+            # Iterate over the cursors, without building the list of all the stored rows
+            rows = self.connection.execute("SELECT url, node_index, depth, state, retries, attempts FROM nodes "
+                                           "WHERE seed = ? ORDER BY node_index", (self.seed,))
+            for url, node_index, depth, node_state, retries, attempts in rows:
+                state.visited.put(url, node_index, depth)
+
+                if node_state == PENDING:
+                    state.pending.append(url)
+                elif node_state == CRAWLED:
+                    state.n_links_crawled += 1
+
+                if retries:
+                    state.retry_counts[url_fingerprint(url)] = retries
+                if attempts:
+                    state.url_attempts[url_fingerprint(url)] = attempts
+
+            for (url,) in self.connection.execute("SELECT url FROM unvisited WHERE seed = ?", (self.seed,)):
+                state.unvisited_links.add(url)
+
+            elapsed = self.connection.execute("SELECT value FROM meta WHERE seed = ? AND key = 'elapsed_time'",
+                                              (self.seed,)).fetchone()
+
+        if elapsed:
+            state.elapsed_time = float(elapsed[0])
+            self.previous_elapsed_time = state.elapsed_time
+
+        logger.info(f"{self.seed} - FRONTIER - Loaded {len(state.visited)} nodes, {len(state.pending)} pending.")
+        return state
+
+    def close(self) -> None:
+        self.checkpoint(force=True)
+        with self.lock:
+            self.connection.close()
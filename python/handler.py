@@ -2,30 +2,76 @@ import time
 import requests
 import threading
 import logging
-import random
-from fake_useragent import UserAgent
-from stem.control import Controller
-from stem import Signal
+from stem.control import Controller, EventType
+from stem import Signal, CircStatus
 from urllib.parse import urlparse
 import psutil
 import subprocess
 import re
+import asyncio
+import secrets
+from requests.structures import CaseInsensitiveDict
 
 from http.cookies import SimpleCookie
 
 # Local imports
 from utils.config import Configuration
+from cookie_store import CookieStore, EXPIRED, INVALID, PROACTIVE
+from cookie_rotation import CookieRotation
+from cookie_health import CookieHealthPool, VALIDATION_CONCURRENCY, RECHECK_INTERVAL, VALID, UNKNOWN
+from concurrency import OVERLOAD_STATUS_CODES
+from hedging import hedge_identity
 import detector
 from exceptions import InvalidCookieException, HTTPStatusCodeError
 from detectors import CaptchaDetector
+from parsed_page import ParsedPage
+from session_pool import SessionPool
+from identity import IdentityManager
+from deadlines import DEFAULT_TIMEOUTS, PAGE, COOKIE_VALIDATION, IP_CHECK
 
 logger = logging.getLogger("CRATOR")
 MAX_CONNECTION_ATTEMPT = 3
 NEW_REQUEST_DELAY = 2
+# Number of circuits requested to Tor after a NEWNYM signal
+PREBUILT_CIRCUITS = 3
+# Maximum number of seconds the requests wait for a new circuit
+CIRCUIT_BUILD_TIMEOUT = 30
+# Seconds between two checks for a new circuit in the asyncio engine
+CIRCUIT_POLL_INTERVAL = 0.05
+
+
+def build_response(url:str, status_code:int, headers, content:bytes, request_url:str =None, reason:str =None,
+                   encoding:str =None) -> requests.Response:
+    """
+    Build a requests.Response from the data of a response received by another HTTP client (e.g., aiohttp), so that
+    the crawler handles all the web pages in the same way.
+    :param url: the final URL of the response
+    :param status_code: the HTTP status code
+    :param headers: the response headers
+    :param content: the response body
+    :param request_url: the URL sent in the HTTP request. The final URL if None.
+    :param reason: the HTTP reason phrase
+    :param encoding: the encoding declared by the server
+    :return: a requests.Response
+    """
+    response = requests.Response()
+    response.url = url
+    response.status_code = status_code
+    response.headers = CaseInsensitiveDict(headers)
+    response._content = content
+    response.reason = reason
+    response.encoding = encoding
+
+    request = requests.PreparedRequest()
+    request.url = request_url if request_url else url
+    response.request = request
+
+    return response
 
 
 class TorHandler:
-    def __init__(self, tor_password:str, tor_port:int, proxy:str, venv_path:str):
+    def __init__(self, tor_password:str, tor_port:int, proxy:str, venv_path:str, identities:IdentityManager =None,
+                 timeouts:dict =None):
         """
         :param tor_password: the password required to authenticate with the Tor control port. It should match the
         hashed password set in the Tor configuration file (torrc).
@@ -33,12 +79,41 @@ class TorHandler:
         :param proxy: the HTTP proxy address to route traffic through Tor. This should be in the format 'socks5h://127.0.0.1:PORT', where PORT
         corresponds to the SOCKS port on which the Tor instance is listening.
         :param venv_path: the path to the python virtual environment
+        :param identities: the header profiles of the identities, it can be shared among several handlers
+        :param timeouts: request type -> RequestTimeout, see deadlines.build_timeouts. DEFAULT_TIMEOUTS if None.
         """
         print("TorHandler init")
         self.proxy = {"http": proxy, "https": proxy}
         self.lock = threading.Lock()
 
         self.n_requests_sent = 0
+        # Protects n_requests_sent, updated by several threads and by the asyncio engine
+        self.counter_lock = threading.Lock()
+        # aiohttp sessions of the asyncio engine: (event loop, identity) -> (isolation token, renewal, session)
+        self.async_sessions = {}
+        # Number of circuit renewals, the sessions opened before a renewal are not used anymore
+        self.n_renewals = 0
+
+        # identity (e.g., a cookie) -> SOCKS credentials isolating its circuits, see get_proxy
+        self.isolation_tokens = {}
+        self.tokens_lock = threading.Lock()
+        # Keep-alive sessions per circuit and host
+        self.sessions = SessionPool()
+        self.identities = identities if identities else IdentityManager()
+        self.timeouts = timeouts if timeouts else DEFAULT_TIMEOUTS
+
+        # Authenticated connection to the control port, opened at the first renewal and kept open
+        self.controller = None
+        # Set when the requests can be sent, cleared while switching to new circuits
+        self.circuit_ready = threading.Event()
+        self.circuit_ready.set()
+        # Circuits requested at the last renewal, circuits built since then and event signaling a circuit event
+        self.pending_circuits = set()
+        self.built_circuits = set()
+        self.circuit_event = threading.Event()
+        # Protects the sets of circuits, updated by the thread of the controller
+        self.circuit_lock = threading.Lock()
+
         self.tor_password = tor_password
         self.tor_port = tor_port
         self.venv_path = venv_path
@@ -59,21 +134,23 @@ class TorHandler:
 
         :return: A random user agent string.
         """
-        ua = UserAgent()
-        return ua.random
+        return self.identities.random_useragent()
 
-    def send_request(self, url:str, cookie:str =None):
+    def send_request(self, url:str, cookie:str =None, headers:dict =None, identity:str =None, request_type:str =PAGE):
         """
         Sends an HTTP request to obtain a web page.
 
         :param url: the URL to send an HTTP request to
         :param cookie: the cookie value to use in the HTTP header
+        :param headers: additional headers (e.g., If-None-Match for a conditional request)
+        :param identity: the identity whose isolated circuit is used. The cookie if None, so that each cookie session
+        keeps its own circuit.
+        :param request_type: the type of request (e.g., deadlines.PAGE, deadlines.IMAGE), which selects its timeouts
         :return: the web page pointed at by the given URL and the used cookie.
         """
-        if self.lock.locked():
-            logger.debug("TOR HANDLER - Waiting for a new ip.")
-        while self.lock.locked():
-            time.sleep(1)
+        if not self.circuit_ready.is_set():
+            logger.debug("TOR HANDLER - Waiting for a new circuit.")
+            self.circuit_ready.wait(CIRCUIT_BUILD_TIMEOUT)
 
         # attempt = 0
         # web_page = None
@@ -81,14 +158,17 @@ class TorHandler:
 
         logger.debug(f"TOR HANDLER - Downloading URL: {url}")
 
-        header = {'User-Agent': self.get_random_useragent()}
+        header = self.identities.headers(identity or cookie)
         if cookie:
             header["Cookie"] = cookie
+        if headers:
+            header.update(headers)
 
-        web_page = requests.get(url, headers=header, proxies=self.proxy)
+        timeout = self.timeouts[request_type].requests_timeout()
+        web_page = self.get_session(url, identity or cookie).get(url, headers=header, timeout=timeout)
         status_code = web_page.status_code
         logger.debug(f"TOR HANDLER - STATUS CODE: {status_code}")
-        self.n_requests_sent += 1
+        self.count_request()
 
         # while not web_page and attempt < MAX_CONNECTION_ATTEMPT:
         #
@@ -106,6 +186,158 @@ class TorHandler:
 
         return web_page, cookie
 
+    def count_request(self) -> int:
+        """
+        Increment the number of HTTP requests sent.
+        :return: the updated number of requests
+        """
+        with self.counter_lock:
+            self.n_requests_sent += 1
+            return self.n_requests_sent
+
+    def get_isolation_token(self, identity:str) -> str:
+        """
+        :param identity: an identity, e.g. a cookie or a crawler worker
+        :return: the isolation token of the identity, created at the first use
+        """
+        with self.tokens_lock:
+            token = self.isolation_tokens.get(identity)
+            if token is None:
+                token = secrets.token_hex(8)
+                self.isolation_tokens[identity] = token
+
+            return token
+
+    def rotate_identity(self, identity:str) -> None:
+        """
+        Give new circuits to an identity, without affecting the circuits of the other identities.
+        The new isolation token is created at the next request of the identity.
+        :param identity: an identity, e.g. a cookie or a crawler worker
+        """
+        with self.tokens_lock:
+            token = self.isolation_tokens.pop(identity, None)
+
+        # The keep-alive connections of the identity use the old circuits
+        if token is not None:
+            self.sessions.reset(token)
+        self.identities.release(identity)
+
+        logger.debug(f"{type(self).__name__} - Identity rotated")
+
+    def get_proxy(self, identity:str =None) -> dict:
+        """
+        Tor isolates the streams with different SOCKS credentials (IsolateSOCKSAuth, enabled by default): the
+        requests of an identity share their circuits, but never with the requests of other identities.
+        :param identity: an identity, e.g. a cookie or a crawler worker. None to use the circuits shared by the
+        requests without identity.
+        :return: the proxies of the requests of the identity, in the format accepted by requests
+        """
+        if identity is None:
+            return self.proxy
+
+        token = self.get_isolation_token(identity)
+        scheme, address = self.proxy["http"].split("://", 1)
+        proxy = f"{scheme}://{token}:{token}@{address}"
+        return {"http": proxy, "https": proxy}
+
+    def get_session(self, url:str, identity:str =None) -> requests.Session:
+        """
+        :param url: the URL to be requested
+        :param identity: an identity, e.g. a cookie or a crawler worker
+        :return: the keep-alive session of the identity for the host of the URL
+        """
+        token = self.get_isolation_token(identity) if identity is not None else None
+        return self.sessions.get(token, urlparse(url).netloc.lower(), self.get_proxy(identity))
+
+    def get_socks_proxy(self, identity:str =None) -> str:
+        """
+        :param identity: an identity, e.g. a cookie or a crawler worker
+        :return: the SOCKS proxy URL of the identity in the format accepted by aiohttp_socks. The host names are always
+        resolved by Tor (socks5h).
+        """
+        return self.get_proxy(identity)["http"].replace("socks5h://", "socks5://")
+
+    async def get_async_session(self, identity:str =None):
+        """
+        :param identity: an identity, e.g. a cookie or a crawler worker
+        :return: the aiohttp session of the identity for the running event loop, routed through the Tor SOCKS proxy.
+        It is created at the first use, because an aiohttp session can be used only by the event loop that created it,
+        and again after the identity is rotated or the circuits are renewed.
+        """
+        import aiohttp
+        from aiohttp_socks import ProxyConnector
+
+        key = (asyncio.get_running_loop(), identity)
+        token = self.get_isolation_token(identity) if identity is not None else None
+        stored_token, renewal, session = self.async_sessions.get(key, (None, None, None))
+
+        if session is not None and (stored_token != token or renewal != self.n_renewals or session.closed):
+            # Its keep-alive connections use the old circuits
+            await session.close()
+            session = None
+
+        if session is None:
+            # The concurrency is bounded by the downloader, not by the connection pool
+            connector = ProxyConnector.from_url(self.get_socks_proxy(identity), rdns=True, limit=0)
+            session = aiohttp.ClientSession(connector=connector)
+            self.async_sessions[key] = (token, self.n_renewals, session)
+
+        return session
+
+    async def close_async_session(self) -> None:
+        """
+        Close the aiohttp sessions of the running event loop.
+        """
+        loop = asyncio.get_running_loop()
+        for key in [key for key in self.async_sessions if key[0] is loop]:
+            _, _, session = self.async_sessions.pop(key)
+            await session.close()
+
+    async def send_request_async(self, url:str, cookie:str =None, headers:dict =None, identity:str =None,
+                                 request_type:str =PAGE):
+        """
+        Sends an HTTP request with the aiohttp session of the identity for the running event loop.
+
+        :param url: the URL to send an HTTP request to
+        :param cookie: the cookie value to use in the HTTP header
+        :param headers: additional headers (e.g., If-None-Match for a conditional request)
+        :param identity: the identity whose isolated circuit is used. The cookie if None.
+        :param request_type: the type of request, which selects its timeouts. The request is cancelled at its deadline.
+        :return: the web page pointed at by the given URL, as a requests.Response, and the used cookie.
+        """
+        if not self.circuit_ready.is_set():
+            logger.debug("TOR HANDLER - Waiting for a new circuit.")
+            waited = 0
+            while not self.circuit_ready.is_set() and waited < CIRCUIT_BUILD_TIMEOUT:
+                await asyncio.sleep(CIRCUIT_POLL_INTERVAL)
+                waited += CIRCUIT_POLL_INTERVAL
+
+        logger.debug(f"TOR HANDLER - Downloading URL: {url}")
+
+        header = self.identities.headers(identity or cookie)
+        if cookie:
+            header["Cookie"] = cookie
+        if headers:
+            header.update(headers)
+
+        import aiohttp
+        request_timeout = self.timeouts[request_type]
+        timeout = aiohttp.ClientTimeout(total=request_timeout.deadline, sock_connect=request_timeout.connect)
+
+        session = await self.get_async_session(identity or cookie)
+        async with session.get(url, headers=header, timeout=timeout) as response:
+            content = await response.read()
+
+            history = [build_response(str(r.url), r.status, r.headers, b"", reason=r.reason) for r in response.history]
+            web_page = build_response(str(response.url), response.status, response.headers, content, request_url=url,
+                                      reason=response.reason, encoding=response.charset)
+            web_page.history = history
+
+        logger.debug(f"TOR HANDLER - STATUS CODE: {web_page.status_code}")
+        self.count_request()
+
+        return web_page, cookie
+
     def is_url_reachable(self, url, cookie=None) -> bool:
         """
         Check if a url is reachable
@@ -130,49 +362,125 @@ class TorHandler:
         logger.debug(f"TOR HANDLER - URL CHECK: FALSE")
         return False
 
-    def renew_connection(self) -> None:
+    def get_controller(self) -> Controller:
         """
-        Restarts Tor to change the IP address.
-        :return: None
+        :return: the authenticated controller of the Tor control port. It is opened at the first call and reopened
+        if the connection has been lost.
         """
-        with self.lock:
-            logger.debug(f"{type(self).__name__} - New ip generation...")
-            header = {'User-Agent': self.get_random_useragent()}
-            try:
-                ip = requests.get('https://api.ipify.org', proxies=self.proxy, headers=header).text.strip()
+        if self.controller is None or not self.controller.is_alive():
+            controller = Controller.from_port(port=self.tor_port)
+            controller.authenticate(self.tor_password)
+            controller.add_event_listener(self.__on_circuit_event, EventType.CIRC)
+            self.controller = controller
+
+        return self.controller
 
-                logger.debug(f"{type(self).__name__}  - Actual IP: {ip}")
+    def __on_circuit_event(self, event) -> None:
+        """
+        Listener of the CIRC events, called by the thread of the controller.
+        """
+        with self.circuit_lock:
+            if event.status == CircStatus.BUILT:
+                self.built_circuits.add(event.id)
+            elif event.status in (CircStatus.FAILED, CircStatus.CLOSED):
+                self.pending_circuits.discard(event.id)
+            else:
+                return
 
-                # Send a request to Tor asking for a new IP address
-                with Controller.from_port(port=self.tor_port) as controller:
-                    controller.authenticate(self.tor_password)
-                    controller.signal(Signal.NEWNYM)
+        self.circuit_event.set()
 
-                time.sleep(10)  # Ensure Tor has time to establish a new circuit
+    def __wait_new_circuit(self, timeout:float) -> bool:
+        """
+        Wait until one of the pending circuits is built.
+        :param timeout: the maximum number of seconds to wait
+        :return: True if a pending circuit has been built, False if all of them failed or the timeout expired
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            with self.circuit_lock:
+                if self.pending_circuits & self.built_circuits:
+                    return True
+                if not self.pending_circuits:
+                    return False
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
 
-                # Check if the IP address has been changed
-                new_ip = self.get_ip()
-                while new_ip == ip:
-                    time.sleep(1)
-                    new_ip = self.get_ip()
+            # A circuit event between the check and the clear is not lost: the sets are checked again
+            self.circuit_event.wait(remaining)
+            self.circuit_event.clear()
 
-                logger.debug(f"{type(self).__name__}  - New IP: {new_ip}")
+    def renew_connection(self) -> None:
+        """
+        Switch Tor to new circuits, so the next requests exit with a new IP address.
+        NEWNYM marks all the current circuits as dirty, then new circuits are requested and the requests are paused
+        only until the first of them is built, as reported by the CIRC events.
+        :return: None
+        """
+        with self.lock:
+            logger.debug(f"{type(self).__name__} - New circuit generation...")
+            try:
+                controller = self.get_controller()
+                if not controller.is_newnym_available():
+                    logger.debug(f"{type(self).__name__} - NEWNYM rate limited for "
+                                 f"{controller.get_newnym_wait():.1f}s, renewal skipped")
+                    return
+
+                self.circuit_ready.clear()
+                start = time.monotonic()
+
+                with self.circuit_lock:
+                    self.built_circuits = set()
+                controller.signal(Signal.NEWNYM)
+                # The keep-alive connections would keep using the old circuits
+                self.sessions.reset()
+                self.n_renewals += 1
+                for _ in range(PREBUILT_CIRCUITS):
+                    circuit_id = controller.new_circuit()
+                    with self.circuit_lock:
+                        self.pending_circuits.add(circuit_id)
+
+                if self.__wait_new_circuit(CIRCUIT_BUILD_TIMEOUT):
+                    logger.debug(f"{type(self).__name__} - New circuit ready in {time.monotonic() - start:.3f}s")
+                else:
+                    logger.error(f"{type(self).__name__} - No new circuit built in {CIRCUIT_BUILD_TIMEOUT}s")
             except Exception as e:
                 logger.error(f"Error during IP renewal: {e}")
-    
+                # The connection is opened again at the next renewal
+                self.close_controller()
+            finally:
+                with self.circuit_lock:
+                    self.pending_circuits = set()
+                self.circuit_ready.set()
+
+    def close_controller(self) -> None:
+        """
+        Close the connection to the Tor control port.
+        """
+        controller, self.controller = self.controller, None
+        if controller is not None:
+            try:
+                controller.close()
+            except Exception as e:
+                logger.error(f"{type(self).__name__} - Error closing the controller: {e}")
 
     def get_ip(self) -> str:
         """
         Returns the current IP address.
         :return: the actual IP address.
         """
-        header = {'User-Agent': self.get_random_useragent()}
-        return requests.get('https://api.ipify.org', proxies=self.proxy, headers=header).text.strip()
+        header = self.identities.headers()
+        timeout = self.timeouts[IP_CHECK].requests_timeout()
+        return self.get_session('https://api.ipify.org').get('https://api.ipify.org', headers=header,
+                                                              timeout=timeout).text.strip()
 
     def stop_tor_process(self) -> None:
         """
         Stop a Tor process listening on any of the specified ports.
         """
+        self.close_controller()
+        self.sessions.reset()
         try:
             subprocess.run(['sudo', self.venv_path, 'python/utils/tor_process_handler.py', str(self.tor_port), str(self.socks_port)])
         except psutil.AccessDenied:
@@ -189,11 +497,15 @@ class TorHandler:
             logger.error(f"{type(self).__name__} - {e}")
 
 class CookieHandler:
-    def __init__(self, seed, torhandler:TorHandler, captcha_detector:CaptchaDetector):
+    def __init__(self, seed, torhandler:TorHandler, captcha_detector:CaptchaDetector, cookie_store:CookieStore =None,
+                 proactive_rotation:bool =True):
         """
         :param seed: the URL to be cralwed
         :param torhandler: an instance of TorHandler
         :param captcha_detector: an instanca of CaptchaDetector
+        :param cookie_store: the store of the cookies. If None, the store defined in the YAML file, which imports the
+        cookies of the YAML file at each change.
+        :param proactive_rotation: True to retire the cookies likely to expire soon, before they are used
         """
         print("CookieHandler init")
         self.config = Configuration()
@@ -202,8 +514,17 @@ class CookieHandler:
         self.tor_handler = torhandler
         self.nocookiepage = None
 
-        self.bucket_cookies = None
-        self.cookies = None
+        # The store created by the handler imports the cookies of the YAML file at each change
+        self.own_store = cookie_store is None
+        if self.own_store:
+            cookie_store = CookieStore(self.config.cookie_store_path())
+            cookie_store.import_config(self.config)
+            self.config.add_listener(cookie_store.import_config)
+        self.cookie_store = cookie_store
+        # Background validation of the cookies, started by start_health_pool
+        self.health_pool = None
+        # Lifetime model of the cookies, None to never retire a cookie before it expires
+        self.rotation = CookieRotation(seed, cookie_store) if proactive_rotation else None
 
         self.captcha_detector = captcha_detector
 
@@ -215,137 +536,207 @@ class CookieHandler:
     def nocookiepage(self, page):
         self._nocookiepage = page
 
-    def is_valid(self, url:str, cookie:str) -> bool:
+    def check_cookie(self, url:str, cookie:str) -> str:
         """
         Checks if the cookie is valid or not.
 
         :param url: the url to send an HTTP request to check the cookie's validity.
         :param cookie: the cookie value to check its validity.
-        :return: True if the cookie is valid, False otherwise.
+        :return: VALID, INVALID (login redirection or captcha), or UNKNOWN if the request failed (e.g., Tor timeout,
+        circuit failure, 5xx answer) and nothing is known about the cookie.
         """
         parsed = urlparse(url)
         if parsed.scheme not in ["http", "https"]:
             url = "http://" + url
 
         try:
-            web_page, _ = self.tor_handler.send_request(url, cookie)
+            web_page, _ = self.tor_handler.send_request(url, cookie, request_type=COOKIE_VALIDATION)
+        except Exception as e:
+            logger.error(f"{self.seed} COOKIE HANDLER - Validity CHECK: unknown -> {str(e)}")
+            return UNKNOWN
+
+        if web_page.status_code >= 500 or web_page.status_code in OVERLOAD_STATUS_CODES:
+            logger.info(f"{self.seed} COOKIE HANDLER - Validity CHECK: unknown -> Status code {web_page.status_code}")
+            return UNKNOWN
+
+        try:
             if self.nocookiepage and detector.login_redirection(web_page, self.nocookiepage):
                 logger.info(f"{self.seed} COOKIE HANDLER - Validity CHECK: False -> Login redirection")
-                return False
-            if self.captcha_detector.has_captcha(web_page.content) or detector.captcha_detector(url, web_page):
+                return INVALID
+            page = ParsedPage(web_page)
+            captcha = self.captcha_detector.has_captcha(page) or detector.captcha_detector(url, page)
+            page.release()
+            if captcha:
                 logger.info(f"{self.seed} COOKIE HANDLER - Validity CHECK: False -> Captcha")
-                return False
+                return INVALID
         except Exception as e:
             logger.error(f"{self.seed} COOKIE HANDLER - Error msg: {str(e)}")
-            return False
+            return UNKNOWN
+
+        return VALID
+
+    def is_valid(self, url:str, cookie:str) -> bool:
+        """
+        :return: True if the cookie is known to be valid, False otherwise.
+        """
+        return self.check_cookie(url, cookie) == VALID
+
+    def create_health_pool(self, url:str, concurrency:int =VALIDATION_CONCURRENCY,
+                           recheck_interval:float =RECHECK_INTERVAL) -> CookieHealthPool:
+        """
+        Create the pool validating the cookies of self.seed concurrently, if it does not exist.
+
+        :param url: the url to send an HTTP request to check the cookie's validity.
+        :param concurrency: the maximum number of cookies validated at the same time.
+        :param recheck_interval: the seconds after which a valid cookie is validated again.
+        :return: the health pool
+        """
+        if self.health_pool is None:
+            self.health_pool = CookieHealthPool(self.seed, self.cookie_store,
+                                                lambda cookie: self.check_cookie(url, cookie),
+                                                concurrency, recheck_interval, on_retire=self.release_identities)
+        return self.health_pool
+
+    def start_health_pool(self, url:str, concurrency:int =VALIDATION_CONCURRENCY,
+                          recheck_interval:float =RECHECK_INTERVAL) -> None:
+        """
+        Validate the cookies of self.seed in the background and wait for the first valid cookie.
 
-        return True
+        :param url: the url to send an HTTP request to check the cookie's validity.
+        :param concurrency: the maximum number of cookies validated at the same time.
+        :param recheck_interval: the seconds after which a valid cookie is validated again.
+        :return: None
+        """
+        print("\nCOOKIE HANDLER - Cookies validity check\n")
+        logger.info(f"{self.seed} COOKIE HANDLER - Cookies validity check in the background")
+        if not self.cookie_store.count(self.seed):
+            error_msg = "Empty cookie store. Please add at least one valid cookie."
+            logger.error(f"{self.seed} COOKIE HANDLER - {error_msg}")
+            raise InvalidCookieException(error_msg)
+
+        health_pool = self.create_health_pool(url, concurrency, recheck_interval)
+        health_pool.start()
+
+        if not health_pool.wait_ready():
+            logger.warning(f"{self.seed} COOKIE HANDLER - No valid cookie found")
 
     def cookies_validity_check(self, url:str) -> None:
         """
-        Checks whether the cookies stored in the YAML file for the self.seed are still valid, otherwise, deletes them if they are not.
+        Checks whether the cookies stored for the self.seed are still valid, otherwise, deletes them if they are not.
+        The cookies are checked concurrently.
 
         :param url: the url to send an HTTP request to check the cookie's validity.
         :return: None
         """
         print("\nCOOKIE HANDLER - Cookies validity check\n")
         logger.info(f"{self.seed} COOKIE HANDLER - Cookies validity check ")
-        if not self.cookies or self.config.is_updated():
-            try:
-                self.cookies = self.config.cookies(self.seed)
-                # self.cookies = market_config.get_cookies(self.market)
-            except:
-                error_msg = "No cookies found in the market config file"
-                logger.error(f"{self.seed} COOKIE HANDLER - {error_msg}")
-                print(f"in coockies_validity_check(): {self.seed} COOKIE HANDLER - {error_msg}")
-                raise FileNotFoundError(error_msg)
-
-        if not self.cookies:
-            error_msg = "Empty list in the market config file. Please update it with at least one valid cookie."
+        if not self.cookie_store.count(self.seed):
+            error_msg = "Empty cookie store. Please add at least one valid cookie."
             logger.error(f"{self.seed} COOKIE HANDLER - {error_msg}")
             raise InvalidCookieException(error_msg)
 
-        for cookie in self.cookies:
-            logger.info(f"{self.seed} - Cookie validity check")
-            logger.info(f"{self.seed} - Cookie: {cookie}")
-
-            if not self.is_valid(url, cookie):
-                logger.info(f"{self.seed} - INVALID COOKIE")
-                self.remove_cookie(cookie)
-            else:
-                logger.info(f"{self.seed} - VALID COOKIE")
+        n_valid = self.create_health_pool(url).validate_all()
+        logger.info(f"{self.seed} COOKIE HANDLER - {n_valid} VALID COOKIES")
 
     def get_random_cookie(self, url:str, validity_check:bool =True) -> str:
         """
-        Gets a random cookie from the bucket to use for an HTTP request.
+        Gets a cookie to use for an HTTP request: a cookie recently validated by the health pool, if any, otherwise
+        a cookie leased from the store. The cookies are used in round-robin order, and the failing cookies and the
+        cookies likely to expire soon are retired before being used, as long as other cookies are left.
 
         :param url: the URL to send an HTTP request to, requiring a cookie.
-        :param validity_check: the flag indicating whether or not to check the validity of the cookie.
-        :return: a random cookie from the bucket, None otherwise.
+        :param validity_check: the flag indicating whether or not to check the validity of a cookie of the store.
+        :return: a cookie, None if there are no valid cookies for the seed.
         """
-        # Check if there are cookies in the cookie list. If not, read them from the market config file.
-        if not self.cookies or self.config.is_updated():
-            try:
-                self.cookies = self.config.cookies(self.seed)
-                # self.cookies = market_config.get_cookies(self.market)
-                if not self.cookies:
-                    # raise InvalidCookieException("Empty list in the market config file. "
-                    #                              "Please update it with at least one valid cookie.")
-                    return None
-            except:
-                raise FileNotFoundError("No cookies found in the market config file")
-
-        # Bucket cookies list is empty because all the cookies have already been chosen.
-        # Replenish the bucket with the cookies saved in the market config file
-        if not self.bucket_cookies:
-            self.bucket_cookies = self.cookies.copy()
-
-        logger.debug(f"{self.seed} COOKIE HANDLER - RANDOM COOKIE -> COOKIE LIST")
-        [logger.debug(f"{self.seed} - {ck}") for ck in self.cookies]
-        logger.debug(f"{self.seed} COOKIE HANDLER - RANDOM COOKIE -> BUCKET COOKIE LIST")
-        [logger.debug(f"{self.seed} - {ck}") for ck in self.bucket_cookies]
-
-        if not validity_check:
-            random_index = random.randint(0, len(self.bucket_cookies) - 1)  # generate a random index
-            return self.bucket_cookies.pop(random_index)  # remove the element at the random index
-
-        # Cookie validity check
-        while self.bucket_cookies:
-            random_index = random.randint(0, len(self.bucket_cookies) - 1)  # generate a random index
-            random_cookie = self.bucket_cookies.pop(random_index)  # remove the element at the random index
-
-            logger.debug(f"{self.seed} COOKIE HANDLER - RANDOM COOKIE -> BUCKET COOKIE LIST (UPDATE)")
-            [logger.debug(f"{self.seed} - {ck}") for ck in self.bucket_cookies]
-
-            if self.is_valid(url, random_cookie):
-                return random_cookie
-            else:
-                # Remove the invalid cookie from the list and in the market config file
-                self.remove_cookie(random_cookie)
-
-            if not self.bucket_cookies:
-                self.bucket_cookies = self.cookies.copy()
+        while True:
+            cookie = self.health_pool.get() if self.health_pool is not None else None
+            verified = cookie is not None
+            if cookie is None:
+                cookie = self.cookie_store.lease(self.seed)
+            if cookie is None:
+                return None
+
+            # Cookie validity check. A cookie of unknown validity is used: the request will tell.
+            if validity_check and not verified and self.check_cookie(url, cookie) == INVALID:
+                self.retire_cookie(cookie, INVALID)
+                continue
+
+            usage = self.cookie_store.record_use(self.seed, cookie)
+            # Removed by another process
+            if usage is None:
+                if self.health_pool is not None:
+                    self.health_pool.discard(cookie)
+                continue
+
+            age, requests, failures = usage
+            if self.rotation and self.cookie_store.count(self.seed) > 1:
+                if self.rotation.is_failing(requests, failures):
+                    logger.info(f"{self.seed} COOKIE HANDLER - Cookie retired after {failures} failed requests")
+                    self.retire_cookie(cookie, EXPIRED)
+                    continue
+                if self.rotation.should_retire(age, requests, cookie):
+                    logger.info(f"{self.seed} COOKIE HANDLER - Cookie retired after {age:.0f}s and {requests} requests")
+                    self.retire_cookie(cookie, PROACTIVE)
+                    continue
+
+            return cookie
+
+    def wait_cookie(self, timeout:float =None) -> str:
+        """
+        Leases a cookie from the store, waiting for a new cookie (e.g., from extract_cookie.py) if there are none.
 
-        return None
+        :param timeout: the maximum number of seconds to wait, None to wait forever.
+        :return: a cookie, None if the timeout expired.
+        """
+        cookie = self.cookie_store.wait_lease(self.seed, timeout)
+        if cookie is not None:
+            self.cookie_store.record_use(self.seed, cookie)
+        return cookie
 
     def remove_cookie(self, cookie:str) -> None:
         """
-        Remove the cookie from the list and in the market config file
+        Remove the cookie from the store
         :param cookie: the cookie to be removed.
         :return: None
         """
-        try:
-            logger.debug(f"{self.seed} - REMOVE COOKIE")
-            logger.debug(f"{self.seed} - COOKIE LIST")
-            [logger.debug(f"{self.seed} - BEFORE: {cookie}") for cookie in self.cookies]
-            self.cookies.remove(cookie)
-            [logger.debug(f"{self.seed} - AFTER: {cookie}") for cookie in self.cookies]
-
-            self.config.remove_cookie(self.seed, cookie)
-            # market_config.remove_cookie(self.market, cookie)
-        except ValueError as ve:
+        logger.debug(f"{self.seed} - REMOVE COOKIE")
+        if self.health_pool is not None:
+            self.health_pool.discard(cookie)
+        if not self.cookie_store.remove(self.seed, cookie):
             logger.error(f"{self.seed} - COOKIE TO REMOVE NOT FOUND.")
-            logger.error(f"{self.seed} - Error msg: {str(ve)}.")
+
+    def retire_cookie(self, cookie:str, reason:str =EXPIRED) -> None:
+        """
+        Remove the cookie from the store, recording its lifetime for the rotation of the next cookies, and release its
+        identities.
+        :param cookie: the cookie to be retired.
+        :param reason: EXPIRED (captcha or login redirection), INVALID or PROACTIVE.
+        :return: None
+        """
+        logger.debug(f"{self.seed} - RETIRE COOKIE ({reason})")
+        if self.health_pool is not None:
+            self.health_pool.discard(cookie)
+        if not self.cookie_store.retire(self.seed, cookie, reason):
+            logger.error(f"{self.seed} - COOKIE TO RETIRE NOT FOUND.")
+        self.release_identities(cookie)
+
+    def release_identities(self, cookie:str) -> None:
+        """
+        Drop the circuits and the header profiles of a cookie and of its duplicate requests.
+        :param cookie: a retired cookie.
+        :return: None
+        """
+        for identity in (cookie, hedge_identity(cookie)):
+            self.tor_handler.rotate_identity(identity)
+
+    def stop(self) -> None:
+        """
+        Stop the background validation of the cookies and the import of the cookies of the YAML file.
+        """
+        if self.health_pool is not None:
+            self.health_pool.stop()
+        if self.own_store:
+            self.config.remove_listener(self.cookie_store.import_config)
 
 
 if __name__ == '__main__':
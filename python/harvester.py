@@ -0,0 +1,154 @@
+import math
+import time
+import logging
+import threading
+from collections import deque
+
+# Local imports
+from cookie_store import CookieStore
+from cookie_rotation import CookieRotation, MIN_POOL_SIZE
+
+logger = logging.getLogger("CRATOR")
+
+HARVEST_WORKERS = 3         # cookie extractors working at the same time
+CONSUMPTION_WINDOW = 3600   # seconds of retired cookies used to measure the consumption of the crawlers
+LEAD_TIME = 600             # seconds of consumption covered by the pool, i.e. the time to harvest the replacements
+CHECK_INTERVAL = 5          # seconds between two checks of the pool by an idle worker
+RATE_WINDOW = 600           # seconds of harvested cookies used to measure the harvest rate
+# Prefix of the identities of the workers, each one with its own isolated circuits
+HARVESTER_IDENTITY = "harvester:"
+
+
+class CookieHarvester:
+    """
+    Service harvesting the cookies of a seed with several cookie extractors in parallel, each one on its own isolated
+    circuits, so that each cookie is obtained from a different IP address without restarting Tor.
+    The number of extractors at work follows the deficit of the pool. The target pool size covers the consumption of
+    the crawlers, measured on the cookies retired in the last CONSUMPTION_WINDOW seconds, over the next LEAD_TIME
+    seconds, and the cookies about to be retired are replaced in advance.
+    """
+    def __init__(self, seed:str, cookie_store:CookieStore, create_extractor, n_workers:int =HARVEST_WORKERS,
+                 rotation:CookieRotation =None, lead_time:float =LEAD_TIME):
+        """
+        :param seed: the seed URL of the cookies
+        :param cookie_store: the store shared with the crawlers
+        :param create_extractor: the function creating the cookie extractor of a worker from its identity
+        :param n_workers: the maximum number of extractors working at the same time
+        :param rotation: the lifetime model of the cookies, a new one if None
+        :param lead_time: the seconds of consumption covered by the pool
+        """
+        self.seed = seed
+        self.cookie_store = cookie_store
+        self.create_extractor = create_extractor
+        self.n_workers = max(1, n_workers)
+        self.rotation = rotation if rotation is not None else CookieRotation(seed, cookie_store)
+        self.lead_time = lead_time
+
+        self.in_progress = 0
+        self.n_attempts = 0
+        self.n_harvested = 0
+        # Times of the last harvested cookies
+        self.harvest_times = deque()
+
+        self.condition = threading.Condition()
+        self.running = False
+        self.threads = []
+
+    def consumption_rate(self) -> float:
+        """
+        :return: the number of cookies retired per second by the crawlers
+        """
+        return self.cookie_store.count_retired(self.seed, time.time() - CONSUMPTION_WINDOW) / CONSUMPTION_WINDOW
+
+    def target_size(self) -> int:
+        """
+        :return: the number of cookies the pool must have to cover the consumption over the lead time
+        """
+        return max(MIN_POOL_SIZE, math.ceil(self.consumption_rate() * self.lead_time))
+
+    def needed(self) -> int:
+        """
+        :return: the number of cookies to be harvested: the cookies missing to reach the target size, and the
+        cookies expected to be retired within the lead time
+        """
+        return self.rotation.replacements_needed(self.lead_time, self.target_size())
+
+    def start(self) -> None:
+        with self.condition:
+            if self.running:
+                return
+            self.running = True
+
+        for index in range(self.n_workers):
+            thread = threading.Thread(target=self.__work, args=(HARVESTER_IDENTITY + str(index),), daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def __reserve(self) -> bool:
+        """
+        Wait until the pool needs a cookie that no other worker is harvesting.
+        :return: True if the worker can harvest a cookie, False if the harvester has been stopped
+        """
+        with self.condition:
+            while self.running:
+                if self.in_progress < min(self.n_workers, self.needed()):
+                    self.in_progress += 1
+                    return True
+
+                self.condition.wait(CHECK_INTERVAL)
+
+        return False
+
+    def __work(self, identity:str) -> None:
+        extractor = self.create_extractor(identity)
+
+        while self.__reserve():
+            success = False
+            try:
+                success = extractor.store_new_cookie(self.cookie_store)
+            except Exception as e:
+                logger.error(f"{self.seed} HARVESTER - Error harvesting a cookie: {e}")
+
+            if not success:
+                # The circuit may be the cause of the failure
+                extractor.new_identity()
+
+            with self.condition:
+                self.in_progress -= 1
+                self.n_attempts += 1
+                if success:
+                    self.n_harvested += 1
+                    self.harvest_times.append(time.monotonic())
+                self.condition.notify_all()
+
+    def harvest_rate(self) -> float:
+        """
+        :return: the number of cookies harvested per minute in the last RATE_WINDOW seconds
+        """
+        now = time.monotonic()
+        with self.condition:
+            while self.harvest_times and now - self.harvest_times[0] > RATE_WINDOW:
+                self.harvest_times.popleft()
+
+            return len(self.harvest_times) * 60 / RATE_WINDOW
+
+    def stats(self) -> tuple:
+        """
+        :return: the number of attempts, of harvested cookies, the success ratio, the harvest rate (cookies per
+        minute), the target pool size and the number of stored cookies
+        """
+        harvest_rate = self.harvest_rate()
+        with self.condition:
+            n_attempts, n_harvested = self.n_attempts, self.n_harvested
+
+        success_ratio = n_harvested / n_attempts if n_attempts else 0.0
+        return (n_attempts, n_harvested, round(success_ratio, 3), round(harvest_rate, 2), self.target_size(),
+                self.cookie_store.count(self.seed))
+
+    def stop(self) -> None:
+        """
+        Stop the workers after their current attempt.
+        """
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
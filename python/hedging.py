@@ -0,0 +1,116 @@
+import logging
+import threading
+from collections import deque
+from urllib.parse import urlparse
+
+# Local imports
+from concurrency import percentile
+
+logger = logging.getLogger("CRATOR")
+
+HEDGE_BUDGET = 0.05         # maximum ratio of duplicate requests to requests
+HEDGE_PERCENTILE = 0.95     # a request is duplicated when it is slower than this percentile of its host
+LATENCY_WINDOW = 50         # number of latencies of a host used to compute the percentile
+MIN_SAMPLES = 20            # latencies of a host needed before its requests are duplicated
+# Prefix of the identity of the duplicate requests, so that they use other circuits than the original ones
+HEDGE_IDENTITY = "hedge:"
+
+
+def hedge_identity(cookie:str) -> str:
+    """
+    :param cookie: the cookie of the original request, None if it has no cookie
+    :return: the identity of the duplicate request, whose isolated circuit is different from the circuit of the
+    original request. It is released with the identity of the cookie.
+    """
+    return HEDGE_IDENTITY + (cookie or "")
+
+
+class Hedger:
+    """
+    Policy of the hedged requests. Tor latency is heavy-tailed: most requests complete in a few seconds, but a bad
+    circuit can take much longer. When a request is slower than the usual latency of its host, a duplicate is sent
+    through another circuit and the first response wins.
+    The duplicates are bounded by a budget proportional to the number of requests.
+    """
+    def __init__(self, budget:float =HEDGE_BUDGET, q:float =HEDGE_PERCENTILE, window:int =LATENCY_WINDOW,
+                 min_samples:int =MIN_SAMPLES):
+        """
+        :param budget: the maximum ratio of duplicate requests to requests
+        :param q: the percentile of the latency of a host after which a request is duplicated
+        :param window: the number of latencies of a host used to compute the percentile
+        :param min_samples: the number of latencies of a host needed before its requests are duplicated
+        """
+        self.budget = budget
+        self.q = q
+        self.window = window
+        self.min_samples = min_samples
+
+        # host -> last latencies
+        self.latencies = {}
+        self.n_requests = 0
+        self.n_hedges = 0
+        # Duplicates completing before their original request, and the seconds they saved
+        self.n_wins = 0
+        self.saved = 0.0
+        self.lock = threading.Lock()
+
+    def count_request(self) -> None:
+        with self.lock:
+            self.n_requests += 1
+
+    def observe(self, url:str, latency:float) -> None:
+        """
+        Record the latency of a successful request, or the seconds elapsed when its duplicate completed first.
+        """
+        host = urlparse(url).netloc.lower()
+        with self.lock:
+            if host not in self.latencies:
+                self.latencies[host] = deque(maxlen=self.window)
+            self.latencies[host].append(latency)
+
+    def threshold(self, url:str) -> float:
+        """
+        :return: the seconds after which a request to the host of the URL is duplicated, None if the host does not
+        have enough latencies yet
+        """
+        host = urlparse(url).netloc.lower()
+        with self.lock:
+            latencies = self.latencies.get(host)
+            if not latencies or len(latencies) < self.min_samples:
+                return None
+
+            return percentile(latencies, self.q)
+
+    def try_hedge(self) -> bool:
+        """
+        Reserve a duplicate request, if the budget allows it.
+        :return: True if the duplicate can be sent
+        """
+        with self.lock:
+            if self.n_hedges + 1 > self.budget * self.n_requests:
+                return False
+
+            self.n_hedges += 1
+            return True
+
+    def record_win(self) -> None:
+        """
+        Record a duplicate request completed before its original request.
+        """
+        with self.lock:
+            self.n_wins += 1
+
+    def record_saved(self, saved:float) -> None:
+        """
+        :param saved: the seconds between the response of a winning duplicate and the response of its original
+        request. The original requests never completed are not counted.
+        """
+        with self.lock:
+            self.saved += max(0.0, saved)
+
+    def stats(self) -> tuple:
+        """
+        :return: the number of requests, of duplicate requests, of duplicates completed first and the seconds saved
+        """
+        with self.lock:
+            return self.n_requests, self.n_hedges, self.n_wins, round(self.saved, 3)
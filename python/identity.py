@@ -0,0 +1,74 @@
+import random
+import logging
+import threading
+from fake_useragent import UserAgent
+
+logger = logging.getLogger("CRATOR")
+
+N_PROFILES = 32     # number of header profiles built when the manager is first used
+
+ACCEPT = "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8"
+ACCEPT_LANGUAGES = ["en-US,en;q=0.5", "en-US,en;q=0.9", "en-GB,en;q=0.9", "en-GB,en-US;q=0.8,en;q=0.6",
+                    "en;q=0.8"]
+
+
+class IdentityManager:
+    """
+    Pool of header profiles (User-Agent, Accept, Accept-Language) bound to the identities of the requests, e.g. the
+    cookies. An identity sends the same headers for its whole lifetime, as a real browser session would do.
+    The user agent dataset is loaded once, when the first profile is needed.
+    """
+    def __init__(self, n_profiles:int =N_PROFILES):
+        """
+        :param n_profiles: the number of header profiles of the pool
+        """
+        self.n_profiles = n_profiles
+        self.user_agent = None
+        self.profiles = []
+        # identity -> header profile
+        self.bindings = {}
+        self.lock = threading.Lock()
+
+    def __load_profiles(self) -> None:
+        """
+        Build the header profiles. It must be called holding the lock.
+        """
+        self.user_agent = UserAgent()
+        user_agents = {self.user_agent.random for _ in range(self.n_profiles)}
+        self.profiles = [{"User-Agent": user_agent,
+                          "Accept": ACCEPT,
+                          "Accept-Language": random.choice(ACCEPT_LANGUAGES)} for user_agent in user_agents]
+        logger.debug(f"IDENTITY MANAGER - {len(self.profiles)} header profiles built")
+
+    def random_useragent(self) -> str:
+        """
+        :return: a random user agent string, not bound to any identity
+        """
+        with self.lock:
+            if self.user_agent is None:
+                self.__load_profiles()
+
+            return self.user_agent.random
+
+    def headers(self, identity:str =None) -> dict:
+        """
+        :param identity: an identity, e.g. a cookie. The requests without identity share the profile bound to None.
+        :return: a copy of the header profile of the identity, bound to it at the first call
+        """
+        with self.lock:
+            profile = self.bindings.get(identity)
+            if profile is None:
+                if not self.profiles:
+                    self.__load_profiles()
+
+                profile = random.choice(self.profiles)
+                self.bindings[identity] = profile
+
+        return dict(profile)
+
+    def release(self, identity:str) -> None:
+        """
+        Unbind the profile of an identity. A new identity with the same key gets a new random profile.
+        """
+        with self.lock:
+            self.bindings.pop(identity, None)
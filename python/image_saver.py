@@ -17,12 +17,16 @@ from scrapers.cocorico_scraper import CocoricoScraper
 import utils.fileutils as file_utils
 from handler import TorHandler
 from scrapers import Scraper
+from rate_limiter import RateLimiter
+from deadlines import IMAGE
+from mirror_pool import MirrorPool
 
 
 logger = logging.getLogger("CRATOR")
 
 class ImageSaver:
-    def __init__(self, website, save_path, image_mapping_path, macro_category, micro_category, scraper: Scraper, tor_handler:TorHandler, base64_flag:bool, n_threads=1):
+    def __init__(self, website, save_path, image_mapping_path, macro_category, micro_category, scraper: Scraper, tor_handler:TorHandler, base64_flag:bool, n_threads=1,
+                 rate_limiter:RateLimiter =None, mirrors:MirrorPool =None):
         """
         :param website: website name
         :param save_path: the file path to store the images
@@ -32,6 +36,10 @@ class ImageSaver:
         :param scraper: an instance of Scraper class
         :param tor_handler: an instance of TorHandler to make an HTTP request
         :param base64_flag: True if images are encoded in base64, False otherwise
+        :param rate_limiter: an instance of RateLimiter, to count the image requests in the request rate of the
+        marketplace. None to send them without waiting.
+        :param mirrors: the mirrors of the marketplace, to spread the image requests over them. None to request the
+        host of the image URL.
         """
         self.n_threads = n_threads
         self.save_path = save_path
@@ -42,10 +50,14 @@ class ImageSaver:
 
         self.queue = deque()
         self.lock = threading.Lock()
+        # Protects the image mapping file, written by the saver thread and by add_references
+        self.mapping_lock = threading.Lock()
         self.running = True
         self.tor_handler = tor_handler
         self.base64_flag = base64_flag
         self.scraper = scraper
+        self.rate_limiter = rate_limiter
+        self.mirrors = mirrors
 
     def enqueue(self, src_image, url, index_node:int, depth_node:int, cookie, count:int, product_information:dict) -> None:
         """
@@ -61,6 +73,24 @@ class ImageSaver:
         #print("Aggiunto foto da salvare")
         self.queue.append((src_image, url, index_node, depth_node, cookie, count, product_information))
 
+    def add_references(self, rows:list, url, index_node:int, depth_node:int, previous_image_path:str) -> None:
+        """
+        Carry forward the images of an unchanged product page from a previous crawl: the rows of the previous image
+        mapping are written again with the node of the current crawl, and they point to the previous image files.
+        :param rows: the rows of the previous image_mapping.csv for the web page
+        :param url: web page url
+        :param index_node: web page index in the graph
+        :param depth_node: web page depth level in the graph
+        :param previous_image_path: the images folder of the previous crawl
+        """
+        with self.mapping_lock:
+            with open(self.image_mapping_file, mode="a", newline='', encoding="utf-8") as csvfile:
+                csv_writer = csv.writer(csvfile, quotechar='"', quoting=csv.QUOTE_MINIMAL)
+                for row in rows:
+                    # Path of the previous image relative to the images folder of this crawl
+                    image = os.path.relpath(os.path.join(previous_image_path, row[1]), self.save_path)
+                    csv_writer.writerow([row[0], image, str(index_node)+".html", url, depth_node, index_node] + row[6:])
+
     def is_empty(self) -> bool:
         """
         :return: True if the queue is not empty, False otherwise
@@ -129,7 +159,18 @@ class ImageSaver:
 
         # Send an HTTP request to obtain the image
         try:
-            img_response, _ = self.tor_handler.send_request(full_img_url, cookie)
+            if self.rate_limiter:
+                self.rate_limiter.acquire(full_img_url)
+
+            request_url, mirror = self.mirrors.resolve(full_img_url) if self.mirrors else (full_img_url, None)
+            start = time.monotonic()
+            failed = True
+            try:
+                img_response, _ = self.tor_handler.send_request(request_url, cookie, request_type=IMAGE)
+                failed = img_response.status_code >= 500
+            finally:
+                if self.mirrors:
+                    self.mirrors.release(mirror, time.monotonic() - start, failed)
 
             response_content_type = img_response.headers.get('content-type')
             print(f"content-type: {response_content_type}")
@@ -192,7 +233,7 @@ class ImageSaver:
                             executor.submit(file_utils.save_image, image_data, dir)
 
                             # Store the mapping image - url
-                            with open(self.image_mapping_file, mode="a", newline='', encoding="utf-8") as csvfile:
+                            with self.mapping_lock, open(self.image_mapping_file, mode="a", newline='', encoding="utf-8") as csvfile:
                                 print("Updating the csv file")
                                 csv_writer = csv.writer(csvfile, quotechar='"', quoting=csv.QUOTE_MINIMAL)
                                 csv_writer.writerow([self.website, file_name, str(index_node)+".html", url, depth_node, index_node, product_information["title"], product_information["description"], product_information["vendor"], product_information["origin"], product_information["destination"], product_information["currency"], product_information["price"], product_information["cryptocurrency"], product_information["crypto_price"], self.macro_category, self.micro_category])
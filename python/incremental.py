@@ -0,0 +1,126 @@
+import os
+import csv
+import hashlib
+import logging
+
+# Local imports
+from frontier import FrontierStore, FRONTIER_FILE_NAME
+from handler import build_response
+from utils.urls import url_fingerprint
+
+logger = logging.getLogger("CRATOR")
+
+NOT_MODIFIED = 304
+
+
+def content_hash(web_page) -> str:
+    """
+    :param web_page: the web page retrieved from a request
+    :return: the hash of the page content
+    """
+    return hashlib.sha256(web_page.content).hexdigest()
+
+
+class PreviousCrawl:
+    """
+    Data of a previous crawl of the same seed, used by an incremental crawl to send conditional requests and to reuse
+    the pages and the images of the unchanged products.
+    """
+    def __init__(self, project_path:str, seed:str, page_encoding:str =None):
+        """
+        :param project_path: the folder of the previous project
+        :param seed: the url from which the crawler starts
+        :param page_encoding: the encoding of the marketplace pages, used to reload the stored pages
+        """
+        if not os.path.exists(os.path.join(project_path, FRONTIER_FILE_NAME)):
+            raise FileNotFoundError(f"The project folder '{project_path}' has no {FRONTIER_FILE_NAME} to be reused.")
+
+        self.project_path = project_path
+        self.page_path = os.path.join(project_path, "pages")
+        self.image_path = os.path.join(project_path, "images")
+        self.image_mapping_path = os.path.join(self.image_path, "image_mapping.csv")
+        self.page_encoding = page_encoding if page_encoding else "utf-8"
+
+        self.frontier = FrontierStore(project_path, seed, read_only=True)
+        # url fingerprint -> rows of the previous image mapping, loaded at the first use
+        self.image_rows = None
+
+    def conditional_headers(self, url:str) -> dict:
+        """
+        :param url: the url to be requested
+        :return: the If-None-Match and If-Modified-Since headers of the page, an empty dictionary if the page has not
+        been crawled before or the server sent no validators
+        """
+        page = self.frontier.get_page(url)
+        if not page:
+            return {}
+
+        _, etag, last_modified, _ = page
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+
+        return headers
+
+    def is_unchanged(self, url:str, web_page) -> bool:
+        """
+        :param url: the requested url
+        :param web_page: the web page retrieved from the request
+        :return: True if the server answered 304 Not Modified or the content is the same of the previous crawl
+        """
+        if web_page.status_code == NOT_MODIFIED:
+            return True
+
+        page = self.frontier.get_page(url)
+        return page is not None and page[3] == content_hash(web_page)
+
+    def get_content_hash(self, url:str) -> str:
+        """
+        :return: the content hash of the page in the previous crawl, None if the page has not been crawled
+        """
+        page = self.frontier.get_page(url)
+        return page[3] if page else None
+
+    def reload_page(self, url:str, web_page):
+        """
+        Rebuild the web page of a 304 Not Modified response from the page stored by the previous crawl.
+        :param url: the requested url
+        :param web_page: the 304 response
+        :return: a response with the stored content, None if the page is not stored
+        """
+        page = self.frontier.get_page(url)
+        if not page:
+            return None
+
+        file_path = os.path.join(self.page_path, f"{page[0]}.html")
+        if not os.path.exists(file_path):
+            return None
+
+        with open(file_path, "r") as file:
+            content = file.read().encode(self.page_encoding, errors="xmlcharrefreplace")
+
+        response = build_response(web_page.url, 200, web_page.headers, content, request_url=url,
+                                  encoding=self.page_encoding)
+        response.history = web_page.history
+        return response
+
+    def get_image_rows(self, url:str) -> list:
+        """
+        :param url: the url of a product page
+        :return: the rows of the previous image_mapping.csv for the page
+        """
+        if self.image_rows is None:
+            self.image_rows = {}
+            if os.path.exists(self.image_mapping_path):
+                with open(self.image_mapping_path, "r", newline="", encoding="utf-8") as csvfile:
+                    reader = csv.reader(csvfile)
+                    next(reader, None)
+                    for row in reader:
+                        self.image_rows.setdefault(url_fingerprint(row[3]), []).append(row)
+
+        return self.image_rows.get(url_fingerprint(url), [])
+
+    def close(self) -> None:
+        self.frontier.close()
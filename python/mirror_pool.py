@@ -0,0 +1,170 @@
+import time
+import random
+import logging
+import threading
+from urllib.parse import urlsplit, urlunsplit
+
+logger = logging.getLogger("CRATOR")
+
+# Weight of the last request in the moving averages of a mirror
+SMOOTHING = 0.2
+# Consecutive failures after which a mirror is not used for a while
+MAX_CONSECUTIVE_FAILURES = 3
+# Seconds a failing mirror is not used, doubled at each new failure
+COOLDOWN = 30
+MAX_COOLDOWN = 600
+# Share of the requests sent to a random healthy mirror, so that the statistics of all the mirrors stay up to date
+EXPLORATION = 0.05
+
+
+def url_host(url:str) -> str:
+    """
+    :return: the lowercased host of a URL, which can be without scheme (e.g., 'abc.onion')
+    """
+    parts = urlsplit(url if "://" in url else "http://" + url)
+    return parts.netloc.lower()
+
+
+def replace_host(url:str, host:str) -> str:
+    """
+    :return: the URL with the given host
+    """
+    parts = urlsplit(url)
+    return urlunsplit((parts.scheme, host, parts.path, parts.query, parts.fragment))
+
+
+class Mirror:
+    """
+    Health of a mirror of a marketplace.
+    """
+    def __init__(self, host:str):
+        self.host = host
+        self.in_flight = 0
+        self.latency = None
+        self.error_rate = 0.0
+        self.failures = 0
+        self.down_until = 0.0
+
+    def score(self) -> float:
+        """
+        :return: the expected cost of a new request, the lower the better. The mirrors never used are tried first.
+        """
+        latency = self.latency if self.latency is not None else 0.0
+        return (latency + 1) * (1 + self.in_flight) / max(0.05, 1 - self.error_rate)
+
+    def __repr__(self):
+        return f"Mirror({self.host})"
+
+
+class MirrorPool:
+    """
+    Onion addresses serving the same marketplace. The crawler knows only the logical host of the seed: all the URLs
+    are canonicalized to it, so that the visited links, the graph and the file names do not depend on the mirror that
+    served a page. Each request is sent to the healthy mirror with the lowest expected latency, and a mirror failing
+    several times in a row is not used for a while (failover).
+    """
+    def __init__(self, seed:str, mirrors:list):
+        """
+        :param seed: the seed URL, whose host is the logical host of the marketplace
+        :param mirrors: the URLs or hosts of the other onion addresses of the marketplace
+        """
+        self.host = url_host(seed)
+        hosts = [self.host] + [url_host(mirror) for mirror in mirrors]
+        # The hosts in the order of the configuration, without duplicates
+        self.mirrors = {host: Mirror(host) for host in dict.fromkeys(hosts)}
+        self.lock = threading.Lock()
+
+    def hosts(self) -> tuple:
+        """
+        :return: the hosts of all the mirrors, the logical host first
+        """
+        return tuple(self.mirrors)
+
+    def canonical(self, url:str) -> str:
+        """
+        :return: the URL on the logical host, if the URL is on a mirror
+        """
+        if not url or url_host(url) == self.host or url_host(url) not in self.mirrors:
+            return url
+
+        return replace_host(url, self.host)
+
+    def acquire(self) -> Mirror:
+        """
+        Reserve the mirror for a new request: the healthy mirror with the lowest score, sometimes a random healthy
+        mirror, or, if all the mirrors are failing, the one that recovers first.
+        """
+        now = time.monotonic()
+        with self.lock:
+            healthy = [mirror for mirror in self.mirrors.values() if mirror.down_until <= now]
+            if healthy and random.random() < EXPLORATION:
+                mirror = random.choice(healthy)
+            elif healthy:
+                mirror = min(healthy, key=Mirror.score)
+            else:
+                mirror = min(self.mirrors.values(), key=lambda m: m.down_until)
+
+            mirror.in_flight += 1
+            return mirror
+
+    def resolve(self, url:str) -> tuple:
+        """
+        :param url: a URL on the logical host
+        :return: the URL on the reserved mirror, and the mirror, which must be released with release(). The URLs of
+        other hosts are returned unchanged, with no mirror.
+        """
+        if url_host(url) != self.host:
+            return url, None
+
+        mirror = self.acquire()
+        return replace_host(url, mirror.host), mirror
+
+    def release(self, mirror:Mirror, latency:float, failed:bool) -> None:
+        """
+        :param mirror: the mirror reserved by acquire or resolve, None to do nothing
+        :param latency: the seconds spent by the request
+        :param failed: True if the request raised an exception or the mirror answered with a server error
+        """
+        if mirror is None:
+            return
+
+        cooldown = None
+        with self.lock:
+            mirror.in_flight -= 1
+            mirror.error_rate = (1 - SMOOTHING) * mirror.error_rate + SMOOTHING * failed
+
+            if not failed:
+                mirror.failures = 0
+                mirror.latency = latency if mirror.latency is None else \
+                    (1 - SMOOTHING) * mirror.latency + SMOOTHING * latency
+                return
+
+            mirror.failures += 1
+            if mirror.failures >= MAX_CONSECUTIVE_FAILURES:
+                cooldown = min(MAX_COOLDOWN, COOLDOWN * 2 ** (mirror.failures - MAX_CONSECUTIVE_FAILURES))
+                mirror.down_until = time.monotonic() + cooldown
+
+        if cooldown is not None:
+            logger.warning(f"MIRROR POOL - {mirror.host} keeps failing, not used for {cooldown}s")
+
+    def canonical_response(self, web_page) -> None:
+        """
+        Move a response received from a mirror on the logical host: its URL, the URL of its request and the URLs of
+        its redirections.
+        """
+        for response in [web_page] + list(getattr(web_page, "history", None) or []):
+            response.url = self.canonical(response.url)
+            if response.request is not None:
+                response.request.url = self.canonical(response.request.url)
+
+    def snapshot(self) -> list:
+        """
+        :return: the rows (host, in flight, latency, error rate, down) of the mirrors
+        """
+        now = time.monotonic()
+        with self.lock:
+            return [(mirror.host, mirror.in_flight, round(mirror.latency or 0.0, 3), round(mirror.error_rate, 3),
+                     mirror.down_until > now) for mirror in self.mirrors.values()]
+
+    def __len__(self) -> int:
+        return len(self.mirrors)
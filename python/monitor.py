@@ -10,19 +10,37 @@ SCHEDULE_TIME = 60   # 1 minute
 
 
 class CrawlerMonitor:
-    def __init__(self, project_path=None):
+    def __init__(self, project_path=None, resume=False):
+        """
+        The rows are kept in memory only until they are appended to the CSV files, while the statistics returned by
+        get_info are kept as counters.
+        :param project_path: the path where the data of the project are stored
+        :param resume: True to append to the data stored by a previous execution on the same project, instead of
+        overwriting them.
+        """
+        # Rows not yet saved on disk
         self.info_pages = []
-        self.previous_info_page_length = 0
         self.scheduled_pages = []
-        self.previous_scheduled_pages_length = 0
         self.info_unvisited_page = []
-        self.previous_info_unvisited_page_length = 0
+        self.timeouts = []
         self.nodes = []
-        self.previous_nodes_length = 0
         self.edges = []
-        self.previous_edges_length = 0
+
+        # Statistics of the rows already saved on disk
+        self.status_code_counts = [0, 0, 0, 0]     # 2xx, 3xx, 4xx, other status codes
+        self.n_unvisited_pages = 0
+        self.n_timeouts = 0
+        self.n_nodes = 0
 
         self.tor_requests = 0
+        # Last rows (kind, key, limit, in flight, p90 latency) of the concurrency controller
+        self.concurrency = []
+        # Last statistics (requests, duplicate requests, duplicates completed first, seconds saved) of the hedging
+        self.hedging = None
+        # Last statistics (cookies, maximum age, maximum requests, replacements needed, expired, invalid, retired) of
+        # the cookie rotation
+        self.cookies = None
+        self.lock = threading.Lock()
 
         if project_path:
             if not os.path.exists(project_path) or not os.path.isdir(project_path):
@@ -35,51 +53,124 @@ class CrawlerMonitor:
             os.makedirs(monitor_path, exist_ok=True)
 
             self.crawled_file_path = os.path.join(monitor_path, "crawledpages.csv")
-            self.__init_header(self.crawled_file_path, ["timestamp", "url", "ip_client", "status_code"])
-
             self.scheduled_file_path = os.path.join(monitor_path, "scheduled.csv")
-            self.__init_header(self.scheduled_file_path, ["timestamp", "url", "depth"])
-
             self.unvisited_pages_file_path = os.path.join(monitor_path, "unvisitedlinks.csv")
-            self.__init_header(self.unvisited_pages_file_path, ["timestamp", "url", "reason"])
+            self.concurrency_file_path = os.path.join(monitor_path, "concurrency.csv")
+            self.timeouts_file_path = os.path.join(monitor_path, "timeouts.csv")
+            self.hedging_file_path = os.path.join(monitor_path, "hedging.csv")
+            self.cookies_file_path = os.path.join(monitor_path, "cookies.csv")
 
             graph_path = os.path.join(project_path, "graph")
             os.makedirs(graph_path, exist_ok=True)
 
             self.nodes_file_path = os.path.join(graph_path, "nodes.csv")
-            self.__init_header(self.nodes_file_path, ["url", "index", "depth_level", "filename"])
             self.edges_file_path = os.path.join(graph_path, "edges.csv")
-            self.__init_header(self.edges_file_path, ["node", "node"])
+
+            files = [
+                (self.crawled_file_path, ["timestamp", "url", "ip_client", "status_code"]),
+                (self.scheduled_file_path, ["timestamp", "url", "depth"]),
+                (self.unvisited_pages_file_path, ["timestamp", "url", "reason"]),
+                (self.concurrency_file_path, ["timestamp", "kind", "key", "limit", "in_flight", "p90_latency"]),
+                (self.timeouts_file_path, ["timestamp", "url", "ip_client", "elapsed"]),
+                (self.hedging_file_path, ["timestamp", "requests", "hedged_requests", "hedge_wins", "latency_saved"]),
+                (self.cookies_file_path, ["timestamp", "cookies", "max_age", "max_requests", "replacements_needed",
+                                          "expired", "invalid", "retired"]),
+                (self.nodes_file_path, ["url", "index", "depth_level", "filename"]),
+                (self.edges_file_path, ["node", "node"]),
+            ]
+
+            for file_path, attribute_list in files:
+                if not resume or not os.path.exists(file_path):
+                    self.__init_header(file_path, attribute_list)
+
+            if resume:
+                self.__load_statistics()
 
     def __init_header(self, file_path, attribute_list):
         with open(file_path, 'w', newline='') as csvfile:
             writer = csv.writer(csvfile)
             writer.writerow(attribute_list)
 
-    def __save_list_to_csv(self, file_path, element_list):
+    def __read_csv(self, file_path):
+        """
+        Iterate over the rows stored by a previous execution, skipping the header.
+        """
+        if not os.path.exists(file_path):
+            return
+
+        with open(file_path, 'r', newline='') as csvfile:
+            reader = csv.reader(csvfile)
+            next(reader, None)
+            for row in reader:
+                yield row
+
+    def __load_statistics(self):
+        """
+        Restore the counters from the CSV files of a previous execution.
+        """
+        for row in self.__read_csv(self.crawled_file_path):
+            self.__count_status_code(row[3])
+
+        self.n_unvisited_pages = sum(1 for _ in self.__read_csv(self.unvisited_pages_file_path))
+        self.n_timeouts = sum(1 for _ in self.__read_csv(self.timeouts_file_path))
+        self.n_nodes = sum(1 for _ in self.__read_csv(self.nodes_file_path))
+
+    def __count_status_code(self, status_code, counts=None):
+        counts = counts if counts is not None else self.status_code_counts
+        status_code = int(status_code)
+        if 200 <= status_code < 300:
+            counts[0] += 1
+        elif 300 <= status_code < 400:
+            counts[1] += 1
+        elif 400 <= status_code < 500:
+            counts[2] += 1
+        else:
+            counts[3] += 1
+
+    def __append_list_to_csv(self, file_path, element_list):
         try:
-            with open(file_path, 'w', newline='') as csvfile:
+            with open(file_path, 'a', newline='') as csvfile:
                 writer = csv.writer(csvfile)
-                for element in element_list:
-                    writer.writerow(element)
+                writer.writerows(element_list)
+            return True
         except Exception as e:
             logger.error(f"MONITOR - Error while saving {file_path}.")
             logger.error(f"Error msg: {str(e)}.")
+            return False
 
     def add_info_page(self, timestamp, url, ip, status_code):
-        self.info_pages.append((str(timestamp), url, str(ip), str(status_code)))
+        with self.lock:
+            self.info_pages.append((str(timestamp), url, str(ip), str(status_code)))
 
     def add_scheduled_page(self, timestamp, url, ip, depth):
-        self.scheduled_pages.append((str(timestamp), url, str(ip), str(depth)))
+        with self.lock:
+            self.scheduled_pages.append((str(timestamp), url, str(ip), str(depth)))
 
     def add_info_unvisited_page(self, timestamp, url, ip, reason):
-        self.info_unvisited_page.append((str(timestamp), url, str(ip), reason))
+        with self.lock:
+            self.info_unvisited_page.append((str(timestamp), url, str(ip), reason))
+
+    def add_timeout(self, timestamp, url, ip, elapsed):
+        """
+        :param elapsed: the seconds spent by the request before it expired
+        """
+        with self.lock:
+            self.timeouts.append((str(timestamp), url, str(ip), str(elapsed)))
+
+    def get_timeouts(self):
+        """
+        :return: the number of requests expired since the beginning of the crawl
+        """
+        with self.lock:
+            return self.n_timeouts + len(self.timeouts)
 
     def add_node(self, url, index, depth, filename):
-        self.nodes.append((url, str(index), str(depth), filename))
+        with self.lock:
+            self.nodes.append((url, str(index), str(depth), filename))
 
     def add_edge(self, node1, node2):
-        self.edges.append((str(node1), str(node2)))
+        with self.lock:
+            self.edges.append((str(node1), str(node2)))
 
     def add_edges(self, parent, children):
         for child in children:
@@ -88,59 +179,87 @@ class CrawlerMonitor:
     def update_tor_requests(self, n_requests):
         self.tor_requests = n_requests
 
-    def get_info(self):
-        n_200_pages = 0
-        n_300_pages = 0
-        n_400_pages = 0
-        n_500_pages = 0
-        for page in self.info_pages:
-            if 200 <= int(page[3]) < 300:
-                n_200_pages += 1
-            elif 300 <= int(page[3]) < 400:
-                n_300_pages += 1
-            elif 400 <= int(page[3]) < 500:
-                n_400_pages += 1
-            else:
-                n_500_pages += 1
+    def update_concurrency(self, rows):
+        """
+        :param rows: the current limits of the concurrency controller, as returned by ConcurrencyController.snapshot
+        """
+        self.concurrency = rows
 
-        return n_200_pages, n_300_pages, n_400_pages, n_500_pages, len(self.info_unvisited_page), len(self.nodes), \
-            self.tor_requests
+    def get_concurrency(self):
+        return self.concurrency
 
-    def save_data_to_csv(self):
-        if len(self.info_pages) > self.previous_info_page_length:
-            self.__save_list_to_csv(self.crawled_file_path, self.info_pages)
-            self.previous_info_page_length = len(self.info_pages)
-            logger.debug("MONITOR - Crawled pages file successfully updated.")
-        else:
-            logger.debug("MONITOR - No changes detected in the crawled pages file. Ignoring.")
+    def update_hedging(self, stats):
+        """
+        :param stats: the statistics of the hedged requests, as returned by Hedger.stats
+        """
+        self.hedging = stats
 
-        if len(self.scheduled_pages) > self.previous_scheduled_pages_length:
-            self.__save_list_to_csv(self.scheduled_file_path, self.scheduled_pages)
-            self.previous_scheduled_pages_length = len(self.scheduled_pages)
-            logger.debug("MONITOR - Scheduled pages file successfully updated.")
-        else:
-            logger.debug("MONITOR - No changes detected in the scheduled pages file. Ignoring.")
+    def get_hedging(self):
+        return self.hedging
 
-        if len(self.info_unvisited_page) > self.previous_info_unvisited_page_length:
-            self.__save_list_to_csv(self.unvisited_pages_file_path, self.info_unvisited_page)
-            self.previous_info_unvisited_page_length = len(self.info_unvisited_page)
-            logger.debug("MONITOR - Unvisited pages file successfully updated.")
-        else:
-            logger.debug("MONITOR - No changes detected in the unvisited links file. Ignoring.")
+    def update_cookies(self, stats):
+        """
+        :param stats: the statistics of the cookies, as returned by CookieRotation.stats
+        """
+        self.cookies = stats
 
-        if len(self.nodes) > self.previous_nodes_length:
-            self.__save_list_to_csv(self.nodes_file_path, self.nodes)
-            self.previous_nodes_length = len(self.nodes)
-            logger.debug("MONITOR - Nodes file successfully updated.")
-        else:
-            logger.debug("MONITOR - No changes detected in the nodes file. Ignoring.")
+    def get_cookies(self):
+        return self.cookies
 
-        if len(self.edges) > self.previous_edges_length:
-            self.__save_list_to_csv(self.edges_file_path, self.edges)
-            self.previous_edges_length = len(self.edges)
-            logger.debug("MONITOR - Edges file successfully updated.")
-        else:
-            logger.debug("MONITOR - No changes detected in the edges file. Ignoring.")
+    def get_info(self):
+        with self.lock:
+            counts = list(self.status_code_counts)
+            for page in self.info_pages:
+                self.__count_status_code(page[3], counts)
+
+            n_unvisited_pages = self.n_unvisited_pages + len(self.info_unvisited_page)
+            n_nodes = self.n_nodes + len(self.nodes)
+
+        n_200_pages, n_300_pages, n_400_pages, n_500_pages = counts
+
+        return n_200_pages, n_300_pages, n_400_pages, n_500_pages, n_unvisited_pages, n_nodes, self.tor_requests
+
+    def save_data_to_csv(self):
+        # Take the rows to be saved, the crawler keeps adding rows to new lists
+        with self.lock:
+            info_pages, self.info_pages = self.info_pages, []
+            scheduled_pages, self.scheduled_pages = self.scheduled_pages, []
+            info_unvisited_page, self.info_unvisited_page = self.info_unvisited_page, []
+            timeouts, self.timeouts = self.timeouts, []
+            nodes, self.nodes = self.nodes, []
+            edges, self.edges = self.edges, []
+
+            # Update the statistics before the rows leave the memory
+            for page in info_pages:
+                self.__count_status_code(page[3])
+            self.n_unvisited_pages += len(info_unvisited_page)
+            self.n_timeouts += len(timeouts)
+            self.n_nodes += len(nodes)
+
+            # One sample of the concurrency limits per save
+            timestamp = str(int(time.time()))
+            concurrency = [(timestamp,) + tuple(str(value) for value in row) for row in self.concurrency]
+            hedging = [(timestamp,) + tuple(str(value) for value in self.hedging)] if self.hedging else []
+            cookies = [(timestamp,) + tuple(str(value) for value in self.cookies)] if self.cookies else []
+
+        files = [
+            (self.crawled_file_path, info_pages, "Crawled pages"),
+            (self.scheduled_file_path, scheduled_pages, "Scheduled pages"),
+            (self.unvisited_pages_file_path, info_unvisited_page, "Unvisited pages"),
+            (self.nodes_file_path, nodes, "Nodes"),
+            (self.edges_file_path, edges, "Edges"),
+            (self.concurrency_file_path, concurrency, "Concurrency"),
+            (self.timeouts_file_path, timeouts, "Timeouts"),
+            (self.hedging_file_path, hedging, "Hedging"),
+            (self.cookies_file_path, cookies, "Cookies"),
+        ]
+
+        for file_path, rows, name in files:
+            if rows:
+                if self.__append_list_to_csv(file_path, rows):
+                    logger.debug(f"MONITOR - {name} file successfully updated.")
+            else:
+                logger.debug(f"MONITOR - No changes detected in the {name.lower()} file. Ignoring.")
 
     def schedule_loop(self):
         if not os.path.exists(self.crawled_file_path):
@@ -0,0 +1,87 @@
+import re
+import hashlib
+import numpy as np
+
+FINGERPRINT_BITS = 64
+SHINGLE_SIZE = 3            # number of consecutive words hashed together
+DEFAULT_MAX_DISTANCE = 3    # maximum number of different bits between two near-duplicate pages
+
+
+def simhash(text:str, shingle_size:int =SHINGLE_SIZE) -> int:
+    """
+    Compute the 64-bit SimHash of a text: similar texts get fingerprints that differ in few bits.
+    :param text: the text of the web page
+    :param shingle_size: the number of consecutive words forming a feature
+    :return: the fingerprint, as a non-negative integer
+    """
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < shingle_size:
+        shingles = [" ".join(words)]
+    else:
+        shingles = [" ".join(words[i:i + shingle_size]) for i in range(len(words) - shingle_size + 1)]
+
+    digests = b"".join(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest() for shingle in shingles)
+
+    # Bit i of the fingerprint is set if bit i is set in the majority of the shingle hashes
+    bits = np.unpackbits(np.frombuffer(digests, dtype=np.uint8).reshape(-1, 8), axis=1, bitorder="little")
+    majority = np.packbits(2 * bits.sum(axis=0) > len(shingles), bitorder="little")
+
+    return int.from_bytes(majority.tobytes(), "little")
+
+
+def hamming_distance(fingerprint_1:int, fingerprint_2:int) -> int:
+    """
+    :return: the number of different bits between the two fingerprints
+    """
+    return (fingerprint_1 ^ fingerprint_2).bit_count()
+
+
+class SimHashIndex:
+    """
+    Index of SimHash fingerprints answering "is there a stored page within max_distance bits?".
+    The fingerprints are split in max_distance + 1 bands: two fingerprints differing in at most max_distance bits
+    have at least one identical band, so only the fingerprints sharing a band are compared.
+    """
+    def __init__(self, max_distance:int =DEFAULT_MAX_DISTANCE):
+        """
+        :param max_distance: the maximum Hamming distance between two near-duplicate fingerprints
+        """
+        self.max_distance = max_distance
+        n_bands = max_distance + 1
+        band_size = FINGERPRINT_BITS // n_bands
+
+        # (shift, mask) of each band, the last band takes the remaining bits
+        self.bands = []
+        for band in range(n_bands):
+            shift = band * band_size
+            size = band_size if band < n_bands - 1 else FINGERPRINT_BITS - shift
+            self.bands.append((shift, (1 << size) - 1))
+
+        # One table per band: band value -> list of (fingerprint, key)
+        self.tables = [dict() for _ in self.bands]
+        self.length = 0
+
+    def add(self, fingerprint:int, key) -> None:
+        """
+        Store a fingerprint.
+        :param fingerprint: the SimHash of the page
+        :param key: the value returned by find for the near-duplicates of the page (e.g., its node index)
+        """
+        for table, (shift, mask) in zip(self.tables, self.bands):
+            table.setdefault(fingerprint >> shift & mask, []).append((fingerprint, key))
+        self.length += 1
+
+    def find(self, fingerprint:int):
+        """
+        :param fingerprint: the SimHash of a page
+        :return: the key of a stored near-duplicate page, None if there is no near-duplicate
+        """
+        for table, (shift, mask) in zip(self.tables, self.bands):
+            for candidate, key in table.get(fingerprint >> shift & mask, ()):
+                if hamming_distance(fingerprint, candidate) <= self.max_distance:
+                    return key
+
+        return None
+
+    def __len__(self) -> int:
+        return self.length
@@ -0,0 +1,145 @@
+from bs4 import BeautifulSoup
+
+
+class ParsedPage:
+    """
+    A web page parsed only once with BeautifulSoup.
+    The views used by the crawler, the detectors and the scrapers (title, language, anchors, ...) are computed on
+    first access and cached, so that every check on the same page shares the same DOM.
+    """
+
+    def __init__(self, web_page, from_encoding:str ="iso-8859-1", url:str =None, request_url:str =None):
+        """
+        :param web_page: the web page retrieved from a request (return value of request.get function), or its raw
+        HTML content as bytes or string.
+        :param from_encoding: the encoding used to decode the page content. None to let BeautifulSoup detect it.
+        :param url: the URL of the page, when web_page is the raw HTML content.
+        :param request_url: the URL sent in the HTTP request, when web_page is the raw HTML content.
+        """
+        if hasattr(web_page, "content"):
+            self.response = web_page
+            self.content = web_page.content
+        else:
+            self.response = None
+            self.content = web_page
+
+        self._url = url
+        self._request_url = request_url
+        self.from_encoding = from_encoding
+        self._soup = None
+        self._cache = {}
+
+    @classmethod
+    def of(cls, web_page, from_encoding:str ="iso-8859-1"):
+        """
+        Return the given page if it is already parsed, otherwise parse it.
+        :param web_page: a ParsedPage, a response or the raw HTML content.
+        :param from_encoding: the encoding used to decode the page content, if the page must be parsed.
+        :return: a ParsedPage
+        """
+        if isinstance(web_page, cls):
+            return web_page
+
+        return cls(web_page, from_encoding)
+
+    @property
+    def soup(self) -> BeautifulSoup:
+        if self._soup is None:
+            if isinstance(self.content, bytes) and self.from_encoding:
+                self._soup = BeautifulSoup(self.content, "html.parser", from_encoding=self.from_encoding)
+            else:
+                self._soup = BeautifulSoup(self.content, "html.parser")
+
+        return self._soup
+
+    def _cached(self, key, compute):
+        if key not in self._cache:
+            self._cache[key] = compute()
+
+        return self._cache[key]
+
+    @property
+    def url(self) -> str:
+        return self.response.url if self.response is not None else self._url
+
+    @property
+    def request_url(self) -> str:
+        """
+        :return: the URL sent in the HTTP request, before any redirection
+        """
+        if self.response is None:
+            return self._request_url if self._request_url else self._url
+
+        request = getattr(self.response, "request", None)
+        return request.url if request is not None else self.response.url
+
+    @property
+    def status_code(self) -> int:
+        return self.response.status_code if self.response is not None else None
+
+    @property
+    def history(self) -> list:
+        return self.response.history if self.response is not None else []
+
+    @property
+    def title(self) -> str:
+        """
+        :return: the content of the <title> tag, None if the page has no title
+        """
+        def compute():
+            title_tag = self.soup.title
+            if title_tag is None or title_tag.string is None:
+                return None
+            return str(title_tag.string)
+
+        return self._cached("title", compute)
+
+    @property
+    def lang(self) -> str:
+        """
+        :return: the lang attribute of the <html> tag, None if it is not defined
+        """
+        def compute():
+            html_tag = self.soup.find("html")
+            return html_tag.get("lang") if html_tag else None
+
+        return self._cached("lang", compute)
+
+    @property
+    def anchors(self) -> list:
+        return self._cached("anchors", lambda: self.soup.findAll("a"))
+
+    @property
+    def buttons(self) -> list:
+        return self._cached("buttons", lambda: self.soup.findAll("button"))
+
+    @property
+    def images(self) -> list:
+        return self._cached("images", lambda: self.soup.findAll("img"))
+
+    @property
+    def breadcrumb(self):
+        """
+        :return: the <ul class="breadcrumb"> tag, None if the page has no breadcrumb
+        """
+        return self._cached("breadcrumb", lambda: self.soup.find("ul", class_="breadcrumb"))
+
+    @property
+    def body_text(self) -> str:
+        """
+        :return: the text inside the <body> tag, an empty string if the page has no body
+        """
+        def compute():
+            body = self.soup.find("body")
+            return body.text if body else ""
+
+        return self._cached("body_text", compute)
+
+    def release(self) -> None:
+        """
+        Free the parsed tree and the cached views. The page is parsed again if it is accessed after this call.
+        """
+        self._cache.clear()
+        if self._soup is not None:
+            self._soup.decompose()
+            self._soup = None
@@ -0,0 +1,85 @@
+import time
+import random
+import logging
+import threading
+from urllib.parse import urlparse
+
+logger = logging.getLogger("CRATOR")
+
+DEFAULT_JITTER = 0.25   # maximum relative deviation of a single interval from 1 / rate
+
+
+class TokenBucket:
+    """
+    Token bucket releasing `rate` tokens per second, up to `burst` tokens at once.
+    The tokens are reserved in advance: each call gets the time slot after the previous one, so the callers can wait
+    outside any lock and the rate is used entirely, without idle gaps.
+    """
+    def __init__(self, rate:float, burst:int =1, jitter:float =0.0):
+        """
+        :param rate: number of tokens per second
+        :param burst: maximum number of tokens released at once after an idle period
+        :param jitter: maximum relative deviation of the interval between two tokens (e.g., 0.25 = +/-25%). The
+        average interval is still 1 / rate.
+        """
+        if rate <= 0:
+            raise ValueError(f"The rate must be positive, got {rate}")
+
+        self.interval = 1 / rate
+        self.burst = max(burst, 1)
+        self.jitter = min(max(jitter, 0.0), 1.0)
+        self.lock = threading.Lock()
+        # Time at which the next token is released
+        self.next_slot = time.monotonic()
+
+    def reserve(self) -> float:
+        """
+        Reserve the next token.
+        :return: the number of seconds to wait before using the token
+        """
+        with self.lock:
+            now = time.monotonic()
+            # Tokens not used while the bucket was idle are kept up to the burst size
+            slot = max(self.next_slot, now - (self.burst - 1) * self.interval)
+            self.next_slot = slot + self.interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+        return max(0.0, slot - now)
+
+
+class RateLimiter:
+    """
+    Token buckets per onion host. A single instance can be shared among several crawlers hitting the same
+    marketplace, so that all of them together respect the request rate.
+    """
+    def __init__(self, requests_per_second:float, burst:int =1, jitter:float =DEFAULT_JITTER):
+        """
+        :param requests_per_second: maximum number of HTTP requests per second sent to each host
+        :param burst: maximum number of requests sent at once after an idle period
+        :param jitter: maximum relative deviation of the interval between two requests
+        """
+        self.requests_per_second = requests_per_second
+        self.burst = burst
+        self.jitter = jitter
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def get_bucket(self, url:str) -> TokenBucket:
+        host = urlparse(url).netloc.lower()
+
+        with self.lock:
+            if host not in self.buckets:
+                self.buckets[host] = TokenBucket(self.requests_per_second, self.burst, self.jitter)
+
+            return self.buckets[host]
+
+    def acquire(self, url:str) -> float:
+        """
+        Wait until a request can be sent to the host of the URL.
+        :param url: the URL to be requested
+        :return: the number of seconds waited
+        """
+        delay = self.get_bucket(url).reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+        return delay
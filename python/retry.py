@@ -0,0 +1,216 @@
+import time
+import heapq
+import random
+import logging
+import itertools
+from email.utils import parsedate_to_datetime
+import requests
+
+# Local imports
+from utils.urls import url_fingerprint
+from concurrency import ERROR, WAITING_PAGE, CAPTCHA
+from exceptions import DeadlineExceededError
+
+logger = logging.getLogger("CRATOR")
+
+# Reasons of a retry, besides ERROR (the request raised an exception), WAITING_PAGE and CAPTCHA
+HTTP_STATUS = "HTTP STATUS"     # the server answered with a temporary error (e.g., 503)
+TIMEOUT = "TIMEOUT"             # the request exceeded its timeouts, e.g. on a dead circuit
+
+# HTTP status codes of temporary errors, worth a retry
+RETRYABLE_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504}
+# Exceptions that a new attempt cannot fix
+NON_RETRYABLE_EXCEPTIONS = (requests.exceptions.InvalidURL, requests.exceptions.MissingSchema,
+                            requests.exceptions.InvalidSchema, requests.exceptions.InvalidHeader,
+                            requests.exceptions.TooManyRedirects)
+
+RETRY_BUDGET_RATIO = 0.2    # retries allowed for each new request
+MIN_RETRY_BUDGET = 10       # retries allowed regardless of the number of requests
+DEFAULT_JITTER = 0.25       # maximum relative deviation of a retry delay
+
+
+class RetryPolicy:
+    """
+    Exponential backoff of the retries of a reason.
+    """
+    def __init__(self, base_delay:float, max_delay:float, max_attempts:int):
+        """
+        :param base_delay: the seconds before the first retry
+        :param max_delay: the maximum seconds before a retry
+        :param max_attempts: the maximum number of retries of a URL
+        """
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+
+    def delay(self, attempt:int) -> float:
+        """
+        :param attempt: the number of the retry, starting from 1
+        :return: the seconds before the retry, without jitter
+        """
+        return min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+
+
+RETRY_POLICIES = {
+    ERROR: RetryPolicy(base_delay=5, max_delay=300, max_attempts=3),
+    HTTP_STATUS: RetryPolicy(base_delay=10, max_delay=600, max_attempts=3),
+    TIMEOUT: RetryPolicy(base_delay=5, max_delay=300, max_attempts=3),
+    WAITING_PAGE: RetryPolicy(base_delay=15, max_delay=600, max_attempts=10),
+    CAPTCHA: RetryPolicy(base_delay=30, max_delay=900, max_attempts=3),
+}
+
+
+def is_retryable_exception(exception:Exception) -> bool:
+    """
+    :return: False if a new request would raise the same exception (e.g., an invalid URL)
+    """
+    return not isinstance(exception, NON_RETRYABLE_EXCEPTIONS)
+
+
+def is_timeout(exception:Exception) -> bool:
+    """
+    :return: True if the request exceeded its connect or read timeout, or its deadline
+    """
+    return isinstance(exception, (DeadlineExceededError, requests.exceptions.Timeout, TimeoutError))
+
+
+def is_retryable_status(status_code:int) -> bool:
+    """
+    :return: True if the status code is a temporary error. There is no point in retrying a 404.
+    """
+    return status_code in RETRYABLE_STATUS_CODES
+
+
+def retry_after(web_page) -> float:
+    """
+    :param web_page: the web page retrieved from a request
+    :return: the seconds to wait advertised by the Retry-After header, None if the header is missing or invalid
+    """
+    value = web_page.headers.get("Retry-After") if web_page is not None else None
+    if not value:
+        return None
+
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryScheduler:
+    """
+    Heap of the URLs to be requested again, ordered by the time of their retry.
+    Each reason has its own exponential backoff with jitter and its own maximum number of retries per URL. All
+    the retries share a budget proportional to the number of new requests, so that a failing marketplace is not
+    flooded with retries.
+    It is not thread-safe: the Downloader guards it with its lock.
+    """
+    def __init__(self, policies:dict =None, budget_ratio:float =RETRY_BUDGET_RATIO,
+                 min_budget:int =MIN_RETRY_BUDGET, jitter:float =DEFAULT_JITTER):
+        """
+        :param policies: reason -> RetryPolicy. RETRY_POLICIES if None.
+        :param budget_ratio: the number of retries allowed for each new request
+        :param min_budget: the number of retries allowed regardless of the number of requests
+        :param jitter: the maximum relative deviation of a retry delay
+        """
+        self.policies = policies if policies is not None else RETRY_POLICIES
+        self.budget_ratio = budget_ratio
+        self.min_budget = min_budget
+        self.jitter = jitter
+
+        # (time of the retry, insertion order, url, item)
+        self.heap = []
+        self.counter = itertools.count()
+        # url fingerprint -> {reason: number of retries}
+        self.attempts = {}
+        self.n_requests = 0
+        self.n_retries = 0
+
+    def restore(self, attempts:dict, reason:str) -> None:
+        """
+        Restore the retries counted by a previous execution.
+        :param attempts: url fingerprint -> number of retries
+        :param reason: the reason of the retries
+        """
+        for key, n in attempts.items():
+            self.attempts.setdefault(key, {})[reason] = n
+
+    def count_request(self) -> None:
+        """
+        Count a new request, which increases the retry budget.
+        """
+        self.n_requests += 1
+
+    def get_attempts(self, url:str, reason:str) -> int:
+        """
+        :return: the number of retries of the URL for the reason
+        """
+        return self.attempts.get(url_fingerprint(url), {}).get(reason, 0)
+
+    def budget(self) -> float:
+        """
+        :return: the number of retries that can still be scheduled
+        """
+        return self.min_budget + self.budget_ratio * self.n_requests - self.n_retries
+
+    def schedule(self, url:str, reason:str, item=None, delay:float =None) -> float:
+        """
+        Schedule a new request of the URL.
+        :param url: the URL to be requested again
+        :param reason: the reason of the retry, it selects the backoff policy
+        :param item: the data returned with the URL when the retry is due (e.g., cookie, depth and headers)
+        :param delay: the seconds to wait advertised by the server or by the page, if any. It replaces the backoff.
+        :return: the seconds before the retry, None if the URL has no retries left or the budget is exhausted
+        """
+        policy = self.policies.get(reason, self.policies[ERROR])
+        counts = self.attempts.setdefault(url_fingerprint(url), {})
+        attempt = counts.get(reason, 0) + 1
+
+        if attempt > policy.max_attempts:
+            logger.debug(f"RETRY SCHEDULER - {url}: no {reason.lower()} retries left")
+            return None
+
+        if self.budget() < 1:
+            logger.warning(f"RETRY SCHEDULER - Retry budget exhausted, {url} not retried")
+            return None
+
+        counts[reason] = attempt
+        self.n_retries += 1
+
+        if delay is None:
+            delay = policy.delay(attempt) * random.uniform(1 - self.jitter, 1 + self.jitter)
+        else:
+            # Never earlier than advertised
+            delay = delay * random.uniform(1, 1 + self.jitter)
+
+        heapq.heappush(self.heap, (time.monotonic() + delay, next(self.counter), url, item))
+        logger.debug(f"RETRY SCHEDULER - {url}: {reason.lower()} retry {attempt} in {delay:.1f}s")
+        return delay
+
+    def pop_due(self) -> list:
+        """
+        Remove the retries whose time has come.
+        :return: the list of (url, item) to be requested now
+        """
+        now = time.monotonic()
+        due = []
+        while self.heap and self.heap[0][0] <= now:
+            _, _, url, item = heapq.heappop(self.heap)
+            due.append((url, item))
+
+        return due
+
+    def next_delay(self) -> float:
+        """
+        :return: the seconds before the next retry, None if no retry is scheduled
+        """
+        if not self.heap:
+            return None
+
+        return max(0.0, self.heap[0][0] - time.monotonic())
+
+    def __len__(self) -> int:
+        return len(self.heap)
@@ -1,9 +1,10 @@
 import re
-from bs4 import BeautifulSoup
 from bs4.element import Tag
+from urllib.parse import urlparse
 
 #Local import
 from scrapers import Scraper
+from utils.urls import canonicalize_url
 
 class CocoricoScraper(Scraper):
     def __init__(self, product_category: str, product_micro_category: str):
@@ -27,8 +28,8 @@ class CocoricoScraper(Scraper):
         return self.currency_mapping.get(symbol)
 
     def extract_product_information(self, web_page) -> dict:
-        # Make soup
-        soup = BeautifulSoup(web_page.content, "html.parser")
+        page = self.parse(web_page)
+        soup = page.soup
 
         product_information = {
             "title": "",
@@ -79,13 +80,23 @@ class CocoricoScraper(Scraper):
             product_information["description"] = re.sub(r"\s+", " ", x)
         
         # Get product shipping information web_page.url
-        url = web_page.url
-        url = url.replace("&amp;", "&")
+        return self.complete_product_information(page.url, product_information)
+
+    def export_state(self) -> dict:
+        state = {"product_shipping_map": self.product_shipping_map}
+        self.product_shipping_map = dict()
+        return state
+
+    def merge_state(self, state: dict) -> None:
+        self.product_shipping_map.update(state.get("product_shipping_map", {}))
+
+    def complete_product_information(self, url: str, product_information: dict) -> dict:
+        url = canonicalize_url(url)
         if url in self.product_shipping_map:
             product_information["origin"], product_information["destination"] = self.product_shipping_map[url].split(";")
 
             self.product_shipping_map.pop(url) # Remove the shipping information from dictionary
-        
+
         return product_information
     
     def get_base_url(self, web_page_url: str) -> str:
@@ -95,9 +106,23 @@ class CocoricoScraper(Scraper):
         return match.group(1) if match else ""
         
     def get_url_category(self, url: str) -> str:
-        match = re.search(r"(&path=\d+_\d+_\d+)", url)
+        # The path parameter can be the first one in a canonical URL
+        match = re.search(r"[?&](path=\d+_\d+_\d+)", url)
         
-        return match.group(0) if match else ""
+        return match.group(1) if match else ""
+
+    def url_pattern(self, url: str) -> str:
+        query = urlparse(url).query
+
+        if re.search(r"(^|&)product_id=", query):
+            return "product"
+        if re.search(r"(^|&)path=", query):
+            return "listing"
+
+        return "other"
+
+    def score_url(self, url: str) -> float:
+        return {"product": 1.0, "listing": 0.5}.get(self.url_pattern(url), 0.0)
 
     def check_image(self, img_tag: Tag) -> bool:
         # Get the immediate parents which is an <a> tag
@@ -112,10 +137,10 @@ class CocoricoScraper(Scraper):
 
 
     def check_category(self, web_page) -> bool:
-        # Make soup
-        soup = BeautifulSoup(web_page.content, "html.parser")
+        page = self.parse(web_page)
+        soup = page.soup
         
-        ul_tag = soup.find("ul", class_= "breadcrumb")
+        ul_tag = page.breadcrumb
 
         if ul_tag:
             children = ul_tag.findChildren("a") # Get all <a> children
@@ -145,7 +170,7 @@ class CocoricoScraper(Scraper):
 
                     if self.product_micro_category in h2_text:
                         # Extract product shipping information
-                        self.store_product_shipping_information(web_page)
+                        self.store_product_shipping_information(page)
                     else:
                         return False
             
@@ -156,10 +181,9 @@ class CocoricoScraper(Scraper):
     def store_product_shipping_information(self, web_page) -> None:
         """
         Store the product shipping information ina dictionary {url: shipping information}
-        :param web_page: the current web page
+        :param web_page: the current web page, as a response or as a ParsedPage
         """
-        # Make soup
-        soup = BeautifulSoup(web_page.content, "html.parser")
+        soup = self.parse(web_page).soup
 
         caption_divs = soup.findAll("div", class_= "caption")
         image_divs = soup.findAll("div", class_= "image")
@@ -178,5 +202,5 @@ class CocoricoScraper(Scraper):
             if not a_tag:
                 continue
             
-            a_tag = a_tag.replace("&amp;", "&")
+            a_tag = canonicalize_url(a_tag)
             self.product_shipping_map[a_tag] = f"{origin}; {destination}"
\ No newline at end of file
@@ -1,5 +1,4 @@
 import re
-from bs4 import BeautifulSoup
 from bs4.element import Tag
 from urllib.parse import urljoin, urlparse
 
@@ -7,10 +6,11 @@ from urllib.parse import urljoin, urlparse
 from scrapers import Scraper
 
 class DrughubScraper(Scraper):
+    page_encoding = "iso-8859-1"
 
     def extract_product_information(self, web_page) -> dict:
-        # Make soup
-        soup = BeautifulSoup(web_page.content, "html.parser", from_encoding="iso-8859-1")
+        page = self.parse(web_page)
+        soup = page.soup
 
         product_information = {
             "title": "",
@@ -43,7 +43,7 @@ class DrughubScraper(Scraper):
             product_information["description"] = re.sub(r"\s+", " ", x)
 
         # Extract vendor name
-        for a_tag in soup.findAll("a"):
+        for a_tag in page.anchors:
             href = a_tag.attrs.get("href")
 
             # Check whether the a tag is a vendor link
@@ -88,6 +88,20 @@ class DrughubScraper(Scraper):
 
         return url_category
 
+    def url_pattern(self, url: str) -> str:
+        path = urlparse(url).path.strip("/")
+
+        # Product pages are listed under /listing/, the category pages are paginated with ?page=N
+        if "listing/" in path:
+            return "product"
+        if path.startswith("category"):
+            return "listing"
+
+        return "other"
+
+    def score_url(self, url: str) -> float:
+        return {"product": 1.0, "listing": 0.5}.get(self.url_pattern(url), 0.0)
+
     def check_image(self, img_tag: Tag) -> bool:
         if img_tag.has_attr("class"):
             class_value = " ".join(img_tag["class"]).strip()
@@ -100,8 +114,7 @@ class DrughubScraper(Scraper):
         
         
     def check_category(self, web_page) -> bool:
-        # Make soup
-        soup = BeautifulSoup(web_page.content, "html.parser", from_encoding="iso-8859-1")
+        soup = self.parse(web_page).soup
 
         pattern = re.compile(rf"{self.product_category}\s*-\s*{self.product_micro_category}", re.IGNORECASE)
         
@@ -1,7 +1,12 @@
 from abc import ABC, abstractmethod
 from bs4.element import Tag
 
+# Local import
+from parsed_page import ParsedPage
+
 class Scraper(ABC):
+    # Encoding used to parse the marketplace pages. None to let BeautifulSoup detect it.
+    page_encoding = None
 
     def __init__(self, product_category: str, product_micro_category: str):
         """
@@ -11,11 +16,60 @@ class Scraper(ABC):
         self.product_category = product_category
         self.product_micro_category = product_micro_category
 
+    def parse(self, web_page) -> ParsedPage:
+        """
+        Parse the given web page with the marketplace encoding. An already parsed page is returned as is.
+        :param web_page: a ParsedPage, a response or the raw HTML content.
+        :return: a ParsedPage
+        """
+        return ParsedPage.of(web_page, self.page_encoding)
+
+    def export_state(self) -> dict:
+        """
+        Return and clear the state collected by the scraper while analyzing pages in a worker process
+        (e.g., information found in a listing page and needed by the product pages).
+        :return: a picklable dictionary to be merged in the scraper of the crawler with merge_state()
+        """
+        return {}
+
+    def merge_state(self, state: dict) -> None:
+        """
+        Merge the state exported by a scraper running in a worker process.
+        :param state: the dictionary returned by export_state()
+        """
+        pass
+
+    def complete_product_information(self, url: str, product_information: dict) -> dict:
+        """
+        Complete the product information extracted from a page with the state stored by the scraper.
+        :param url: the url of the product web page
+        :param product_information: the dictionary returned by extract_product_information()
+        :return: the completed product information
+        """
+        return product_information
+
+    def url_pattern(self, url: str) -> str:
+        """
+        Return the kind of page the URL points to (e.g., "product", "listing"). The priority queue of the downloader
+        groups the URLs by pattern and learns the image yield of each pattern.
+        :param url: a URL to be downloaded
+        :return: the name of the URL pattern
+        """
+        return "page"
+
+    def score_url(self, url: str) -> float:
+        """
+        Return the expected number of images to download from the URL, before any page of its pattern is downloaded.
+        :param url: a URL to be downloaded
+        :return: the initial score of the URL pattern
+        """
+        return 0.0
+
     @abstractmethod
     def extract_product_information(self, web_page) -> dict:
         """
         Extracts all the necessary product information (vendor name, price, etc)
-        :param web_page: the product web page
+        :param web_page: the product web page, as a response or as a ParsedPage
         :return: a dictionary containing all product information.
         """
         pass
@@ -50,7 +104,7 @@ class Scraper(ABC):
     def check_category(self, web_page) -> bool:
         """
         Checks the products category of the current web page.
-        :param web_page: the current web page
+        :param web_page: the current web page, as a response or as a ParsedPage
         :return: It returns true if the category is the same of the yaml file, false otherwise
         """
         pass
\ No newline at end of file
@@ -0,0 +1,100 @@
+import time
+import logging
+import threading
+from collections import OrderedDict
+from http.cookiejar import DefaultCookiePolicy
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger("CRATOR")
+
+MAX_SESSIONS = 64               # maximum number of sessions kept open
+SESSION_IDLE_TIMEOUT = 300      # seconds after which an unused session is closed
+CONNECTIONS_PER_SESSION = 10    # maximum number of keep-alive connections of a session
+
+
+class SessionPool:
+    """
+    requests.Session objects kept open between the requests, so that the requests to the same host through the same
+    circuit reuse their keep-alive connections instead of opening a new stream each time.
+    The sessions are keyed by (isolation token, host) and evicted in least-recently-used order, or when they have
+    been idle for too long.
+    The sessions never store the cookies set by the servers: the cookie of each request is sent in its headers.
+    """
+    def __init__(self, max_sessions:int =MAX_SESSIONS, idle_timeout:float =SESSION_IDLE_TIMEOUT,
+                 connections_per_session:int =CONNECTIONS_PER_SESSION):
+        """
+        :param max_sessions: maximum number of sessions kept open
+        :param idle_timeout: seconds after which an unused session is closed
+        :param connections_per_session: maximum number of keep-alive connections of a session
+        """
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.connections_per_session = connections_per_session
+        # (token, host) -> (session, time of the last use), from the least to the most recently used
+        self.sessions = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __create_session(self, proxies:dict) -> requests.Session:
+        session = requests.Session()
+        session.proxies.update(proxies)
+        session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.connections_per_session)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def get(self, token:str, host:str, proxies:dict) -> requests.Session:
+        """
+        :param token: the isolation token of the circuit, None for the circuits shared by the requests without identity
+        :param host: the host to be requested
+        :param proxies: the proxies of the circuit, used if a new session is created
+        :return: the session of the circuit for the host
+        """
+        key = (token, host)
+        now = time.monotonic()
+        expired = []
+
+        with self.lock:
+            session = None
+            if key in self.sessions:
+                session, last_use = self.sessions.pop(key)
+                if now - last_use >= self.idle_timeout:
+                    expired.append(session)
+                    session = None
+
+            # The least recently used sessions are at the beginning
+            while self.sessions:
+                oldest_key, (oldest, last_use) = next(iter(self.sessions.items()))
+                if now - last_use < self.idle_timeout and len(self.sessions) < self.max_sessions:
+                    break
+                del self.sessions[oldest_key]
+                expired.append(oldest)
+
+            if session is None:
+                session = self.__create_session(proxies)
+            self.sessions[key] = (session, now)
+
+        for session_to_close in expired:
+            session_to_close.close()
+
+        return session
+
+    def reset(self, token:str =None) -> None:
+        """
+        Close the sessions of a circuit, e.g. after the circuit has been replaced.
+        :param token: the isolation token of the circuit. None to close all the sessions.
+        """
+        with self.lock:
+            keys = [key for key in self.sessions if token is None or key[0] == token]
+            closed = [self.sessions.pop(key)[0] for key in keys]
+
+        for session in closed:
+            session.close()
+
+        if closed:
+            logger.debug(f"SESSION POOL - {len(closed)} sessions closed")
+
+    def __len__(self) -> int:
+        return len(self.sessions)
@@ -0,0 +1,86 @@
+import unittest
+from concurrency import AIMDLimit, ConcurrencyController, ERROR, CAPTCHA, LATENCY_WINDOW, percentile
+
+URL = "http://a.onion/page"
+
+
+class AIMDLimitTest(unittest.TestCase):
+    def test_additive_increase(self):
+        limit = AIMDLimit(initial=2, min_limit=1, max_limit=10)
+        for _ in range(4):
+            limit.on_success(1.0, now=0)
+
+        self.assertGreaterEqual(int(limit.limit), 3)
+
+    def test_max_limit(self):
+        limit = AIMDLimit(initial=2, min_limit=1, max_limit=3)
+        for _ in range(100):
+            limit.on_success(1.0, now=0)
+
+        self.assertEqual(limit.limit, 3)
+
+    def test_latency_increase_cuts_limit(self):
+        limit = AIMDLimit(initial=8, min_limit=1, max_limit=8)
+        for _ in range(LATENCY_WINDOW):
+            limit.on_success(1.0, now=0)
+        before = limit.limit
+
+        for i in range(LATENCY_WINDOW // 2):
+            limit.on_success(10.0, now=100 + i * 20)
+
+        self.assertLess(limit.limit, before)
+
+    def test_one_decrease_per_round_trip(self):
+        limit = AIMDLimit(initial=8, min_limit=1, max_limit=8)
+        limit.latencies.append(5.0)
+
+        limit.decrease(0.5, now=100)
+        limit.decrease(0.5, now=101)
+        self.assertEqual(limit.limit, 4)
+
+        limit.decrease(0.5, now=106)
+        self.assertEqual(limit.limit, 2)
+
+
+class ConcurrencyControllerTest(unittest.TestCase):
+    def test_limit_per_host(self):
+        controller = ConcurrencyController(max_limit=4, initial=2)
+
+        self.assertTrue(controller.try_acquire(URL, "a"))
+        self.assertTrue(controller.try_acquire(URL, "b"))
+        self.assertFalse(controller.try_acquire(URL, "c"))
+        self.assertTrue(controller.try_acquire("http://b.onion", "c"))
+
+    def test_limit_per_circuit(self):
+        controller = ConcurrencyController(max_limit=4, initial=1)
+
+        self.assertTrue(controller.try_acquire(URL, "a"))
+        self.assertFalse(controller.try_acquire("http://b.onion", "a"))
+
+    def test_release_frees_slot(self):
+        controller = ConcurrencyController(max_limit=1, initial=1)
+        controller.try_acquire(URL)
+
+        self.assertFalse(controller.acquire(URL, timeout=0.01))
+        controller.release(URL, latency=1.0)
+        self.assertTrue(controller.acquire(URL, timeout=0.01))
+
+    def test_congestion_signals(self):
+        controller = ConcurrencyController(max_limit=8, initial=8)
+        controller.try_acquire(URL, "a")
+        controller.release(URL, "a", 1.0, ERROR)
+        controller.report("http://b.onion/page", "b", CAPTCHA)
+
+        limits = {(kind, key): limit for kind, key, limit, _, _ in controller.snapshot()}
+        self.assertEqual(limits[("host", "a.onion")], 6)
+        self.assertEqual(limits[("host", "b.onion")], 4)
+        # The cookies never appear in the snapshot
+        self.assertFalse({"a", "b"} & {key for _, key in limits})
+
+    def test_percentile(self):
+        self.assertEqual(percentile([3, 1, 2, 4], 0.5), 3)
+        self.assertEqual(percentile([3, 1, 2, 4], 0.9), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+import os
+import shutil
+import tempfile
+import unittest
+import yaml
+from cookie_store import CookieStore
+from utils.config import Configuration, ConfigSnapshot
+
+
+class ConfigSnapshotTest(unittest.TestCase):
+    def setUp(self):
+        self.data = {
+            'crawler.depth': 2,
+            'crawler.cookies': [
+                {'seed': 'http://a.onion', 'cookies': ['c1', 'c2']},
+                {'seed': 'http://b.onion'},
+                {'seed': 'http://a.onion', 'cookies': ['c3']},
+            ],
+        }
+
+    def test_index(self):
+        snapshot = ConfigSnapshot(self.data, 0.0, 1)
+        self.assertEqual(snapshot.cookies_by_seed['http://a.onion'], ('c1', 'c2'))
+        self.assertNotIn('http://b.onion', snapshot.cookies_by_seed)
+        self.assertEqual(snapshot.seeds, {'http://a.onion', 'http://b.onion'})
+
+    def test_read_only(self):
+        snapshot = ConfigSnapshot(self.data, 0.0, 1)
+        with self.assertRaises(TypeError):
+            snapshot.values['crawler.depth'] = 3
+        # The parsed data can be modified without changing the snapshot
+        self.data['crawler.cookies'][0]['cookies'].append('c4')
+        self.assertEqual(snapshot.cookies_by_seed['http://a.onion'], ('c1', 'c2'))
+
+
+class ConfigurationTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, 'crator.yml')
+        with open(self.path, 'w') as file:
+            yaml.dump({'crawler.depth': 2, 'crawler.cookies': [{'seed': 'http://a.onion', 'cookies': ['c1']}]}, file)
+
+        self.config = Configuration(self.path)
+
+    def test_lookups(self):
+        self.assertTrue(self.config.has_cookies('http://a.onion'))
+        self.assertTrue(self.config.requires_cookies('http://a.onion'))
+        self.assertFalse(self.config.has_cookies('http://b.onion'))
+        self.assertIsNone(self.config.cookies('http://b.onion'))
+        self.assertEqual(self.config.depth(), 2)
+
+    def test_cookies_are_copied(self):
+        self.config.cookies('http://a.onion').append('c2')
+        self.assertEqual(self.config.cookies('http://a.onion'), ['c1'])
+
+    def test_write_installs_snapshot(self):
+        version = self.config.version()
+        self.config.add_cookie('http://a.onion', 'c2')
+        self.assertGreater(self.config.version(), version)
+        self.assertEqual(self.config.cookies('http://a.onion'), ['c1', 'c2'])
+
+        self.config.remove_cookie('http://a.onion', 'c1')
+        self.assertEqual(self.config.cookies('http://a.onion'), ['c2'])
+
+    def test_reload_external_change(self):
+        version = self.config.version()
+        self.assertFalse(self.config.reload())
+
+        with open(self.path, 'w') as file:
+            yaml.dump({'crawler.depth': 3}, file)
+        stat = os.stat(self.path)
+        os.utime(self.path, (stat.st_atime, stat.st_mtime + 10))
+
+        self.assertTrue(self.config.reload())
+        self.assertEqual(self.config.version(), version + 1)
+        self.assertEqual(self.config.depth(), 3)
+        self.assertFalse(self.config.has_cookies('http://a.onion'))
+
+    def test_reload_imports_cookies(self):
+        store = CookieStore(os.path.join(os.path.dirname(self.path), 'cookies.db'))
+        self.addCleanup(store.close)
+        store.import_config(self.config)
+        self.config.add_listener(store.import_config)
+        self.addCleanup(self.config.remove_listener, store.import_config)
+
+        # A cookie added to the YAML file during the crawl reaches the store
+        with open(self.path, 'w') as file:
+            yaml.dump({'crawler.cookies': [{'seed': 'http://a.onion', 'cookies': ['c1', 'c2']}]}, file)
+        stat = os.stat(self.path)
+        os.utime(self.path, (stat.st_atime, stat.st_mtime + 10))
+
+        self.assertTrue(self.config.reload())
+        self.assertEqual(store.cookies('http://a.onion'), ['c1', 'c2'])
+
+    def test_empty_tor_instances(self):
+        self.assertEqual(self.config.tor_instances(), [])
+
+        # Key with no value, as in the example file
+        with open(self.path, 'w') as file:
+            file.write("tor_instances:\n")
+        stat = os.stat(self.path)
+        os.utime(self.path, (stat.st_atime, stat.st_mtime + 10))
+        self.assertTrue(self.config.reload())
+        self.assertEqual(self.config.tor_instances(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+import os
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+from cookie_store import CookieStore
+from cookie_store import INVALID
+from cookie_health import CookieHealthPool, VALID
+
+SEED = "http://a.onion"
+
+
+class CookieHealthPoolTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.store = CookieStore(os.path.join(directory, "cookies.db"))
+        self.addCleanup(self.store.close)
+        self.store.add_many(SEED, ["good1", "good2", "bad"])
+        # True while the validation requests fail (e.g., Tor outage)
+        self.outage = False
+
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def check(self, cookie):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(0.05)
+        with self.lock:
+            self.in_flight -= 1
+        if self.outage:
+            raise TimeoutError("Tor timeout")
+        return VALID if cookie.startswith("good") else INVALID
+
+    def test_validate_all(self):
+        pool = CookieHealthPool(SEED, self.store, self.check, concurrency=2)
+        self.addCleanup(pool.stop)
+        self.assertEqual(pool.validate_all(), 2)
+        self.assertEqual(self.store.cookies(SEED), ["good1", "good2"])
+        self.assertEqual(self.max_in_flight, 2)
+        self.assertEqual(pool.stats(), (2, 0, 2, 1, 0))
+
+    def test_outage(self):
+        pool = CookieHealthPool(SEED, self.store, self.check, recheck_interval=0)
+        self.addCleanup(pool.stop)
+        pool.validate_all()
+
+        # The failed validations keep the cookies, hot or not, and validate them again
+        self.outage = True
+        self.assertEqual(pool.validate_all(), 2)
+        self.assertEqual(self.store.cookies(SEED), ["good1", "good2"])
+        self.assertEqual(pool.stats(), (2, 0, 2, 1, 2))
+        self.assertEqual(self.store.retirements(SEED), {INVALID: 1})
+
+        self.store.add(SEED, "good3")
+        pool.validate_all()
+        self.assertEqual(len(pool), 2)
+        self.assertIn("good3", self.store.cookies(SEED))
+        self.outage = False
+        self.assertEqual(pool.validate_all(), 3)
+
+    def test_get_round_robin(self):
+        pool = CookieHealthPool(SEED, self.store, self.check)
+        self.addCleanup(pool.stop)
+        self.assertIsNone(pool.get())
+        pool.validate_all()
+
+        cookies = [pool.get() for _ in range(4)]
+        self.assertEqual(set(cookies[:2]), {"good1", "good2"})
+        self.assertEqual(cookies[:2], cookies[2:])
+
+        pool.discard("good1")
+        self.assertEqual({pool.get() for _ in range(3)}, {"good2"})
+
+    def test_revalidated_once_in_order(self):
+        pool = CookieHealthPool(SEED, self.store, self.check)
+        self.addCleanup(pool.stop)
+        pool.validate_all()
+
+        # The discarded cookie enters the hot set again before being dropped from the order
+        pool.discard("good1")
+        pool.validate_all()
+        self.assertEqual(sorted(pool.order), ["good1", "good2"])
+        cookies = [pool.get() for _ in range(4)]
+        self.assertEqual(cookies.count("good1"), 2)
+        self.assertEqual(cookies.count("good2"), 2)
+
+    def test_recheck(self):
+        pool = CookieHealthPool(SEED, self.store, self.check, recheck_interval=0)
+        self.addCleanup(pool.stop)
+        pool.validate_all()
+        self.assertEqual(pool.scan(), 2)
+
+        pool = CookieHealthPool(SEED, self.store, self.check, recheck_interval=600)
+        self.addCleanup(pool.stop)
+        pool.validate_all()
+        self.assertEqual(pool.scan(), 0)
+
+    def test_removed_from_store(self):
+        pool = CookieHealthPool(SEED, self.store, self.check)
+        self.addCleanup(pool.stop)
+        pool.validate_all()
+        self.store.remove(SEED, "good1")
+        pool.scan()
+        self.assertEqual(len(pool), 1)
+
+    def test_wait_ready(self):
+        pool = CookieHealthPool(SEED, self.store, self.check)
+        self.addCleanup(pool.stop)
+        pool.start()
+        self.assertTrue(pool.wait_ready(timeout=5))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+import os
+import math
+import random
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+from cookie_store import CookieStore, EXPIRED, PROACTIVE
+from cookie_rotation import CookieRotation, lifetime_quantile
+
+SEED = "http://a.onion"
+
+
+class CookieRotationTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.store = CookieStore(os.path.join(directory, "cookies.db"))
+        self.addCleanup(self.store.close)
+        self.rotation = CookieRotation(SEED, self.store, q=0.0, margin=0.5, min_samples=3)
+        self.clock = 0
+
+    def expire(self, cookie, requests, reason=EXPIRED):
+        self.store.add(SEED, cookie)
+        for _ in range(requests):
+            self.store.record_use(SEED, cookie)
+        self.assertTrue(self.store.retire(SEED, cookie, reason))
+
+    def retire(self, cookie, age, requests, reason):
+        # The cookies are retired one after the other, in the order of the calls
+        self.clock += 1000
+        with patch("cookie_store.time.time", return_value=self.clock - age):
+            self.store.add(SEED, cookie)
+        for _ in range(requests):
+            self.store.record_use(SEED, cookie)
+        with patch("cookie_store.time.time", return_value=self.clock):
+            self.assertTrue(self.store.retire(SEED, cookie, reason))
+
+    def test_lifetime_quantile(self):
+        self.assertEqual(lifetime_quantile([(10, True), (20, True), (30, True), (40, True)], 0.5), 20)
+        # Half of the cookies survived 15: the second expiry is the median
+        self.assertEqual(lifetime_quantile([(10, True), (15, False), (15, False), (20, True)], 0.5), 20)
+        # The censored cookies may expire after any observed lifetime
+        self.assertIsNone(lifetime_quantile([(10, True), (15, False), (15, False), (15, False)], 0.5))
+        self.assertIsNone(lifetime_quantile([], 0.2))
+
+    def test_usage(self):
+        self.store.add(SEED, "c1")
+        self.store.record_use(SEED, "c1")
+        self.store.record_failure(SEED, "c1")
+        age, requests, failures = self.store.record_use(SEED, "c1")
+        self.assertEqual((requests, failures), (2, 1))
+        self.assertEqual([row[2:] for row in self.store.usage(SEED)], [(2, 1)])
+        self.assertIsNone(self.store.record_use(SEED, "unknown"))
+
+    def test_no_estimate_without_samples(self):
+        self.expire("c1", 10)
+        self.assertEqual(self.rotation.refresh(force=True), (None, None))
+        self.assertFalse(self.rotation.should_retire(10 ** 6, 10 ** 6))
+
+    def test_retire_before_expiry(self):
+        for i, requests in enumerate([10, 20, 30]):
+            self.expire(f"c{i}", requests)
+        # The proactive retirements do not lower the estimate
+        self.expire("p", 1, PROACTIVE)
+
+        _, max_requests = self.rotation.refresh(force=True)
+        self.assertEqual(max_requests, 5)
+        self.assertFalse(self.rotation.should_retire(0, 4))
+        self.assertTrue(self.rotation.should_retire(0, 5))
+        self.assertEqual(self.store.retirements(SEED), {EXPIRED: 3, PROACTIVE: 1})
+
+    def test_replacements_needed(self):
+        self.assertEqual(self.rotation.replacements_needed(min_pool_size=2), 2)
+
+        with patch("cookie_store.time.time", return_value=0):
+            for i in range(3):
+                self.store.add(SEED, f"old{i}")
+        with patch("cookie_store.time.time", return_value=1000):
+            for i in range(3):
+                for _ in range(10):
+                    self.store.record_use(SEED, f"old{i}")
+                self.store.retire(SEED, f"old{i}", EXPIRED)
+            self.store.add_many(SEED, ["a", "b", "c"])
+            self.assertEqual(self.rotation.refresh(force=True), (500, 5))
+            self.assertEqual(self.rotation.replacements_needed(horizon=100, min_pool_size=2), 0)
+
+            for _ in range(5):
+                self.store.record_use(SEED, "a")
+            # "a" reached the estimated number of requests
+            self.assertEqual(self.rotation.replacements_needed(horizon=100, min_pool_size=2), 1)
+            # All the cookies reach the estimated age within the horizon
+            self.assertEqual(self.rotation.replacements_needed(horizon=600, min_pool_size=2), 3)
+
+    def test_failing_cookies(self):
+        self.assertFalse(self.rotation.is_failing(2, 2))
+        self.assertTrue(self.rotation.is_failing(6, 3))
+        self.assertFalse(self.rotation.is_failing(100, 3))
+
+        self.store.add_many(SEED, ["a", "b"])
+        self.assertEqual(self.rotation.replacements_needed(min_pool_size=2), 0)
+        for _ in range(3):
+            self.store.record_use(SEED, "a")
+            self.store.record_failure(SEED, "a")
+        # "a" will be retired at its next use
+        self.assertEqual(self.rotation.replacements_needed(min_pool_size=2), 1)
+
+    def test_stable_estimate(self):
+        rotation = CookieRotation(SEED, self.store, window=200)
+        generator = random.Random(0)
+        estimates = []
+        for i in range(15):
+            max_age, max_requests = rotation.refresh(force=True)
+            for j in range(40):
+                # Lifetimes uniform between 100 and 1000 seconds, a request every 50 seconds
+                lifetime = generator.uniform(100, 1000)
+                requests = int(lifetime // 50)
+                cookie = f"c{i}-{j}"
+                if rotation.should_retire(lifetime, requests, cookie):
+                    # Retired at the first threshold reached
+                    age = min(max_age, math.ceil(max_requests) * 50)
+                    self.retire(cookie, age, int(age // 50), PROACTIVE)
+                else:
+                    self.retire(cookie, lifetime, requests, EXPIRED)
+            estimates.append(rotation.refresh(force=True))
+
+        # RETIRE_MARGIN of the 20th percentile of the lifetimes: 0.9 * 280s and 0.9 * 5 requests, not shrinking
+        last_ages = [max_age for max_age, _ in estimates[-5:]]
+        last_requests = [max_requests for _, max_requests in estimates[-5:]]
+        self.assertTrue(200 <= sum(last_ages) / len(last_ages) <= 400)
+        self.assertTrue(3.6 <= sum(last_requests) / len(last_requests) <= 7.2)
+        self.assertGreater(min(max_age for max_age, _ in estimates), 150)
+
+
+if __name__ == '__main__':
+    unittest.main()
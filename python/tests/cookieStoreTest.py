@@ -0,0 +1,63 @@
+import os
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+from cookie_store import CookieStore
+
+SEED = "http://a.onion"
+
+
+class CookieStoreTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, "cookies.db")
+        self.store = CookieStore(self.path)
+        self.addCleanup(self.store.close)
+
+    def test_add_remove(self):
+        self.assertFalse(self.store.requires_cookies(SEED))
+        self.assertTrue(self.store.add(SEED, "c1"))
+        self.assertFalse(self.store.add(SEED, "c1"))
+        self.assertEqual(self.store.add_many(SEED, ["c1", "c2", "c3"]), 2)
+        self.assertEqual(self.store.cookies(SEED), ["c1", "c2", "c3"])
+        self.assertTrue(self.store.requires_cookies(SEED))
+
+        self.assertTrue(self.store.remove(SEED, "c2"))
+        self.assertFalse(self.store.remove(SEED, "c2"))
+        self.assertEqual(self.store.count(SEED), 2)
+
+        self.store.remove_seed(SEED)
+        self.assertEqual(self.store.count(SEED), 0)
+        self.assertFalse(self.store.requires_cookies(SEED))
+
+    def test_lease_round_robin(self):
+        self.assertIsNone(self.store.lease(SEED))
+        self.store.add_many(SEED, ["c1", "c2", "c3"])
+        leased = [self.store.lease(SEED) for _ in range(6)]
+        self.assertEqual(set(leased[:3]), {"c1", "c2", "c3"})
+        self.assertEqual(leased[:3], leased[3:])
+
+    def test_wait_lease_timeout(self):
+        self.assertIsNone(self.store.wait_lease(SEED, timeout=0.1))
+
+    def test_wait_lease_same_process(self):
+        timer = threading.Timer(0.1, self.store.add, (SEED, "c1"))
+        timer.start()
+        start = time.monotonic()
+        self.assertEqual(self.store.wait_lease(SEED, timeout=5), "c1")
+        self.assertLess(time.monotonic() - start, 1)
+
+    def test_wait_lease_other_connection(self):
+        # Another process, e.g. extract_cookie.py, has its own connection
+        other = CookieStore(self.path)
+        self.addCleanup(other.close)
+        timer = threading.Timer(0.1, other.add, (SEED, "c1"))
+        timer.start()
+        self.assertEqual(self.store.wait_lease(SEED, timeout=5), "c1")
+
+
+if __name__ == '__main__':
+    unittest.main()
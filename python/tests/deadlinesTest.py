@@ -0,0 +1,40 @@
+import time
+import threading
+import unittest
+from deadlines import Watchdog, build_timeouts, PAGE, IMAGE, IP_CHECK
+
+
+class DeadlinesTest(unittest.TestCase):
+    def test_build_timeouts(self):
+        timeouts = build_timeouts({"page": 60, "connect": 10})
+        self.assertEqual(timeouts[PAGE].requests_timeout(), (10, 60))
+        # Default deadline
+        self.assertEqual(timeouts[IMAGE].deadline, 90)
+        # The connection timeout never exceeds the deadline
+        self.assertEqual(build_timeouts({"ip_check": 5})[IP_CHECK].requests_timeout(), (5, 5))
+
+    def test_watchdog_expires_task(self):
+        watchdog = Watchdog()
+        expired = threading.Event()
+        watchdog.watch("task", 0.05, lambda key: expired.set())
+
+        self.assertTrue(expired.wait(2))
+        # The owner knows the task has already been handled
+        self.assertFalse(watchdog.unwatch("task"))
+        watchdog.stop()
+
+    def test_watchdog_unwatched_task(self):
+        watchdog = Watchdog()
+        expired = []
+        watchdog.watch("slow", 0.1, expired.append)
+        watchdog.watch("fast", 0.1, expired.append)
+
+        self.assertTrue(watchdog.unwatch("fast"))
+        time.sleep(0.3)
+        self.assertEqual(expired, ["slow"])
+        self.assertEqual(len(watchdog), 0)
+        watchdog.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import time
+import unittest
+from handler import TorHandler, build_response
+from downloader import Downloader
+from hedging import Hedger, HEDGE_IDENTITY
+
+HOST = "http://a.onion"
+
+
+class FakeTorHandler(TorHandler):
+    """
+    Tor handler answering each URL after its own delay, with no Tor process.
+    """
+    def __init__(self, delays=None, hedge_delay=0.0):
+        """
+        :param delays: url -> seconds before its response, 0 by default
+        :param hedge_delay: seconds before the response of a duplicate request
+        """
+        super().__init__("password", 9051, "socks5h://127.0.0.1:9050", "python")
+        self.delays = delays if delays else {}
+        self.hedge_delay = hedge_delay
+        self.identities_used = []
+
+    def send_request(self, url, cookie=None, headers=None, identity=None, **kwargs):
+        self.identities_used.append(identity)
+        hedged = identity is not None and identity.startswith(HEDGE_IDENTITY)
+        time.sleep(self.hedge_delay if hedged else self.delays.get(url, 0.0))
+        return build_response(url, 200, {}, b"<html></html>"), cookie
+
+    def stop_tor_process(self):
+        pass
+
+
+class DownloaderTest(unittest.TestCase):
+    def create_downloader(self, delays, n_threads=2):
+        downloader = Downloader(n_threads, FakeTorHandler(delays), restart_tor=10 ** 6, waiting_time=0)
+        downloader.start()
+        self.addCleanup(downloader.stop)
+        return downloader
+
+    def test_completion_order(self):
+        downloader = self.create_downloader({f"{HOST}/slow": 0.5})
+        downloader.enqueue(f"{HOST}/slow", None)
+        downloader.enqueue(f"{HOST}/fast", None)
+
+        # The results are returned as soon as they are downloaded, not in submission order
+        first = downloader.get_result(timeout=5)
+        second = downloader.get_result(timeout=5)
+        self.assertEqual([first.url, second.url], [f"{HOST}/fast", f"{HOST}/slow"])
+        web_page, _ = second.result()
+        self.assertEqual(web_page.status_code, 200)
+        self.assertLessEqual(first.elapsed(), second.elapsed())
+
+    def test_is_empty_with_requests_in_flight(self):
+        downloader = self.create_downloader({f"{HOST}/slow": 0.3})
+        self.assertTrue(downloader.is_empty())
+
+        downloader.enqueue(f"{HOST}/slow", None)
+        deadline = time.monotonic() + 5
+        while not downloader.in_flight and time.monotonic() < deadline:
+            time.sleep(0.01)
+        # Dequeued but not completed yet
+        self.assertFalse(downloader.queue)
+        self.assertFalse(downloader.is_empty())
+
+        self.assertIsNotNone(downloader.get_result(timeout=5))
+        self.assertTrue(downloader.is_empty())
+
+    def test_get_result_timeout(self):
+        downloader = self.create_downloader({f"{HOST}/slow": 0.5})
+        self.assertIsNone(downloader.get_result(timeout=0.05))
+
+        downloader.enqueue(f"{HOST}/slow", None)
+        self.assertIsNone(downloader.get_result(timeout=0.05))
+        self.assertEqual(downloader.get_results(), [])
+        self.assertIsNotNone(downloader.get_result(timeout=5))
+
+
+class DownloaderHedgingTest(unittest.TestCase):
+    def test_hedge_win_records_primary_latency(self):
+        hedger = Hedger(budget=1.0, q=0.5, window=10, min_samples=3)
+        for _ in range(3):
+            hedger.observe(f"{HOST}/fast", 0.1)
+
+        url = f"{HOST}/slow"
+        tor_handler = FakeTorHandler({url: 2.0})
+        downloader = Downloader(2, tor_handler, restart_tor=10 ** 6, waiting_time=0, hedger=hedger)
+        downloader.start()
+        self.addCleanup(downloader.stop)
+
+        downloader.enqueue(url, "cookie")
+        download = downloader.get_result(timeout=5)
+        self.assertEqual(download.url, url)
+        self.assertIsNotNone(download.hedge)
+
+        # The slow original request enters the latencies, with at least the hedging threshold
+        requests, hedges, wins, _ = hedger.stats()
+        self.assertEqual((requests, hedges, wins), (1, 1, 1))
+        self.assertEqual(len(hedger.latencies["a.onion"]), 4)
+        self.assertGreaterEqual(hedger.latencies["a.onion"][-1], 0.1)
+
+
+if __name__ == '__main__':
+    unittest.main()
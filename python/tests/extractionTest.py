@@ -0,0 +1,89 @@
+import time
+import threading
+import unittest
+from extraction import ExtractionPool, PageAnalysis, analyze_in_worker
+from handler import build_response
+from exceptions import AnalysisError
+
+SEED = "http://a.onion/category/drugs/cannabis"
+SPEC = ("drughub", "drugs", "cannabis", SEED, ())
+WAITING_PAGE = b"<html><head><title>Please Wait</title></head><body></body></html>"
+FRENCH_PAGE = b"<html lang='fr'><head><title>Cannabis</title></head><body>Produits</body></html>"
+# Page taking about a second to be parsed
+LARGE_PAGE = b"<html lang='fr'><head><title>Cannabis</title></head><body>" + b"<p>x</p>" * 40000 + b"</body></html>"
+
+
+class AnalyzeInWorkerTest(unittest.TestCase):
+    def test_waiting_page(self):
+        analysis = analyze_in_worker(SPEC, WAITING_PAGE, SEED, SEED, 200, False)
+        self.assertIsInstance(analysis, PageAnalysis)
+        self.assertTrue(analysis.waiting_page)
+        self.assertFalse(analysis.english)
+
+    def test_language(self):
+        analysis = analyze_in_worker(SPEC, FRENCH_PAGE, SEED, SEED, 200, False)
+        self.assertFalse(analysis.waiting_page)
+        self.assertFalse(analysis.has_captcha)
+        self.assertFalse(analysis.english)
+        self.assertIsNone(analysis.error)
+
+
+class ExtractionPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.pool = ExtractionPool(1)
+        self.addCleanup(self.pool.stop)
+
+    def test_analyze(self):
+        analysis = self.pool.analyze(SPEC, build_response(SEED, 200, {}, WAITING_PAGE), False)
+        self.assertTrue(analysis.waiting_page)
+
+        analysis = self.pool.analyze(SPEC, build_response(SEED, 200, {}, FRENCH_PAGE), False)
+        self.assertFalse(analysis.waiting_page)
+        self.assertFalse(analysis.english)
+
+    def test_timeout_restarts_pool(self):
+        # No worker process can start within the timeout
+        self.pool.timeout = 0.001
+        executor = self.pool.executor
+        with self.assertRaises(AnalysisError):
+            self.pool.analyze(SPEC, build_response(SEED, 200, {}, WAITING_PAGE), False)
+        self.assertIsNot(self.pool.executor, executor)
+
+        self.pool.timeout = 60
+        self.assertTrue(self.pool.analyze(SPEC, build_response(SEED, 200, {}, WAITING_PAGE), False).waiting_page)
+
+    def test_timeout_spares_other_analyses(self):
+        pool = ExtractionPool(2)
+        self.addCleanup(pool.stop)
+        pool.analyze(SPEC, build_response(SEED, 200, {}, WAITING_PAGE), False)
+
+        results = []
+        other = threading.Thread(target=lambda: results.append(
+            pool.analyze(SPEC, build_response(SEED, 200, {}, LARGE_PAGE), False)))
+        other.start()
+        time.sleep(0.2)
+
+        # The timeout of this analysis kills the worker of the other one, which is analyzed again by the new pool
+        executor = pool.executor
+        with self.assertRaises(AnalysisError):
+            pool.analyze(SPEC, build_response(SEED, 200, {}, WAITING_PAGE), False, timeout=0.001)
+        other.join(60)
+        self.assertIsNot(pool.executor, executor)
+        self.assertEqual(len(results), 1)
+        self.assertFalse(results[0].english)
+
+    def test_dead_worker_restarts_pool(self):
+        self.pool.analyze(SPEC, build_response(SEED, 200, {}, WAITING_PAGE), False)
+        executor = self.pool.executor
+        for process in executor._processes.values():
+            process.kill()
+            process.join()
+
+        with self.assertRaises(AnalysisError):
+            self.pool.analyze(SPEC, build_response(SEED, 200, {}, WAITING_PAGE), False)
+        self.assertIsNot(self.pool.executor, executor)
+        self.assertTrue(self.pool.analyze(SPEC, build_response(SEED, 200, {}, WAITING_PAGE), False).waiting_page)
+
+
+if __name__ == '__main__':
+    unittest.main()
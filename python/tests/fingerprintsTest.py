@@ -0,0 +1,42 @@
+import unittest
+from fingerprints import FingerprintTable, BloomFilter
+
+
+class FingerprintTableTest(unittest.TestCase):
+    def test_add_assigns_node_indices(self):
+        table = FingerprintTable(capacity=4)
+        urls = [f"http://example.onion/product/{i}" for i in range(100)]
+
+        for depth, url in enumerate(urls):
+            self.assertEqual(table.add(url, depth), depth)
+
+        self.assertEqual(len(table), 100)
+        self.assertEqual(table.add(urls[10]), 10)
+        self.assertEqual(table["http://example.onion/product/42/"], 42)
+        self.assertEqual(table.depth(urls[99]), 99)
+        self.assertNotIn("http://example.onion/product/100", table)
+        self.assertIsNone(table.get("http://example.onion/product/100"))
+
+    def test_put_keeps_next_index(self):
+        table = FingerprintTable()
+        table.put("http://example.onion/a", 7, 1)
+        self.assertEqual(table.add("http://example.onion/b"), 8)
+        self.assertIsNone(table.depth("http://example.onion/b"))
+
+    def test_slot_size(self):
+        table = FingerprintTable()
+        self.assertEqual(table.keys.itemsize + table.indices.itemsize + table.depths.itemsize, 20)
+
+
+class BloomFilterTest(unittest.TestCase):
+    def test_contains(self):
+        bloom = BloomFilter(1000)
+        for i in range(1000):
+            bloom.add(f"http://example.onion/product/{i}")
+
+        self.assertTrue(all(f"http://example.onion/product/{i}" in bloom for i in range(1000)))
+        self.assertNotIn("http://example.onion/vendor/1", bloom)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import unittest
+import tempfile
+from frontier import FrontierStore, CRAWLED, DROPPED
+from utils.urls import url_fingerprint
+
+
+class FrontierStoreTest(unittest.TestCase):
+    def test_load_resumes_pending_nodes(self):
+        project_path = tempfile.mkdtemp()
+        seed = "http://example.onion/category/drugs/cannabis"
+
+        frontier = FrontierStore(project_path, seed)
+        frontier.add_node(seed, 0, 0, CRAWLED)
+        frontier.add_node(f"{seed}/1", 1, 1)
+        frontier.add_node(f"{seed}/2", 2, 1)
+        frontier.set_state(f"{seed}/2", DROPPED)
+        frontier.set_retries(f"{seed}/1", 2, 1)
+        frontier.add_unvisited(f"{seed}/3")
+        frontier.close()
+
+        state = FrontierStore(project_path, seed).load()
+
+        self.assertEqual(len(state.visited), 3)
+        self.assertEqual(state.visited[f"{seed}/2"], 2)
+        self.assertEqual(state.visited.depth(f"{seed}/1"), 1)
+        self.assertEqual(state.pending, [f"{seed}/1"])
+        self.assertEqual(state.retry_counts, {url_fingerprint(f"{seed}/1"): 2})
+        self.assertEqual(state.url_attempts, {url_fingerprint(f"{seed}/1"): 1})
+        self.assertIn(f"{seed}/3", state.unvisited_links)
+        self.assertNotIn(f"{seed}/4", state.unvisited_links)
+        self.assertEqual(state.visited.next_index, 3)
+        self.assertEqual(state.n_links_crawled, 1)
+
+    def test_page_validators(self):
+        project_path = tempfile.mkdtemp()
+        url = "http://example.onion/product/1"
+
+        frontier = FrontierStore(project_path, "http://example.onion")
+        frontier.add_node(url, 4, 2, CRAWLED)
+        frontier.set_page_validators(url, '"abc"', None, "hash")
+        frontier.close()
+
+        previous = FrontierStore(project_path, "http://example.onion", read_only=True)
+        self.assertEqual(previous.get_page(url), (4, '"abc"', None, "hash"))
+        self.assertIsNone(previous.get_page("http://example.onion/product/2"))
+        previous.close()
+
+    def test_empty_frontier(self):
+        frontier = FrontierStore(tempfile.mkdtemp(), "http://example.onion")
+        self.assertTrue(frontier.is_empty())
+        self.assertEqual(frontier.load().visited.next_index, 0)
+        frontier.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
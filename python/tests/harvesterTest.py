@@ -0,0 +1,89 @@
+import os
+import time
+import shutil
+import tempfile
+import itertools
+import threading
+import unittest
+from cookie_store import CookieStore, EXPIRED
+from harvester import CookieHarvester
+
+SEED = "http://a.onion"
+
+
+class FakeExtractor:
+    """
+    Cookie extractor failing every other attempt.
+    """
+    counter = itertools.count()
+
+    def __init__(self, identity):
+        self.identity = identity
+        self.rotations = 0
+
+    def store_new_cookie(self, cookie_store):
+        n = next(self.counter)
+        time.sleep(0.01)
+        if n % 2:
+            return False
+        return cookie_store.add(SEED, f"cookie{n}")
+
+    def new_identity(self):
+        self.rotations += 1
+
+
+class CookieHarvesterTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.store = CookieStore(os.path.join(directory, "cookies.db"))
+        self.addCleanup(self.store.close)
+        self.identities = []
+        self.lock = threading.Lock()
+
+    def create_extractor(self, identity):
+        with self.lock:
+            self.identities.append(identity)
+        return FakeExtractor(identity)
+
+    def wait_until(self, predicate, timeout=5):
+        deadline = time.monotonic() + timeout
+        while not predicate() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return predicate()
+
+    def test_target_size_follows_consumption(self):
+        harvester = CookieHarvester(SEED, self.store, self.create_extractor, lead_time=3600)
+        self.assertEqual(harvester.target_size(), 2)
+        self.assertEqual(harvester.needed(), 2)
+
+        for i in range(5):
+            self.store.add(SEED, f"old{i}")
+            self.store.retire(SEED, f"old{i}", EXPIRED)
+        self.assertEqual(harvester.target_size(), 5)
+
+    def test_keep_pool_size(self):
+        harvester = CookieHarvester(SEED, self.store, self.create_extractor, n_workers=3)
+        harvester.start()
+        self.addCleanup(harvester.stop)
+
+        self.assertTrue(self.wait_until(lambda: self.store.count(SEED) >= 2))
+        time.sleep(0.1)
+        # No cookie beyond the target size
+        self.assertEqual(self.store.count(SEED), 2)
+        self.assertEqual(len(set(self.identities)), 3)
+
+        n_attempts, n_harvested, success_ratio, _, target_size, n_stored = harvester.stats()
+        self.assertEqual((n_harvested, target_size, n_stored), (2, 2, 2))
+        self.assertGreaterEqual(n_attempts, n_harvested)
+        self.assertEqual(success_ratio, round(n_harvested / n_attempts, 3))
+
+        # A consumed cookie is replaced
+        self.store.remove(SEED, self.store.cookies(SEED)[0])
+        with harvester.condition:
+            harvester.condition.notify_all()
+        self.assertTrue(self.wait_until(lambda: self.store.count(SEED) == 2))
+
+
+if __name__ == '__main__':
+    unittest.main()
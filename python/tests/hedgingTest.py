@@ -0,0 +1,42 @@
+import unittest
+from hedging import Hedger, hedge_identity
+
+
+class HedgingTest(unittest.TestCase):
+    def setUp(self):
+        self.hedger = Hedger(budget=0.1, q=0.9, window=10, min_samples=5)
+
+    def test_threshold_per_host(self):
+        for latency in [1, 2, 3, 4]:
+            self.hedger.observe("http://a.onion/page", latency)
+        # Not enough samples
+        self.assertIsNone(self.hedger.threshold("http://a.onion/other"))
+
+        for latency in range(5, 11):
+            self.hedger.observe("http://a.onion/page", latency)
+        self.assertEqual(self.hedger.threshold("http://a.onion/other"), 10)
+        self.assertIsNone(self.hedger.threshold("http://b.onion/page"))
+
+    def test_budget(self):
+        self.assertFalse(self.hedger.try_hedge())
+
+        for _ in range(20):
+            self.hedger.count_request()
+        self.assertTrue(self.hedger.try_hedge())
+        self.assertTrue(self.hedger.try_hedge())
+        self.assertFalse(self.hedger.try_hedge())
+
+    def test_stats(self):
+        self.hedger.count_request()
+        self.hedger.record_win()
+        self.hedger.record_saved(2.5)
+        self.hedger.record_saved(-1)
+        self.assertEqual(self.hedger.stats(), (1, 0, 1, 2.5))
+
+    def test_hedge_identity(self):
+        self.assertNotEqual(hedge_identity("cookie"), "cookie")
+        self.assertNotEqual(hedge_identity(None), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,38 @@
+import unittest
+from identity import IdentityManager
+
+
+class IdentityManagerTest(unittest.TestCase):
+    def test_profile_bound_to_identity(self):
+        identities = IdentityManager(n_profiles=8)
+        headers = identities.headers("cookie")
+
+        self.assertEqual(set(headers), {"User-Agent", "Accept", "Accept-Language"})
+        for _ in range(10):
+            self.assertEqual(identities.headers("cookie"), headers)
+
+    def test_headers_are_copies(self):
+        identities = IdentityManager(n_profiles=8)
+        identities.headers("cookie")["Cookie"] = "value"
+
+        self.assertNotIn("Cookie", identities.headers("cookie"))
+
+    def test_dataset_loaded_once(self):
+        identities = IdentityManager(n_profiles=8)
+        identities.headers("a")
+        user_agent = identities.user_agent
+
+        identities.headers("b")
+        identities.random_useragent()
+        self.assertIs(identities.user_agent, user_agent)
+
+    def test_release(self):
+        identities = IdentityManager(n_profiles=8)
+        identities.headers("cookie")
+
+        identities.release("cookie")
+        self.assertNotIn("cookie", identities.bindings)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from frontier import FrontierStore, FRONTIER_FILE_NAME, CRAWLED
+from incremental import PreviousCrawl
+from handler import build_response
+
+SEED = "http://example.onion"
+
+
+class PreviousCrawlTest(unittest.TestCase):
+    def setUp(self):
+        self.project_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.project_path)
+        self.path = os.path.join(self.project_path, FRONTIER_FILE_NAME)
+
+    def snapshot(self):
+        with open(self.path, "rb") as file:
+            return file.read(), os.stat(self.path).st_mtime_ns
+
+    def test_previous_frontier_unchanged(self):
+        url = f"{SEED}/product/1"
+        frontier = FrontierStore(self.project_path, SEED)
+        frontier.add_node(url, 1, 1, CRAWLED)
+        frontier.set_page_validators(url, '"abc"', None, "hash")
+        frontier.close()
+        before = self.snapshot()
+
+        previous = PreviousCrawl(self.project_path, SEED)
+        self.assertEqual(previous.conditional_headers(url), {"If-None-Match": '"abc"'})
+        self.assertFalse(previous.is_unchanged(url, build_response(url, 200, {}, b"new content")))
+        previous.close()
+
+        self.assertEqual(self.snapshot(), before)
+        self.assertFalse(os.path.exists(self.path + "-wal"))
+
+    def test_frontier_without_validators(self):
+        # Frontier stored before the page validators, in rollback journal mode
+        connection = sqlite3.connect(self.path)
+        connection.execute("CREATE TABLE nodes (seed TEXT, url TEXT)")
+        connection.commit()
+        connection.close()
+        before = self.snapshot()
+
+        previous = PreviousCrawl(self.project_path, SEED)
+        self.assertEqual(previous.conditional_headers(f"{SEED}/product/1"), {})
+        previous.close()
+
+        self.assertEqual(self.snapshot(), before)
+
+    def test_missing_frontier(self):
+        with self.assertRaises(FileNotFoundError):
+            PreviousCrawl(self.project_path, SEED)
+        self.assertFalse(os.path.exists(self.path))
+
+
+if __name__ == '__main__':
+    unittest.main()
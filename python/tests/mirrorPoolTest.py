@@ -0,0 +1,60 @@
+import unittest
+from unittest.mock import patch
+import requests
+from mirror_pool import MirrorPool, MAX_CONSECUTIVE_FAILURES
+
+
+class MirrorPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.pool = MirrorPool("http://main.onion/drugs", ["http://mirror1.onion", "mirror2.onion/"])
+        # No random choice of the mirrors
+        exploration = patch("mirror_pool.EXPLORATION", 0)
+        exploration.start()
+        self.addCleanup(exploration.stop)
+
+    def test_hosts(self):
+        self.assertEqual(self.pool.hosts(), ("main.onion", "mirror1.onion", "mirror2.onion"))
+
+    def test_canonical(self):
+        self.assertEqual(self.pool.canonical("http://mirror1.onion/drugs?page=2"), "http://main.onion/drugs?page=2")
+        self.assertEqual(self.pool.canonical("http://other.onion/drugs"), "http://other.onion/drugs")
+
+    def test_spread_over_mirrors(self):
+        hosts = set()
+        mirrors = []
+        for _ in range(3):
+            url, mirror = self.pool.resolve("http://main.onion/drugs")
+            hosts.add(url.split("/")[2])
+            mirrors.append(mirror)
+        self.assertEqual(hosts, {"main.onion", "mirror1.onion", "mirror2.onion"})
+
+        # The URLs of other hosts are not moved
+        self.assertEqual(self.pool.resolve("http://other.onion/a"), ("http://other.onion/a", None))
+
+        for mirror in mirrors:
+            self.pool.release(mirror, 1.0, False)
+
+    def test_failover(self):
+        failing = self.pool.mirrors["main.onion"]
+        for _ in range(MAX_CONSECUTIVE_FAILURES):
+            failing.in_flight += 1
+            self.pool.release(failing, 1.0, True)
+
+        for _ in range(10):
+            _, mirror = self.pool.resolve("http://main.onion/drugs")
+            self.assertIsNot(mirror, failing)
+            self.pool.release(mirror, 1.0, False)
+
+    def test_canonical_response(self):
+        response = requests.Response()
+        response.url = "http://mirror2.onion/drugs/1"
+        response.request = requests.PreparedRequest()
+        response.request.url = "http://mirror2.onion/drugs/1"
+        self.pool.canonical_response(response)
+
+        self.assertEqual(response.url, "http://main.onion/drugs/1")
+        self.assertEqual(response.request.url, "http://main.onion/drugs/1")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,25 @@
+import unittest
+from near_duplicates import simhash, hamming_distance, SimHashIndex
+
+
+class NearDuplicatesTest(unittest.TestCase):
+    text = " ".join(f"product{i} sold by vendor{i % 7} for {i} USD" for i in range(200))
+
+    def test_simhash(self):
+        self.assertEqual(simhash(self.text), simhash(self.text.upper()))
+        self.assertLessEqual(hamming_distance(simhash(self.text), simhash(self.text + " sorted by price")), 3)
+        self.assertGreater(hamming_distance(simhash(self.text), simhash("Shipping from Germany to Worldwide")), 3)
+
+    def test_index(self):
+        index = SimHashIndex(max_distance=3)
+        fingerprint = simhash(self.text)
+        index.add(fingerprint, 12)
+
+        self.assertEqual(index.find(fingerprint ^ 0b101), 12)
+        self.assertEqual(index.find(fingerprint ^ (1 << 63)), 12)
+        self.assertIsNone(index.find(fingerprint ^ 0b1111))
+        self.assertEqual(len(index), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import unittest
+from parsed_page import ParsedPage
+from handler import build_response
+
+HTML = b"""<html lang="en">
+<head><title>Cannabis - Market</title></head>
+<body>
+<ul class="breadcrumb"><li>Drugs</li><li>Cannabis</li></ul>
+<a href="/product/1">Product 1</a>
+<a href="/product/2">Product 2</a>
+<button>Buy</button>
+<img src="/images/1.jpg">
+<p>Caf\xe9 quality</p>
+</body>
+</html>"""
+
+
+class ParsedPageTest(unittest.TestCase):
+    def setUp(self):
+        web_page = build_response("http://a.onion/category", 200, {}, HTML, request_url="http://a.onion/c")
+        self.page = ParsedPage(web_page)
+
+    def test_views(self):
+        self.assertEqual(self.page.title, "Cannabis - Market")
+        self.assertEqual(self.page.lang, "en")
+        self.assertEqual([a["href"] for a in self.page.anchors], ["/product/1", "/product/2"])
+        self.assertEqual(len(self.page.buttons), 1)
+        self.assertEqual([img["src"] for img in self.page.images], ["/images/1.jpg"])
+        self.assertEqual(self.page.breadcrumb.text, "DrugsCannabis")
+        # Decoded with the default encoding, iso-8859-1
+        self.assertIn("Café quality", self.page.body_text)
+
+        self.assertEqual(self.page.url, "http://a.onion/category")
+        self.assertEqual(self.page.request_url, "http://a.onion/c")
+        self.assertEqual(self.page.status_code, 200)
+
+    def test_views_are_cached(self):
+        soup = self.page.soup
+        anchors = self.page.anchors
+        self.assertIs(self.page.anchors, anchors)
+        self.assertIs(self.page.images, self.page.images)
+        self.assertIs(self.page.body_text, self.page.body_text)
+        self.assertIs(self.page.soup, soup)
+
+    def test_release(self):
+        anchors = self.page.anchors
+        self.page.release()
+        self.assertIsNone(self.page._soup)
+        self.assertEqual(self.page._cache, {})
+
+        # Parsed again at the next access
+        self.assertIsNot(self.page.anchors, anchors)
+        self.assertEqual(len(self.page.anchors), 2)
+        self.assertEqual(self.page.title, "Cannabis - Market")
+
+    def test_raw_content(self):
+        page = ParsedPage(b"<html><body>No title</body></html>", url="http://a.onion/raw")
+        self.assertIsNone(page.title)
+        self.assertIsNone(page.lang)
+        self.assertIsNone(page.breadcrumb)
+        self.assertEqual(page.anchors, [])
+        self.assertEqual(page.request_url, "http://a.onion/raw")
+        self.assertIsNone(page.status_code)
+        self.assertEqual(page.history, [])
+        self.assertEqual(ParsedPage(b"<html></html>").body_text, "")
+
+    def test_of(self):
+        self.assertIs(ParsedPage.of(self.page), self.page)
+        self.assertIsInstance(ParsedPage.of(HTML), ParsedPage)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,37 @@
+import unittest
+from rate_limiter import TokenBucket, RateLimiter
+
+
+class TokenBucketTest(unittest.TestCase):
+    def test_reserve_consecutive_slots(self):
+        bucket = TokenBucket(rate=10)
+        delays = [bucket.reserve() for _ in range(5)]
+
+        for i, delay in enumerate(delays):
+            self.assertAlmostEqual(delay, i * 0.1, delta=0.02)
+
+    def test_burst(self):
+        bucket = TokenBucket(rate=1, burst=3)
+        bucket.next_slot -= 10  # idle bucket
+
+        delays = [bucket.reserve() for _ in range(4)]
+        self.assertEqual(delays[:3], [0.0, 0.0, 0.0])
+        self.assertAlmostEqual(delays[3], 1, delta=0.02)
+
+    def test_invalid_rate(self):
+        with self.assertRaises(ValueError):
+            TokenBucket(rate=0)
+
+
+class RateLimiterTest(unittest.TestCase):
+    def test_bucket_per_host(self):
+        limiter = RateLimiter(requests_per_second=0.5, jitter=0)
+
+        self.assertIs(limiter.get_bucket("http://a.onion/x"), limiter.get_bucket("http://A.onion/y?z=1"))
+        self.assertEqual(limiter.acquire("http://a.onion/x"), 0)
+        self.assertEqual(limiter.acquire("http://b.onion/x"), 0)
+        self.assertAlmostEqual(limiter.get_bucket("http://a.onion").reserve(), 2, delta=0.05)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import time
+import unittest
+from types import SimpleNamespace
+from retry import (RetryScheduler, RetryPolicy, ERROR, CAPTCHA, HTTP_STATUS, is_retryable_status, retry_after)
+
+
+class RetryTest(unittest.TestCase):
+    def setUp(self):
+        policies = {ERROR: RetryPolicy(base_delay=1, max_delay=3, max_attempts=3),
+                    CAPTCHA: RetryPolicy(base_delay=10, max_delay=10, max_attempts=1)}
+        self.scheduler = RetryScheduler(policies, budget_ratio=0.5, min_budget=5, jitter=0)
+
+    def test_exponential_backoff(self):
+        url = "http://a.onion/page"
+        self.assertEqual(self.scheduler.schedule(url, ERROR), 1)
+        self.assertEqual(self.scheduler.schedule(url, ERROR), 2)
+        self.assertEqual(self.scheduler.schedule(url, ERROR), 3)
+        # No retries left
+        self.assertIsNone(self.scheduler.schedule(url, ERROR))
+        self.assertEqual(self.scheduler.get_attempts(url, ERROR), 3)
+
+    def test_reasons_counted_separately(self):
+        url = "http://a.onion/page"
+        self.assertIsNotNone(self.scheduler.schedule(url, CAPTCHA))
+        self.assertIsNone(self.scheduler.schedule(url, CAPTCHA))
+        self.assertIsNotNone(self.scheduler.schedule(url, ERROR))
+
+    def test_budget(self):
+        for i in range(5):
+            self.assertIsNotNone(self.scheduler.schedule(f"http://a.onion/{i}", ERROR))
+        self.assertIsNone(self.scheduler.schedule("http://a.onion/5", ERROR))
+
+        # New requests increase the budget
+        self.scheduler.count_request()
+        self.scheduler.count_request()
+        self.assertIsNotNone(self.scheduler.schedule("http://a.onion/5", ERROR))
+
+    def test_pop_due(self):
+        self.scheduler.schedule("http://a.onion/now", ERROR, item="now", delay=0)
+        self.scheduler.schedule("http://a.onion/later", ERROR, item="later")
+
+        self.assertEqual(self.scheduler.pop_due(), [("http://a.onion/now", "now")])
+        self.assertEqual(len(self.scheduler), 1)
+        self.assertGreater(self.scheduler.next_delay(), 0)
+
+    def test_restore(self):
+        self.scheduler.restore({"key": 2}, ERROR)
+        self.assertEqual(self.scheduler.attempts["key"], {ERROR: 2})
+
+    def test_retryable_status(self):
+        self.assertTrue(is_retryable_status(503))
+        self.assertTrue(is_retryable_status(429))
+        self.assertFalse(is_retryable_status(404))
+        self.assertNotIn(HTTP_STATUS, self.scheduler.policies)
+
+    def test_retry_after(self):
+        self.assertEqual(retry_after(SimpleNamespace(headers={"Retry-After": "120"})), 120)
+        self.assertIsNone(retry_after(SimpleNamespace(headers={})))
+        self.assertIsNone(retry_after(SimpleNamespace(headers={"Retry-After": "soon"})))
+
+        date = time.strftime("%a, %d %b %Y %H:%M:%S GMT", time.gmtime(time.time() + 60))
+        self.assertAlmostEqual(retry_after(SimpleNamespace(headers={"Retry-After": date})), 60, delta=2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import unittest
+from session_pool import SessionPool
+
+PROXIES = {"http": "socks5h://127.0.0.1:9050", "https": "socks5h://127.0.0.1:9050"}
+
+
+class SessionPoolTest(unittest.TestCase):
+    def test_session_reused_per_circuit_and_host(self):
+        pool = SessionPool()
+        session = pool.get("token", "a.onion", PROXIES)
+
+        self.assertIs(pool.get("token", "a.onion", PROXIES), session)
+        self.assertIsNot(pool.get("token", "b.onion", PROXIES), session)
+        self.assertIsNot(pool.get("other", "a.onion", PROXIES), session)
+        self.assertEqual(session.proxies["http"], PROXIES["http"])
+
+    def test_lru_eviction(self):
+        pool = SessionPool(max_sessions=2)
+        first = pool.get(None, "a.onion", PROXIES)
+        pool.get(None, "b.onion", PROXIES)
+        pool.get(None, "a.onion", PROXIES)
+        pool.get(None, "c.onion", PROXIES)
+
+        self.assertEqual(len(pool), 2)
+        self.assertIs(pool.get(None, "a.onion", PROXIES), first)
+
+    def test_idle_eviction(self):
+        pool = SessionPool(idle_timeout=0)
+        first = pool.get(None, "a.onion", PROXIES)
+
+        self.assertIsNot(pool.get(None, "a.onion", PROXIES), first)
+        self.assertEqual(len(pool), 1)
+
+    def test_reset(self):
+        pool = SessionPool()
+        pool.get("token", "a.onion", PROXIES)
+        kept = pool.get("other", "a.onion", PROXIES)
+
+        pool.reset("token")
+        self.assertEqual(len(pool), 1)
+        self.assertIs(pool.get("other", "a.onion", PROXIES), kept)
+
+        pool.reset()
+        self.assertEqual(len(pool), 0)
+
+    def test_server_cookies_not_stored(self):
+        session = SessionPool().get(None, "a.onion", PROXIES)
+        self.assertTrue(session.cookies.get_policy().is_not_allowed("a.onion"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import unittest
+from tor_pool import TorPool, MAX_FAILED_RENEWALS
+
+
+class TorPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.pool = TorPool("password", [(9051, "socks5h://127.0.0.1:9050"), (9053, "socks5h://127.0.0.1:9052")],
+                            "python")
+        self.renewed = []
+        for instance in self.pool.instances:
+            instance.handler.renew_connection = lambda port=instance.handler.tor_port: self.renewed.append(port)
+
+    def test_least_loaded_instance(self):
+        first = self.pool.acquire_instance()
+        second = self.pool.acquire_instance()
+        self.assertIsNot(first, second)
+
+        self.pool.release_instance(first, False)
+        self.assertIs(self.pool.acquire_instance(), first)
+
+    def test_send_request_counts(self):
+        for instance in self.pool.instances:
+            instance.handler.send_request = lambda url, cookie=None, headers=None, identity=None, request_type=None: ("page", cookie)
+
+        self.assertEqual(self.pool.send_request("http://a.onion", "c"), ("page", "c"))
+        self.assertEqual(self.pool.n_requests_sent, 1)
+        self.assertEqual(sum(instance.in_flight for instance in self.pool.instances), 0)
+
+    def test_identity_sticks_to_instance(self):
+        instance = self.pool.acquire_instance("cookie")
+        self.pool.release_instance(instance, False)
+
+        # The other instance is less loaded, but the identity keeps its circuit
+        instance.in_flight = 3
+        self.assertIs(self.pool.acquire_instance("cookie"), instance)
+
+        self.pool.rotate_identity("cookie")
+        self.assertIsNot(self.pool.acquire_instance("cookie"), instance)
+
+    def test_rotate_identity_on_every_instance(self):
+        self.pool.release_instance(self.pool.acquire_instance("cookie"), False)
+        old_token = self.pool.identity_instances["cookie"].handler.get_isolation_token("cookie")
+
+        # The identity moves to the other instance while its instance is renewed, then it is rotated
+        moved_from = self.pool.identity_instances["cookie"]
+        moved_from.renewing = True
+        moved_to = self.pool.acquire_instance("cookie")
+        self.assertIsNot(moved_to, moved_from)
+        self.pool.release_instance(moved_to, False)
+        moved_to.handler.get_isolation_token("cookie")
+        self.pool.rotate_identity("cookie")
+
+        # Back on its first instance, the identity does not reuse its old circuits
+        moved_from.renewing = False
+        moved_to.renewing = True
+        self.assertIs(self.pool.acquire_instance("cookie"), moved_from)
+        self.assertNotEqual(moved_from.handler.get_isolation_token("cookie"), old_token)
+
+    def test_unhealthy_instance_avoided(self):
+        unhealthy, healthy = self.pool.instances
+        unhealthy.error_rate = 0.9
+        unhealthy.in_flight = -5
+
+        self.assertIs(self.pool.acquire_instance(), healthy)
+
+    def test_renew_busiest_instance(self):
+        self.pool.instances[1].n_requests = 10
+
+        self.pool.renew_connection()
+        self.assertEqual(self.renewed, [9053])
+        self.assertEqual(self.pool.instances[1].last_renewal, 10)
+        self.assertFalse(self.pool.instances[1].renewing)
+
+    def test_retire_failing_instance(self):
+        instance = self.pool.instances[0]
+        for _ in range(MAX_FAILED_RENEWALS):
+            instance.error_rate = 1.0
+            instance.renewing = True
+            self.pool._TorPool__renew(instance)
+
+        self.assertTrue(instance.retired)
+        self.assertEqual(self.pool.active_instances(), [self.pool.instances[1]])
+
+        # The last active instance is never retired
+        last = self.pool.instances[1]
+        for _ in range(MAX_FAILED_RENEWALS):
+            last.error_rate = 1.0
+            last.renewing = True
+            self.pool._TorPool__renew(last)
+
+        self.assertFalse(last.retired)
+
+
+if __name__ == '__main__':
+    unittest.main()
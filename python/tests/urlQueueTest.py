@@ -0,0 +1,41 @@
+import unittest
+from url_queue import FIFOQueue, PriorityQueue
+from scrapers import CocoricoScraper
+
+
+class URLQueueTest(unittest.TestCase):
+    base_url = "http://example.onion/index.php?route=product/"
+
+    def test_fifo_order(self):
+        queue = FIFOQueue()
+        queue.push("http://example.onion/a", None, 1)
+        queue.push("http://example.onion/b", None, 0)
+
+        self.assertEqual(queue.pop(), ("http://example.onion/a", None))
+        self.assertEqual(len(queue), 1)
+
+    def test_product_pages_first(self):
+        queue = PriorityQueue(CocoricoScraper("drugs", "cannabis"))
+        queue.push(f"{self.base_url}category&path=1_2_3&page=2", None, 1)
+        queue.push(f"{self.base_url}product&path=1_2_3&product_id=7", "cookie", 2)
+
+        self.assertEqual(queue.pop(), (f"{self.base_url}product&path=1_2_3&product_id=7", "cookie"))
+        self.assertEqual(queue.pop()[0], f"{self.base_url}category&path=1_2_3&page=2")
+        self.assertEqual(len(queue), 0)
+
+    def test_observed_yield(self):
+        queue = PriorityQueue(CocoricoScraper("drugs", "cannabis"))
+        listing = f"{self.base_url}category&path=1_2_3"
+        product = f"{self.base_url}product&path=1_2_3&product_id=7"
+
+        # Product pages without images fall behind the listing pages
+        for _ in range(10):
+            queue.observe(product, 0)
+        queue.push(product, None, 1)
+        queue.push(listing, None, 1)
+
+        self.assertEqual(queue.pop()[0], listing)
+
+
+if __name__ == '__main__':
+    unittest.main()
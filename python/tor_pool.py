@@ -0,0 +1,245 @@
+import asyncio
+import logging
+import threading
+
+# Local imports
+from handler import TorHandler
+from identity import IdentityManager
+from deadlines import PAGE
+
+logger = logging.getLogger("CRATOR")
+
+# Weight of the last request in the moving average of the error rate of an instance
+ERROR_SMOOTHING = 0.1
+# Error rate above which an instance is renewed and no longer preferred
+MAX_ERROR_RATE = 0.5
+# Number of renewals not lowering the error rate after which an instance is retired
+MAX_FAILED_RENEWALS = 3
+# Seconds between two checks for a free instance in the asyncio engine
+ASYNC_POLL_INTERVAL = 0.1
+
+
+class TorInstance:
+    """
+    A Tor client of the pool and its load statistics.
+    """
+    def __init__(self, handler:TorHandler):
+        """
+        :param handler: the Tor handler of the SOCKS/control port pair of the instance
+        """
+        self.handler = handler
+        self.in_flight = 0
+        self.error_rate = 0.0
+        self.n_requests = 0
+        # Number of requests at the last renewal
+        self.last_renewal = 0
+        self.failed_renewals = 0
+        self.renewing = False
+        self.retired = False
+
+    def __repr__(self) -> str:
+        return f"TorInstance({self.handler.proxy['http']}, control port {self.handler.tor_port})"
+
+
+class TorPool(TorHandler):
+    """
+    Several Tor clients used as a single TorHandler. Each request is routed to the healthy instance with the fewest
+    requests in flight, so the bandwidth and the circuits of all the instances are used together.
+    An instance is renewed while the others keep serving the requests, and it is retired if it keeps failing.
+    The requests of an identity stick to the same instance, so that they keep their isolated circuit, unless the
+    instance is unavailable or unhealthy.
+    """
+    def __init__(self, tor_password:str, instances:list, venv_path:str, timeouts:dict =None):
+        """
+        :param tor_password: the password required to authenticate with the Tor control ports
+        :param instances: the list of (control port, SOCKS proxy) pairs of the Tor instances, the proxies in the format
+        'socks5h://127.0.0.1:PORT'
+        :param venv_path: the path to the python virtual environment
+        :param timeouts: request type -> RequestTimeout, shared by all the instances. DEFAULT_TIMEOUTS if None.
+        """
+        if not instances:
+            raise ValueError("A Tor pool needs at least one Tor instance.")
+
+        tor_port, proxy = instances[0]
+        super().__init__(tor_password, tor_port, proxy, venv_path, timeouts=timeouts)
+
+        # The header profile of an identity does not change when it moves to another instance
+        self.instances = [TorInstance(TorHandler(tor_password, port, instance_proxy, venv_path, self.identities,
+                                                 self.timeouts))
+                          for port, instance_proxy in instances]
+        # identity -> instance serving its requests
+        self.identity_instances = {}
+        # Guards the statistics of the instances and signals a released instance
+        self.condition = threading.Condition()
+
+    def active_instances(self) -> list:
+        return [instance for instance in self.instances if not instance.retired]
+
+    def __select(self, identity:str =None) -> TorInstance:
+        """
+        Reserve the instance of the identity or, if it is not usable, the least-loaded instance that is not being
+        renewed. It must be called holding the condition.
+        :param identity: the identity of the request, None if the request has no identity
+        :return: the instance, None if all the instances are being renewed
+        """
+        available = [instance for instance in self.instances if not instance.retired and not instance.renewing]
+        if not available:
+            return None
+
+        instance = self.identity_instances.get(identity)
+        if instance not in available or instance.error_rate >= MAX_ERROR_RATE:
+            healthy = [instance for instance in available if instance.error_rate < MAX_ERROR_RATE]
+            instance = min(healthy or available, key=lambda i: (i.in_flight, i.error_rate))
+            if identity is not None:
+                self.identity_instances[identity] = instance
+
+        instance.in_flight += 1
+        return instance
+
+    def acquire_instance(self, identity:str =None) -> TorInstance:
+        """
+        Reserve an instance for a request, waiting if all of them are being renewed.
+        """
+        with self.condition:
+            instance = self.__select(identity)
+            while instance is None:
+                logger.debug("TOR POOL - Waiting for a Tor instance.")
+                self.condition.wait()
+                instance = self.__select(identity)
+
+            return instance
+
+    async def acquire_instance_async(self, identity:str =None) -> TorInstance:
+        """
+        Reserve an instance for a request without blocking the event loop.
+        """
+        while True:
+            with self.condition:
+                instance = self.__select(identity)
+            if instance is not None:
+                return instance
+
+            await asyncio.sleep(ASYNC_POLL_INTERVAL)
+
+    def release_instance(self, instance:TorInstance, failed:bool) -> None:
+        """
+        Release an instance reserved for a request and update its error rate.
+        If the error rate becomes too high, the instance is renewed in background.
+        :param instance: the reserved instance
+        :param failed: True if the request raised a connection error
+        """
+        with self.condition:
+            instance.in_flight -= 1
+            instance.n_requests += 1
+            instance.error_rate = (1 - ERROR_SMOOTHING) * instance.error_rate + ERROR_SMOOTHING * failed
+            if not failed:
+                instance.failed_renewals = 0
+
+            renew = failed and instance.error_rate >= MAX_ERROR_RATE and not instance.renewing
+            if renew:
+                instance.renewing = True
+
+            self.condition.notify_all()
+
+        if renew:
+            logger.warning(f"TOR POOL - Error rate of {instance}: {instance.error_rate:.2f}")
+            threading.Thread(target=self.__renew, args=(instance,), daemon=True).start()
+
+    def send_request(self, url:str, cookie:str =None, headers:dict =None, identity:str =None, request_type:str =PAGE):
+        instance = self.acquire_instance(identity or cookie)
+        failed = True
+        try:
+            result = instance.handler.send_request(url, cookie, headers, identity, request_type)
+            failed = False
+        finally:
+            self.release_instance(instance, failed)
+
+        self.count_request()
+        return result
+
+    async def send_request_async(self, url:str, cookie:str =None, headers:dict =None, identity:str =None,
+                                 request_type:str =PAGE):
+        instance = await self.acquire_instance_async(identity or cookie)
+        failed = True
+        try:
+            result = await instance.handler.send_request_async(url, cookie, headers, identity, request_type)
+            failed = False
+        except asyncio.CancelledError:
+            # A cancelled request says nothing about the health of the instance
+            failed = False
+            raise
+        finally:
+            self.release_instance(instance, failed)
+
+        self.count_request()
+        return result
+
+    def rotate_identity(self, identity:str) -> None:
+        """
+        Give new circuits to an identity. Its next request can go to another instance.
+        The identity may have moved between instances (e.g., during a renewal): its old circuits are dropped on every
+        instance, so that it cannot reuse them when it moves back.
+        """
+        with self.condition:
+            self.identity_instances.pop(identity, None)
+
+        for instance in self.instances:
+            instance.handler.rotate_identity(identity)
+
+    async def close_async_session(self) -> None:
+        for instance in self.instances:
+            await instance.handler.close_async_session()
+
+    def renew_connection(self) -> None:
+        """
+        Renew the instance that sent most requests since its last renewal. The other instances keep serving the
+        requests in the meantime. It does nothing if another renewal is running.
+        """
+        with self.condition:
+            if any(instance.renewing for instance in self.instances):
+                return
+
+            active = self.active_instances()
+            if not active:
+                return
+
+            instance = max(active, key=lambda i: i.n_requests - i.last_renewal)
+            instance.renewing = True
+
+        self.__renew(instance)
+
+    def __renew(self, instance:TorInstance) -> None:
+        """
+        Renew the circuits of an instance already marked as renewing. An instance still failing after
+        MAX_FAILED_RENEWALS renewals is retired, unless it is the last active one.
+        """
+        logger.debug(f"TOR POOL - Renewing {instance}")
+        unhealthy = instance.error_rate >= MAX_ERROR_RATE
+        try:
+            instance.handler.renew_connection()
+        finally:
+            with self.condition:
+                instance.renewing = False
+                instance.last_renewal = instance.n_requests
+
+                if unhealthy:
+                    instance.failed_renewals += 1
+                    if instance.failed_renewals >= MAX_FAILED_RENEWALS and len(self.active_instances()) > 1:
+                        instance.retired = True
+                        print(f"TOR POOL - {instance} retired")
+                        logger.error(f"TOR POOL - {instance} retired after {instance.failed_renewals} renewals")
+                # A renewed instance gets a new chance
+                instance.error_rate = 0.0
+
+                self.condition.notify_all()
+
+    def get_ip(self) -> str:
+        instance = self.acquire_instance()
+        try:
+            return instance.handler.get_ip()
+        finally:
+            self.release_instance(instance, False)
+
+    def stop_tor_process(self) -> None:
+        for instance in self.instances:
+            instance.handler.stop_tor_process()
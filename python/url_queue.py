@@ -0,0 +1,118 @@
+import heapq
+import itertools
+import logging
+from abc import ABC, abstractmethod
+from collections import deque
+
+# Local imports
+from scrapers import Scraper
+
+logger = logging.getLogger("CRATOR")
+
+# Weight of the last observation in the moving average of the image yield
+YIELD_SMOOTHING = 0.2
+
+
+class URLQueue(ABC):
+    """
+    Queue of the URLs waiting to be downloaded. It is not thread-safe: the Downloader guards it with its lock.
+    """
+    @abstractmethod
+    def push(self, url:str, cookie:str, depth:int =0) -> None:
+        """
+        Add a URL to the queue.
+        :param url: the URL to be downloaded
+        :param cookie: the cookie to be used for the request
+        :param depth: the depth of the URL in the crawling graph
+        """
+        pass
+
+    @abstractmethod
+    def pop(self) -> tuple:
+        """
+        Remove the next URL to be downloaded.
+        :return: the tuple (url, cookie)
+        """
+        pass
+
+    @abstractmethod
+    def __len__(self) -> int:
+        pass
+
+    def observe(self, url:str, n_images:int) -> None:
+        """
+        Report the number of images found in a downloaded web page, to adjust the priority of similar URLs.
+        :param url: the URL of the web page
+        :param n_images: the number of images to be downloaded from the web page
+        """
+        pass
+
+
+class FIFOQueue(URLQueue):
+    """
+    The URLs are downloaded in insertion order (breadth-first crawl).
+    """
+    def __init__(self):
+        self.queue = deque()
+
+    def push(self, url:str, cookie:str, depth:int =0) -> None:
+        self.queue.append((url, cookie))
+
+    def pop(self) -> tuple:
+        return self.queue.popleft()
+
+    def __len__(self) -> int:
+        return len(self.queue)
+
+
+class PriorityQueue(URLQueue):
+    """
+    The URLs are grouped in buckets by the URL pattern defined by the scraper (e.g., product pages, listing pages).
+    The next URL comes from the bucket with the highest expected image yield; inside a bucket the URLs are ordered by
+    depth and then by insertion order.
+    The expected yield of a pattern starts from the score of the scraper and follows the moving average of the
+    number of images found in the downloaded pages of the pattern.
+    """
+    def __init__(self, scraper:Scraper):
+        """
+        :param scraper: the scraper of the marketplace being crawled, which defines the URL patterns and scores
+        """
+        self.scraper = scraper
+        # pattern -> heap of (depth, insertion order, url, cookie)
+        self.buckets = {}
+        # pattern -> expected number of images per web page
+        self.expected_yield = {}
+        self.counter = itertools.count()
+        self.length = 0
+
+    def push(self, url:str, cookie:str, depth:int =0) -> None:
+        pattern = self.scraper.url_pattern(url)
+        if pattern not in self.expected_yield:
+            self.expected_yield[pattern] = self.scraper.score_url(url)
+
+        heapq.heappush(self.buckets.setdefault(pattern, []), (depth, next(self.counter), url, cookie))
+        self.length += 1
+
+    def pop(self) -> tuple:
+        if not self.length:
+            raise IndexError("pop from an empty queue")
+
+        # Highest expected yield first, then the shallowest URL
+        pattern = max(self.buckets, key=lambda p: (self.expected_yield[p], -self.buckets[p][0][0]))
+        bucket = self.buckets[pattern]
+
+        _, _, url, cookie = heapq.heappop(bucket)
+        if not bucket:
+            del self.buckets[pattern]
+        self.length -= 1
+
+        return url, cookie
+
+    def observe(self, url:str, n_images:int) -> None:
+        pattern = self.scraper.url_pattern(url)
+        previous = self.expected_yield.get(pattern, self.scraper.score_url(url))
+        self.expected_yield[pattern] = (1 - YIELD_SMOOTHING) * previous + YIELD_SMOOTHING * n_images
+        logger.debug(f"PRIORITY QUEUE - Expected yield of '{pattern}' pages: {self.expected_yield[pattern]:.2f}")
+
+    def __len__(self) -> int:
+        return self.length
@@ -1,10 +1,61 @@
 import yaml
 import os
+import time
+import logging
+import threading
 from pathlib import Path
+from types import MappingProxyType
 from filelock import FileLock
 
 resource_path = Path(__file__).parent.parent.parent.joinpath("resources")
 
+logger = logging.getLogger("CRATOR")
+
+
+# Seconds between two checks of the modification time of the YAML file by the watcher
+WATCH_INTERVAL = 1
+
+
+def freeze(value):
+    """
+    :return: a read-only copy of a value parsed from YAML: the mappings become read-only and the lists become tuples
+    """
+    if isinstance(value, dict):
+        return MappingProxyType({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(freeze(item) for item in value)
+
+    return value
+
+
+class ConfigSnapshot:
+    """
+    Immutable content of the YAML file at a given time. The cookies are indexed by seed, so that the checks made for
+    each URL are dictionary lookups. A snapshot is never modified: a new one replaces it when the file changes, so the
+    threads reading it need no lock.
+    """
+    def __init__(self, data:dict, mtime:float, version:int):
+        """
+        :param data: the content of the YAML file
+        :param mtime: the modification time of the YAML file
+        :param version: the number of the snapshot, increased at each change of the file
+        """
+        self.values = freeze(data or {})
+        self.mtime = mtime
+        self.version = version
+
+        cookies_by_seed = {}
+        for cookie_by_seed in self.values.get('crawler.cookies', None) or ():
+            seed = cookie_by_seed.get('seed')
+            # The first entry of a seed wins, as in the sequential scan of the list
+            if seed and 'cookies' in cookie_by_seed and seed not in cookies_by_seed:
+                cookies_by_seed[seed] = cookie_by_seed.get('cookies')
+
+        # Seeds with an entry in crawler.cookies, even without a cookies field
+        self.seeds = frozenset(cookie_by_seed.get('seed') for cookie_by_seed in
+                               self.values.get('crawler.cookies', None) or ())
+        self.cookies_by_seed = MappingProxyType(cookies_by_seed)
+
 
 class Configuration:
     _instance = None
@@ -15,40 +66,137 @@ class Configuration:
         return cls._instance
 
     def __init__(self, yml_path=None):
-        self.crator_path = yml_path
-        if not self.crator_path:
-            self.crator_path = os.path.join(resource_path, 'crator.yml')
-        
+        path = yml_path
+        if not path:
+            path = os.path.join(resource_path, 'crator.yml')
+
+        # The instance is shared: the YAML file is parsed again only when another file is requested
+        if getattr(self, 'crator_path', None) == path:
+            return
+
+        if not os.path.isfile(path):
+            raise FileNotFoundError(f"Invalid path: '{path}' does not exist.")
+
+        self.crator_path = path
         # A lock to handle the access to the YAML file
         self.lock = FileLock(f"{self.crator_path}.lock")
+        # A lock to install the snapshots in order
+        self.snapshot_lock = threading.Lock()
+
+        self.snapshot = None
+        # Functions called with the instance when a new snapshot of the file is loaded
+        if getattr(self, 'listeners', None) is None:
+            self.listeners = []
+        self.reload()
+
+        if getattr(self, 'watcher', None) is None:
+            self.watcher = threading.Thread(target=self.__watch, daemon=True)
+            self.watcher.start()
+
+    @property
+    def config(self):
+        """
+        :return: the read-only content of the YAML file in the current snapshot
+        """
+        return self.snapshot.values
 
-        if not os.path.isfile(self.crator_path):
-            raise FileNotFoundError(f"Invalid path: '{self.crator_path}' does not exist.")
+    def version(self) -> int:
+        """
+        :return: the version of the current snapshot, increased at each change of the YAML file
+        """
+        return self.snapshot.version
 
-        self.last_checked_time = None
-        self.load_yaml()
+    def add_listener(self, listener) -> None:
+        """
+        :param listener: a function called with the instance when the YAML file changes, e.g. to import its cookies
+        """
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener) -> None:
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
+    def __notify(self) -> None:
+        """
+        Call the listeners of the changes of the YAML file. The error of a listener does not stop the others.
+        """
+        for listener in list(self.listeners):
+            try:
+                listener(self)
+            except Exception as e:
+                logger.error(f"CONFIGURATION - Error notifying a change of {self.crator_path}: {e}")
 
-    def is_updated(self):
-        # Get the modification timestamp of the file
-        file_modified_time = os.path.getmtime(self.crator_path)
+    def __install(self, data:dict, mtime:float) -> None:
+        """
+        Replace the current snapshot. It must be called holding the snapshot lock.
+        """
+        version = self.snapshot.version + 1 if self.snapshot is not None else 1
+        self.snapshot = ConfigSnapshot(data, mtime, version)
 
-        if not self.last_checked_time:
-            self.last_checked_time = file_modified_time
+    def reload(self) -> bool:
+        """
+        Parse the YAML file again if it changed since the current snapshot, and notify the listeners.
+        :return: True if a new snapshot has been installed
+        """
+        if self.__load():
+            self.__notify()
             return True
 
-        # Compare the file's modification time with the last checked time
-        if file_modified_time > self.last_checked_time:
-            print("file yaml modificato!")
-            self.last_checked_time = file_modified_time
+        return False
+
+    def __load(self) -> bool:
+        """
+        :return: True if a new snapshot of the YAML file has been installed
+        """
+        with self.snapshot_lock:
+            path = self.crator_path
+            try:
+                mtime = os.path.getmtime(path)
+            except OSError:
+                return False
+
+            if self.snapshot is not None and mtime == self.snapshot.mtime:
+                return False
+
+            with open(path, 'r') as file:
+                data = yaml.safe_load(file)
+
+            # The file is being written by another process: the next check reads it again
+            if data is None and self.snapshot is not None:
+                return False
+
+            self.__install(data, mtime)
             return True
-        else:
-            return False
 
-    def load_yaml(self):
-        if self.is_updated():
-            print("carico i dati del file yaml")
-            with open(self.crator_path, 'r') as file:
-                self.config = yaml.safe_load(file)
+    def __watch(self) -> None:
+        """
+        Install a new snapshot when the YAML file changes, e.g. when a cookie is added by another process.
+        """
+        while True:
+            time.sleep(WATCH_INTERVAL)
+            try:
+                if self.reload():
+                    logger.info(f"CONFIGURATION - {self.crator_path} changed, version {self.version()} loaded")
+            except Exception as e:
+                logger.error(f"CONFIGURATION - Error loading {self.crator_path}: {e}")
+
+    def __read_file(self) -> dict:
+        """
+        :return: a mutable copy of the YAML file. It must be called holding the file lock.
+        """
+        with open(self.crator_path, 'r') as file:
+            return yaml.safe_load(file) or {}
+
+    def __write_file(self, data:dict) -> None:
+        """
+        Dump the data in the YAML file and install them as the current snapshot. It must be called holding the file
+        lock.
+        """
+        with open(self.crator_path, 'w') as file:
+            yaml.dump(data, file)
+
+        with self.snapshot_lock:
+            self.__install(data, os.path.getmtime(self.crator_path))
 
     def project_name(self):
         if 'project_name' in self.config:
@@ -80,14 +228,113 @@ class Configuration:
     def wait_request(self):
         return self.config['crawler.wait_request']
 
+    def requests_per_second(self):
+        """
+        :return: the maximum number of HTTP requests per second sent to a marketplace. If it is not defined, it is
+        derived from crawler.wait_request.
+        """
+        if 'crawler.requests_per_second' in self.config:
+            return float(self.config['crawler.requests_per_second'])
+
+        return 1000 / int(self.wait_request())
+
+    def random_wait(self):
+        return self.config.get('crawler.random_wait', True)
+
     def depth(self):
         return self.config['crawler.depth']
 
+    def extraction_processes(self):
+        """
+        :return: the number of worker processes used to analyze the web pages. 0 to analyze them in the crawler threads.
+        """
+        return self.config.get('crawler.extraction_processes', 0)
+
+    def engine(self):
+        """
+        :return: the download engine: 'threads' (a thread per request in flight, the default) or 'asyncio'
+        """
+        return self.config.get('crawler.engine', 'threads')
+
+    def max_concurrency(self):
+        """
+        :return: the maximum number of requests in flight with the threads engine
+        """
+        return self.config.get('crawler.max_concurrency', 5)
+
+    def adaptive_concurrency(self):
+        """
+        :return: True to adapt the number of requests in flight to the latency and to the congestion signals of each
+        host and circuit, False to always keep the maximum number of requests in flight
+        """
+        return self.config.get('crawler.adaptive_concurrency', True)
+
+    def hedging(self):
+        """
+        :return: True to duplicate the slowest requests through other circuits
+        """
+        return self.config.get('crawler.hedging', False)
+
+    def hedge_budget(self):
+        """
+        :return: the maximum ratio of duplicate requests to requests
+        """
+        return self.config.get('crawler.hedge_budget', 0.05)
+
+    def request_timeouts(self):
+        """
+        :return: request type (page, image, cookie_validation, ip_check) -> maximum number of seconds of a request, and
+        connect -> maximum number of seconds to open a connection. Empty if not defined, to use the default timeouts.
+        """
+        return dict(self.config.get('crawler.timeouts', None) or {})
+
+    def retry_budget(self):
+        """
+        :return: the number of delayed retries allowed for each new request
+        """
+        return self.config.get('crawler.retry_budget', 0.2)
+
+    def async_concurrency(self):
+        """
+        :return: the maximum number of requests in flight with the asyncio engine
+        """
+        return self.config.get('crawler.async_concurrency', 100)
+
+    def url_queue(self):
+        """
+        :return: the download order of the URLs: 'fifo' (breadth-first, the default) or 'priority' (by expected
+        image yield)
+        """
+        return self.config.get('crawler.frontier', 'fifo')
+
+    def duplicate_distance(self):
+        """
+        :return: the maximum number of different SimHash bits between two near-duplicate pages. A negative value
+        disables the near-duplicate detection.
+        """
+        return self.config.get('crawler.duplicate_distance', 3)
+
+    def bloom_filter(self):
+        """
+        :return: True to keep the links that will not be crawled in a Bloom filter instead of an exact set
+        """
+        return self.config.get('crawler.bloom_filter', False)
+
+    def bloom_filter_error_rate(self):
+        return self.config.get('crawler.bloom_filter_error_rate', 1e-6)
+
     def data_dir(self):
         return self.config['data_directory']
     
     def tor_port(self):
         return self.config['tor_port']
+
+    def tor_instances(self):
+        """
+        :return: the list of (control port, SOCKS proxy) pairs of the Tor instances used together by the crawlers.
+        An empty list to use only the instance of tor_port and http_proxy.
+        """
+        return [(instance['control_port'], instance['proxy']) for instance in self.config.get('tor_instances') or []]
     
     def second_tor_port(self):
         return self.config['second_tor_port']
@@ -103,6 +350,12 @@ class Configuration:
     
     def cookie_attempts(self):
         return self.config["cookie_attempts"]
+
+    def harvest_workers(self):
+        """
+        :return: the maximum number of cookie extractors working at the same time in extract_cookie.py
+        """
+        return self.config.get('harvest_workers', 3)
     
     def venv_path(self):
         return self.config["venv_path"]
@@ -110,45 +363,59 @@ class Configuration:
     def check_cookie(self):
         return self.config["check_cookie"]
 
-    def requires_cookies(self, seed):
+    def cookie_validation_concurrency(self):
         """
-        Check if the YAML file has cookies for the seed website
+        :return: the maximum number of cookies validated at the same time in the background
         """
-        self.load_yaml()
+        return self.config.get('crawler.cookie_validation_concurrency', 4)
 
-        if 'crawler.cookies' not in self.config:
-            return False
+    def cookie_recheck_interval(self):
+        """
+        :return: the seconds after which a valid cookie is validated again in the background
+        """
+        return self.config.get('crawler.cookie_recheck_interval', 600)
 
-        if not seed:
-            return False
+    def proactive_cookie_rotation(self):
+        """
+        :return: True to retire the cookies likely to expire soon, from the lifetime of the expired cookies
+        """
+        return self.config.get('crawler.proactive_cookie_rotation', True)
 
-        for cookie_by_seed in self.config.get('crawler.cookies', []):
-            if cookie_by_seed.get('seed') == seed:
-                return True
+    def cookie_store_path(self):
+        """
+        :return: the path of the SQLite store of the cookies, cookies.db next to the YAML file if not defined
+        """
+        return self.config.get('crawler.cookie_store', None) or \
+            os.path.join(os.path.dirname(os.path.abspath(self.crator_path)), 'cookies.db')
 
-        return False
+    def mirrors(self, seed):
+        """
+        :param seed: the seed URL
+        :return: the URLs of the other onion addresses of the marketplace of the seed, an empty list if not defined
+        """
+        for mirrors_by_seed in self.config.get('crawler.mirrors', None) or []:
+            if mirrors_by_seed.get('seed') == seed:
+                return list(mirrors_by_seed.get('mirrors') or [])
 
-    def has_cookies(self, seed):
-        self.load_yaml()
+        return []
 
-        if 'crawler.cookies' not in self.config:
-            print("non c'e' il campo crawler.cookies nel yaml file")
+    def requires_cookies(self, seed):
+        """
+        Check if the YAML file has cookies for the seed website
+        """
+        if not seed:
             return False
 
+        return seed in self.snapshot.seeds
+
+    def has_cookies(self, seed):
+        """
+        :return: True if the YAML file has a cookies field for the seed website
+        """
         if not seed:
-            print("seed non fornito")
             return False
-        #     return 'crawler.cookies' in self.config
-
-        for cookie_by_seed in self.config.get('crawler.cookies', []):
-            # Cosa fa il 2 controllo?
-            # print("controllo non compreso in has_cookies:")
-            if cookie_by_seed.get('seed') == seed and 'cookies' in cookie_by_seed:
-                print("trovato cookie per il seed")
-                return True
 
-        print("non c'e' un cookie per il seed")
-        return False
+        return seed in self.snapshot.cookies_by_seed
 
     def cookies(self, seed):
         """
@@ -156,34 +423,12 @@ class Configuration:
         :param seed: the base URL from which the crawler starts.
         :return: the cookie list of the given seed, None otherwise.
         """
-        #self.load_yaml() gia' c'era questa riga
-        #print("Valore di has_cookies: ")
-        #print(self.has_cookies())
-   
-        flag_has_cookie = False
-        self.load_yaml()
-
-        if 'crawler.cookies' not in self.config:
-            print("There is no crawler.cookies field in the YAML file")
-            flag_has_cookie = False
-
         if not seed:
-            print("No seed provided")
-            flag_has_cookie = False
-
-        for cookie_by_seed in self.config.get('crawler.cookies', []):
-            if cookie_by_seed.get('seed') == seed and 'cookies' in cookie_by_seed:
-                flag_has_cookie = True
-                break
-
-        if not seed or not flag_has_cookie:#self.has_cookies():
             return None
 
-        for cookie_by_seed in self.config.get('crawler.cookies', []):
-            if cookie_by_seed.get('seed') == seed and 'cookies' in cookie_by_seed:
-                return cookie_by_seed.get('cookies')
-
-        return None
+        cookies = self.snapshot.cookies_by_seed.get(seed)
+        # A new list, which the caller can modify
+        return list(cookies) if cookies is not None else None
 
     def remove_cookie(self, seed: str, cookie: str):
         """
@@ -193,12 +438,11 @@ class Configuration:
         :param cookie: a cookie of the seed to be removed
         """
         with self.lock:
-            self.load_yaml()
-
-            cookies = self.config.get('crawler.cookies', [])
+            data = self.__read_file()
+            cookies = data.get('crawler.cookies', []) or []
 
             # Find the selected seed in the cookies list
-            for i, seed_data in enumerate(cookies):
+            for seed_data in cookies:
                 if seed_data.get('seed') == seed and 'cookies' in seed_data and isinstance(seed_data['cookies'], list):
                     seed_cookies = seed_data['cookies']
 
@@ -207,11 +451,10 @@ class Configuration:
                         seed_cookies.remove(cookie)
 
             # Update the modified cookies list in the configuration
-            self.config['crawler.cookies'] = cookies
+            data['crawler.cookies'] = cookies
 
             # Dump modified data back to YAML
-            with open(self.crator_path, 'w') as file:
-                yaml.dump(self.config, file)
+            self.__write_file(data)
 
     def add_cookie(self, seed: str, cookie: str):
         """
@@ -221,12 +464,8 @@ class Configuration:
         :param cookie: a new cookie to be store in the YAML file for the given seed
         """
         with self.lock:
-            self.load_yaml()
-
-            if 'crawler.cookies' not in self.config:
-                self.config['crawler.cookies'] = []
-
-            cookies = self.config.get('crawler.cookies', [])
+            data = self.__read_file()
+            cookies = data.get('crawler.cookies', []) or []
 
             # Find the selected seed in the cookies list
             i = 0
@@ -240,17 +479,11 @@ class Configuration:
             if not fetched:
                 cookies.append({'seed': seed, 'cookies': [cookie]})
 
-            # for i, seed_data in enumerate(cookies):
-            #     if seed_data.get('seed') == seed and 'cookies' in seed_data and isinstance(seed_data['cookies'], list):
-            #         seed_data['cookies'].append(cookie)
-            #         break
-
             # Update the modified cookies list in the configuration
-            self.config['crawler.cookies'] = cookies
+            data['crawler.cookies'] = cookies
 
             # Dump modified data back to YAML
-            with open(self.crator_path, 'w') as file:
-                yaml.dump(self.config, file)
+            self.__write_file(data)
 
     def remove_seed(self, seed: str):
         """
@@ -259,16 +492,30 @@ class Configuration:
         :param seed: the seed URL to be removed
         """
         with self.lock:
-            self.load_yaml()
-
-            cookies = self.config.get('crawler.cookies', [])
+            data = self.__read_file()
+            cookies = data.get('crawler.cookies', []) or []
 
             # Remove the seed and update the modified cookies list in the configuration
-            self.config['crawler.cookies'] = [cookie for cookie in cookies if cookie.get('seed') != seed]
+            data['crawler.cookies'] = [cookie for cookie in cookies if cookie.get('seed') != seed]
+
+            if not data['crawler.cookies']:
+                del data['crawler.cookies']
+
+            # Dump modified data back to YAML
+            self.__write_file(data)
+
+    def set_cookies(self, cookies_by_seed: dict):
+        """
+        Replace the cookies in the YAML file, e.g. to export the cookie store.
+
+        :param cookies_by_seed: seed URL -> list of cookies
+        """
+        with self.lock:
+            data = self.__read_file()
 
-            if not self.config['crawler.cookies']:
-                del self.config['crawler.cookies']
+            data['crawler.cookies'] = [{'seed': seed, 'cookies': list(cookies)} for seed, cookies in cookies_by_seed.items()]
+            if not data['crawler.cookies']:
+                del data['crawler.cookies']
 
             # Dump modified data back to YAML
-            with open(self.crator_path, 'w') as file:
-                yaml.dump(self.config, file)
+            self.__write_file(data)
@@ -0,0 +1,21 @@
+import unittest
+from utils.urls import canonicalize_url, url_fingerprint
+
+
+class TestUrls(unittest.TestCase):
+
+    def test_canonicalize_url(self):
+        url = "HTTP://Example.onion/index.php/?route=product/product&amp;path=1_2_3&product_id=42#reviews"
+        expected = "http://example.onion/index.php?path=1_2_3&product_id=42&route=product/product"
+        self.assertEqual(canonicalize_url(url), expected)
+
+    def test_canonicalize_url_without_query(self):
+        self.assertEqual(canonicalize_url("http://example.onion/category/drugs/"), "http://example.onion/category/drugs")
+
+    def test_url_fingerprint(self):
+        self.assertEqual(url_fingerprint("http://example.onion/a?y=2&x=1"), url_fingerprint("http://example.onion/a/?x=1&y=2"))
+        self.assertNotEqual(url_fingerprint("http://example.onion/a"), url_fingerprint("http://example.onion/b"))
+
+
+if __name__ == '__main__':
+    unittest.main()
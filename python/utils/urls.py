@@ -0,0 +1,34 @@
+import hashlib
+from urllib.parse import urlsplit, urlunsplit
+
+
+def canonicalize_url(url:str) -> str:
+    """
+    Return the canonical form of a URL, so that the different spellings of the same page are crawled only once:
+    HTML-escaped ampersands are decoded, the scheme and the host are lowercased, the query parameters are sorted and
+    the fragment and the trailing slashes are removed.
+    :param url: the URL to be canonicalized
+    :return: the canonical URL
+    """
+    url = url.strip().replace("&amp;", "&")
+    parts = urlsplit(url)
+
+    path = parts.path.rstrip("/")
+
+    # Keep the parameters as they are encoded in the page, only their order changes
+    params = [param for param in parts.query.split("&") if param]
+    params.sort(key=lambda param: param.partition("="))
+    query = "&".join(params)
+
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path, query, ""))
+
+
+def url_fingerprint(url:str) -> int:
+    """
+    Return the 64-bit fingerprint of the canonical form of a URL.
+    :param url: the URL
+    :return: a positive 64-bit integer, never 0
+    """
+    digest = hashlib.blake2b(canonicalize_url(url).encode("utf-8"), digest_size=8).digest()
+    # 0 marks the empty slots of the fingerprint tables
+    return int.from_bytes(digest, "little") or 1